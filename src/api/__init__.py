@@ -1,8 +1,12 @@
 from flask import Flask
 from .routes import api
+from ..core.config import PRELOAD_MODELS
+from ..vector_db.model_registry import model_registry
+from ..document_processing.tabular import install_json_default
 
 def create_app(config=None):
     app = Flask(__name__)
+    install_json_default(app)
     
     # Load configuration
     if config:
@@ -10,5 +14,10 @@ def create_app(config=None):
     
     # Register blueprints
     app.register_blueprint(api, url_prefix='/api')
+
+    # Load the embedding model now; with gunicorn --preload this runs once
+    # in the master and forked workers share the weights
+    if app.config.get('PRELOAD_MODELS', PRELOAD_MODELS):
+        model_registry.warm_up(freeze=True)
     
     return app
\ No newline at end of file
@@ -1,8 +1,14 @@
 from typing import Dict, Any, Optional
+from ..core.config import VECTOR_STORE_PATH
 from ..core.logger import log_info, log_error
+from ..core.concurrency import KeyedLocks
 from ..document_processing.document_parser import DocumentParser
 from ..knowledge_graph.graph_builder import GraphBuilder
+from ..knowledge_graph.centrality import PageRankCache
 from ..vector_db.vectorizer import Vectorizer
+from ..vector_db.retriever import Retriever
+from ..vector_db.bm25 import BM25Index
+from ..vector_db.filters import FilterSpec
 from ..llm.mistral_client import MistralClient
 import os
 
@@ -10,52 +16,153 @@ class APIHandler:
     def __init__(self):
         self.document_parser = DocumentParser()
         self.graph_builder = GraphBuilder()
-        self.vectorizer = Vectorizer()
+        self.lexical_index = BM25Index()
+        self.graph_builder.add_listener(self.lexical_index)
+        self.context_ranker = PageRankCache(self.graph_builder)
+        self.graph_builder.add_listener(self.context_ranker)
+        self.vectorizer = Vectorizer(store_path=VECTOR_STORE_PATH)
+        self.retriever = Retriever(self.vectorizer, lexical_index=self.lexical_index)
         self.mistral_client = MistralClient()
+        self.upload_locks = KeyedLocks()
+        self.document_locks = KeyedLocks()
 
-    def process_document(self, file_path: str) -> Optional[Dict[str, Any]]:
-        """Process a document and update all necessary components."""
+    def process_document(self, file_path: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Process a document and update all necessary components.
+
+        A file whose content hash is already in the graph is not processed
+        again unless ``force`` is set; its existing document id is returned.
+        """
         try:
-            # Parse document
-            parsed_data = self.document_parser.extract_data(file_path)
-            if not parsed_data:
-                log_error(f"Failed to parse document: {file_path}")
-                return None
-
-            # Add to knowledge graph
-            doc_id = self.graph_builder.add_document(parsed_data)
-            if not doc_id:
-                log_error("Failed to add document to knowledge graph")
-                return None
-
-            # Update vector database
-            if not self.vectorizer.convert_to_vector(self.graph_builder.get_graph()):
-                log_error("Failed to update vector database")
-                return None
+            content_hash = self.document_parser.hash_file(file_path)
+            with self.upload_locks.hold(content_hash):
+                doc_id = None if force else self.graph_builder.find_document(content_hash)
+                if doc_id:
+                    log_info(f"Skipping already processed document {file_path} ({doc_id})")
+                    return {
+                        'document_id': doc_id,
+                        'duplicate': True
+                    }
+
+                # Parse document
+                parsed_data = self.document_parser.extract_data(file_path)
+                if not parsed_data:
+                    log_error(f"Failed to parse document: {file_path}")
+                    return None
+                parsed_data['metadata']['content_hash'] = content_hash
+
+                # Add to knowledge graph
+                doc_id = self.graph_builder.add_document(parsed_data)
+                if not doc_id:
+                    log_error("Failed to add document to knowledge graph")
+                    return None
+
+                # Update vector database with the new document's nodes only
+                node_ids = self.graph_builder.get_document_nodes(doc_id)
+                if not self.vectorizer.vectorize_nodes(self.graph_builder.get_graph(), node_ids) or not self.vectorizer.flush():
+                    log_error("Failed to update vector database")
+                    # Roll back so a retry processes the file again instead of reporting a duplicate
+                    self.graph_builder.remove_document(doc_id)
+                    self.vectorizer.remove_nodes(node_ids)
+                    return None
+                self.graph_builder.register_document(doc_id)
 
             return {
                 'document_id': doc_id,
-                'parsed_data': parsed_data
+                'parsed_data': parsed_data,
+                'duplicate': False
             }
 
         except Exception as e:
             log_error(f"Error in process_document: {str(e)}")
             return None
 
-    def query_knowledge_base(self, query: str, max_results: int = 5) -> Optional[Dict[str, Any]]:
+    def update_document(self, doc_id: str, file_path: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Replace a document with the content of a new file, keeping its id.
+
+        Only nodes whose content changed are re-embedded; nodes the new
+        version no longer has are removed. The file is not parsed if its
+        content hash is the document's current one, unless ``force`` is set.
+        """
+        try:
+            content_hash = self.document_parser.hash_file(file_path)
+            with self.document_locks.hold(doc_id):
+                if not self.graph_builder.is_document(doc_id):
+                    log_error(f"Document not found: {doc_id}")
+                    return None
+                if not force and self.graph_builder.find_document(content_hash) == doc_id:
+                    return {
+                        'document_id': doc_id,
+                        'unchanged': True
+                    }
+
+                parsed_data = self.document_parser.extract_data(file_path)
+                if not parsed_data:
+                    log_error(f"Failed to parse document: {file_path}")
+                    return None
+                parsed_data['metadata']['content_hash'] = content_hash
+
+                old_ids = self.graph_builder.get_document_nodes(doc_id)
+                if not self.graph_builder.update_document(doc_id, parsed_data):
+                    log_error("Failed to update document in knowledge graph")
+                    return None
+
+                node_ids = list(dict.fromkeys(old_ids + self.graph_builder.get_document_nodes(doc_id)))
+                if not self.vectorizer.vectorize_nodes(self.graph_builder.get_graph(), node_ids) or not self.vectorizer.flush():
+                    log_error("Failed to update vector database")
+                    return None
+                self.graph_builder.register_document(doc_id)
+
+            self.vectorizer.maybe_compact()
+            self.lexical_index.maybe_compact()
+            self.graph_builder.maybe_compact()
+            return {
+                'document_id': doc_id,
+                'parsed_data': parsed_data,
+                'unchanged': False
+            }
+
+        except Exception as e:
+            log_error(f"Error in update_document: {str(e)}")
+            return None
+
+    def delete_document(self, doc_id: str) -> bool:
+        """Remove a document's nodes, edges and vectors; False if it is unknown."""
+        try:
+            with self.document_locks.hold(doc_id):
+                node_ids = self.graph_builder.get_document_nodes(doc_id)
+                if not self.graph_builder.remove_document(doc_id):
+                    return False
+                self.vectorizer.remove_nodes(node_ids)
+                if not self.vectorizer.flush():
+                    log_error("Failed to update vector database")
+                    return False
+            self.vectorizer.maybe_compact()
+            self.lexical_index.maybe_compact()
+            self.graph_builder.maybe_compact()
+            return True
+
+        except Exception as e:
+            log_error(f"Error in delete_document: {str(e)}")
+            return False
+
+    def query_knowledge_base(self, query: str, max_results: int = 5, filters: Optional[FilterSpec] = None,
+                             mode: str = 'vector') -> Optional[Dict[str, Any]]:
         """Query the knowledge base and get relevant information."""
         try:
             # Get similar nodes
-            similar_nodes = self.vectorizer.get_similar_nodes(query, max_results)
+            similar_nodes = self.retriever.get_similar_nodes(query, max_results, filters, mode)
             
-            # Get context from similar nodes
+            # Get context from similar nodes, each with its most central graph neighbours
+            nodes = self.graph_builder.get_graph()['nodes']
+            neighbors = self.context_ranker.expand([node_id for node_id, _ in similar_nodes])
             context = []
             for node_id, score in similar_nodes:
-                node_info = self.graph_builder.get_graph()['nodes'].get(node_id, {})
+                node_info = nodes.get(node_id, {})
                 context.append({
                     'node_id': node_id,
                     'similarity': score,
-                    'info': node_info
+                    'info': node_info,
+                    'neighbors': neighbors[node_id]
                 })
 
             # Generate response using LLM
@@ -75,7 +182,7 @@ class APIHandler:
     def get_graph_state(self) -> Optional[Dict[str, Any]]:
         """Get the current state of the knowledge graph."""
         try:
-            return self.graph_builder.get_graph()
+            return self.graph_builder.export_graph()
         except Exception as e:
             log_error(f"Error in get_graph_state: {str(e)}")
             return None
\ No newline at end of file
@@ -1,16 +1,46 @@
-from flask import Blueprint, request, jsonify
-from ..core.config import ALLOWED_EXTENSIONS
+from flask import Blueprint, Response, request, jsonify
+from ..core.config import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, VECTOR_STORE_PATH, GRAPH_STORE_PATH, QUERY_BATCH_MAX, \
+    CONTEXT_HOPS, CONTEXT_NEIGHBORS, GRAPH_MAX_HOPS
 from ..document_processing.document_parser import DocumentParser
 from ..knowledge_graph.graph_builder import GraphBuilder
+from ..knowledge_graph.graph_store import GraphStore
+from ..knowledge_graph.rdf_converter import RDFConverter
+from ..knowledge_graph.centrality import PageRankCache
 from ..vector_db.vectorizer import Vectorizer
+from ..vector_db.retriever import Retriever, SEARCH_MODES
+from ..vector_db.bm25 import BM25Index
+from ..vector_db.filters import parse_filters, parse_count
 from ..llm.mistral_client import MistralClient
 from ..core.logger import log_info, log_error
+from ..core.concurrency import KeyedLocks
+from typing import Optional
+import atexit
+import json
 import os
 
 api = Blueprint('api', __name__)
 document_parser = DocumentParser()
 graph_builder = GraphBuilder()
-vectorizer = Vectorizer()
+lexical_index = BM25Index()
+graph_builder.add_listener(lexical_index)
+context_ranker = PageRankCache(graph_builder)
+graph_builder.add_listener(context_ranker)
+graph_store = GraphStore(GRAPH_STORE_PATH)
+graph_store.attach(graph_builder)
+vectorizer = Vectorizer(store_path=VECTOR_STORE_PATH)
+atexit.register(vectorizer.close)
+retriever = Retriever(vectorizer, lexical_index=lexical_index)
+atexit.register(retriever.close)
+upload_locks = KeyedLocks()  # Per content hash, so identical concurrent uploads are processed once
+document_locks = KeyedLocks()  # Per document id, so updates and deletes of one document do not interleave
+
+def remove_unused_upload(content_hash: str, file_path: Optional[str]):
+    """Delete a stored upload unless a registered document was built from the same content.
+
+    The caller holds the content hash's upload lock.
+    """
+    if graph_builder.find_document(content_hash) is None:
+        document_parser.remove_upload(file_path)
 
 @api.route('/health', methods=['GET'])
 def health_check():
@@ -31,48 +61,189 @@ def upload_document():
         if not document_parser.validate_file(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
 
-        # Process the document
-        result = document_parser.extract_data(file)
-        if not result:
-            return jsonify({'error': 'Failed to process document'}), 500
+        # Store the file under its content hash; known content skips parsing and embedding
+        force = request.values.get('force', '').lower() in ('1', 'true', 'yes')
+        received = document_parser.receive_upload(file, UPLOAD_FOLDER)
+        if not received:
+            return jsonify({'error': 'Failed to save document'}), 500
+        tmp_path, content_hash = received
+
+        with upload_locks.hold(content_hash):
+            file_path = document_parser.store_upload(tmp_path, content_hash, file.filename, UPLOAD_FOLDER)
+            doc_id = None if force else graph_builder.find_document(content_hash)
+            if doc_id:
+                log_info(f"Skipping already processed upload {file.filename} ({doc_id})")
+                return jsonify({
+                    'message': 'Document already processed',
+                    'document_id': doc_id,
+                    'duplicate': True
+                }), 200
+
+            # Process the document
+            result = document_parser.extract_data(file_path)
+            if not result:
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to process document'}), 500
+            result['metadata'].update({'content_hash': content_hash, 'file_name': file.filename})
 
-        # Update knowledge graph
-        doc_id = graph_builder.add_document(result)
-        if not doc_id:
-            return jsonify({'error': 'Failed to add to knowledge graph'}), 500
+            # Update knowledge graph
+            doc_id = graph_builder.add_document(result)
+            if not doc_id:
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to add to knowledge graph'}), 500
 
-        # Update vector database
-        if not vectorizer.convert_to_vector(graph_builder.get_graph()):
-            return jsonify({'error': 'Failed to update vector database'}), 500
+            # Update vector database with the new document's nodes only
+            node_ids = graph_builder.get_document_nodes(doc_id)
+            if not vectorizer.vectorize_nodes(graph_builder.get_graph(), node_ids) or not vectorizer.flush():
+                # Roll back so a retry processes the file again instead of reporting a duplicate
+                graph_builder.remove_document(doc_id)
+                vectorizer.remove_nodes(node_ids)
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to update vector database'}), 500
+            graph_builder.register_document(doc_id)
 
         return jsonify({
             'message': 'Document processed successfully',
-            'document_id': doc_id
+            'document_id': doc_id,
+            'duplicate': False
         }), 201
 
     except Exception as e:
         log_error(f"Error in upload_document: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/documents/<doc_id>', methods=['PUT'])
+def update_document(doc_id):
+    """Replace a document with a new file, keeping its id; unchanged nodes are not re-embedded."""
+    try:
+        if not graph_builder.is_document(doc_id):
+            return jsonify({'error': 'Document not found'}), 404
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+
+        if not document_parser.validate_file(file.filename):
+            return jsonify({'error': 'File type not allowed'}), 400
+
+        force = request.values.get('force', '').lower() in ('1', 'true', 'yes')
+        received = document_parser.receive_upload(file, UPLOAD_FOLDER)
+        if not received:
+            return jsonify({'error': 'Failed to save document'}), 500
+        tmp_path, content_hash = received
+
+        with document_locks.hold(doc_id), upload_locks.hold(content_hash):
+            file_path = document_parser.store_upload(tmp_path, content_hash, file.filename, UPLOAD_FOLDER)
+            if not graph_builder.is_document(doc_id):
+                return jsonify({'error': 'Document not found'}), 404
+            if not force and graph_builder.find_document(content_hash) == doc_id:
+                return jsonify({
+                    'message': 'Document unchanged',
+                    'document_id': doc_id,
+                    'unchanged': True
+                }), 200
+
+            result = document_parser.extract_data(file_path)
+            if not result:
+                return jsonify({'error': 'Failed to process document'}), 500
+            result['metadata'].update({'content_hash': content_hash, 'file_name': file.filename})
+
+            old_ids = graph_builder.get_document_nodes(doc_id)
+            old_hash = graph_builder.graph.attribute(doc_id, 'content_hash')
+            old_path = graph_builder.graph.attribute(doc_id, 'file_path')
+            if not graph_builder.update_document(doc_id, result):
+                return jsonify({'error': 'Failed to update knowledge graph'}), 500
+
+            # Old ids that are gone are tombstoned; nodes with unchanged content keep their vectors
+            node_ids = list(dict.fromkeys(old_ids + graph_builder.get_document_nodes(doc_id)))
+            if not vectorizer.vectorize_nodes(graph_builder.get_graph(), node_ids) or not vectorizer.flush():
+                return jsonify({'error': 'Failed to update vector database'}), 500
+            graph_builder.register_document(doc_id)
+
+        if old_hash and old_hash != content_hash:
+            with upload_locks.hold(old_hash):
+                remove_unused_upload(old_hash, old_path)
+        vectorizer.maybe_compact()
+        lexical_index.maybe_compact()
+        graph_builder.maybe_compact()
+        return jsonify({
+            'message': 'Document updated successfully',
+            'document_id': doc_id,
+            'unchanged': False
+        }), 200
+
+    except Exception as e:
+        log_error(f"Error in update_document: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/documents/<doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    """Delete a document with its table, sheet and chunk nodes, their edges and vectors."""
+    try:
+        with document_locks.hold(doc_id):
+            if not graph_builder.is_document(doc_id):
+                return jsonify({'error': 'Document not found'}), 404
+            node_ids = graph_builder.get_document_nodes(doc_id)
+            content_hash = graph_builder.graph.attribute(doc_id, 'content_hash')
+            file_path = graph_builder.graph.attribute(doc_id, 'file_path')
+            if not graph_builder.remove_document(doc_id):
+                return jsonify({'error': 'Failed to remove from knowledge graph'}), 500
+            vectorizer.remove_nodes(node_ids)
+            if not vectorizer.flush():
+                return jsonify({'error': 'Failed to update vector database'}), 500
+
+        if content_hash:
+            with upload_locks.hold(content_hash):
+                remove_unused_upload(content_hash, file_path)
+        # Space held by tombstoned rows, retired BM25 documents and removed nodes is reclaimed in the background
+        vectorizer.maybe_compact()
+        lexical_index.maybe_compact()
+        graph_builder.maybe_compact()
+        return jsonify({
+            'message': 'Document deleted successfully',
+            'document_id': doc_id,
+            'removed_nodes': len(node_ids)
+        }), 200
+
+    except Exception as e:
+        log_error(f"Error in delete_document: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @api.route('/query', methods=['POST'])
 def query_knowledge():
-    """Query the knowledge graph."""
+    """Query the knowledge graph, optionally filtered by node type, file type or document."""
     try:
         data = request.get_json()
         if not data or 'query' not in data:
             return jsonify({'error': 'No query provided'}), 400
+        try:
+            filters = parse_filters(data.get('filters'))
+            top_k = parse_count(data.get('top_k'), 'top_k', 5, minimum=1)
+            context_hops = min(parse_count(data.get('context_hops'), 'context_hops', CONTEXT_HOPS), GRAPH_MAX_HOPS)
+            context_neighbors = parse_count(data.get('context_neighbors'), 'context_neighbors', CONTEXT_NEIGHBORS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        mode = data.get('mode', 'vector')
+        if mode not in SEARCH_MODES:
+            return jsonify({'error': f'mode must be one of {", ".join(SEARCH_MODES)}'}), 400
 
-        # Get similar nodes from vector database
-        similar_nodes = vectorizer.get_similar_nodes(data['query'])
+        # Get similar nodes from the vector database, fused with BM25 in the lexical modes
+        similar_nodes = retriever.get_similar_nodes(data['query'], top_k, filters, mode)
         
-        # Get context from similar nodes
+        # Get context from similar nodes, each with its most central graph neighbours
+        nodes = graph_builder.get_graph()['nodes']
+        neighbors = context_ranker.expand([node_id for node_id, _ in similar_nodes],
+                                          context_hops, context_neighbors)
         context = []
         for node_id, score in similar_nodes:
-            node_info = graph_builder.get_graph()['nodes'].get(node_id, {})
+            node_info = nodes.get(node_id, {})
             context.append({
                 'node_id': node_id,
                 'similarity': score,
-                'info': node_info
+                'info': node_info,
+                'neighbors': neighbors[node_id]
             })
 
         return jsonify({
@@ -83,11 +254,105 @@ def query_knowledge():
         log_error(f"Error in query_knowledge: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/query/batch', methods=['POST'])
+def query_batch():
+    """Retrieve similar nodes for many queries, streamed back as NDJSON lines."""
+    try:
+        data = request.get_json()
+        queries = data.get('queries') if data else None
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'No queries provided'}), 400
+        if len(queries) > QUERY_BATCH_MAX:
+            return jsonify({'error': f'At most {QUERY_BATCH_MAX} queries per batch'}), 400
+        if not all(isinstance(query, str) for query in queries):
+            return jsonify({'error': 'Queries must be strings'}), 400
+        try:
+            filters = parse_filters(data.get('filters'))
+            top_k = parse_count(data.get('top_k'), 'top_k', 5, minimum=1)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        results = retriever.get_similar_nodes_batch(queries, top_k, filters)
+
+        def generate():
+            i = 0
+            try:
+                for similar_nodes in results:
+                    yield json.dumps({
+                        'index': i,
+                        'results': [{'node_id': node_id, 'similarity': score} for node_id, score in similar_nodes]
+                    }) + '\n'
+                    i += 1
+            except Exception as e:
+                # Headers are already sent, so the failure is reported as the stream's last line
+                yield json.dumps({'index': i, 'error': str(e)}) + '\n'
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    except Exception as e:
+        log_error(f"Error in query_batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @api.route('/graph', methods=['GET'])
 def get_graph():
     """Get the current state of the knowledge graph."""
     try:
-        return jsonify(graph_builder.get_graph()), 200
+        return jsonify(graph_builder.export_graph()), 200
     except Exception as e:
         log_error(f"Error in get_graph: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/graph/rdf', methods=['GET'])
+def export_rdf():
+    """Stream the graph as N-Triples, optionally only what changed since a checkpoint."""
+    try:
+        since = request.args.get('since', type=int)
+        checkpoint = graph_builder.checkpoint()
+        triples = RDFConverter(graph_builder).iter_triples(since)
+        return Response(triples, mimetype='application/n-triples',
+                        headers={'X-Graph-Checkpoint': str(checkpoint)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_error(f"Error in export_rdf: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/graph/rdf/removed', methods=['GET'])
+def export_rdf_removed():
+    """Subjects removed since a checkpoint, whose triples an incremental consumer must drop."""
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': 'since must be a checkpoint'}), 400
+        checkpoint = graph_builder.checkpoint()
+        return jsonify({
+            'checkpoint': checkpoint,
+            'removed': RDFConverter(graph_builder).removed_subjects(since)
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_error(f"Error in export_rdf_removed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/graph/nodes/<node_id>/neighbors', methods=['GET'])
+def get_node_neighbors(node_id):
+    """Neighbourhood of a node, read from the adjacency indexes."""
+    try:
+        if node_id not in graph_builder.get_graph()['nodes']:
+            return jsonify({'error': 'Node not found'}), 404
+        direction = request.args.get('direction', 'out')
+        edge_type = request.args.get('edge_type')
+        try:
+            hops = min(parse_count(request.args.get('hops'), 'hops', 1, minimum=1), GRAPH_MAX_HOPS)
+            neighbors = graph_builder.k_hop(node_id, hops, direction, edge_type)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'node_id': node_id,
+            'degree': graph_builder.degree(node_id, direction, edge_type),
+            'neighbors': [{'node_id': neighbor, 'hops': distance} for neighbor, distance in neighbors.items()]
+        }), 200
+    except Exception as e:
+        log_error(f"Error in get_node_neighbors: {str(e)}")
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
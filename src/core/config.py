@@ -14,9 +14,79 @@ UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads/")
 ALLOWED_EXTENSIONS = {'pdf', 'xlsx', 'csv', 'docx', 'jpg', 'jpeg', 'png'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB limit for uploads
 
+# Chunking Configuration (whitespace tokens per embedded chunk)
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', 128))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 16))
+
+# Columnar CSV/Excel payloads: tables with at least this many rows are spilled to disk and memory-mapped
+TABULAR_SPILL_PATH = os.getenv('TABULAR_SPILL_PATH', os.path.join(os.getcwd(), "tabular_store/"))
+TABULAR_SPILL_ROWS = int(os.getenv('TABULAR_SPILL_ROWS', 100000))  # 0 keeps every table in memory
+
+# Graph persistence: write-ahead log fsync policy (always, interval or never) and snapshot cadence
+GRAPH_STORE_PATH = os.getenv('GRAPH_STORE_PATH', os.path.join(os.getcwd(), "graph_store/"))
+GRAPH_FSYNC = os.getenv('GRAPH_FSYNC', 'interval')
+GRAPH_FSYNC_INTERVAL = float(os.getenv('GRAPH_FSYNC_INTERVAL', 1.0))  # Seconds between fsyncs
+GRAPH_SNAPSHOT_RECORDS = int(os.getenv('GRAPH_SNAPSHOT_RECORDS', 50000))  # Log records between snapshots
+
+# Background compaction rebuilds the graph without removed nodes and edges once they pass this share of slots
+GRAPH_COMPACTION_RATIO = float(os.getenv('GRAPH_COMPACTION_RATIO', 0.3))
+GRAPH_COMPACTION_MIN_NODES = int(os.getenv('GRAPH_COMPACTION_MIN_NODES', 1024))  # Smaller graphs are left alone
+
+# Graph-aware context: neighbours added per query hit, ranked by cached PageRank
+CONTEXT_HOPS = int(os.getenv('CONTEXT_HOPS', 1))  # 0 disables expansion
+GRAPH_MAX_HOPS = int(os.getenv('GRAPH_MAX_HOPS', 3))  # Cap on hops and context_hops requested per call
+CONTEXT_NEIGHBORS = int(os.getenv('CONTEXT_NEIGHBORS', 3))
+CONTEXT_EXCERPT_CHARS = int(os.getenv('CONTEXT_EXCERPT_CHARS', 200))  # text kept per neighbour
+PAGERANK_DAMPING = float(os.getenv('PAGERANK_DAMPING', 0.85))
+PAGERANK_TOLERANCE = float(os.getenv('PAGERANK_TOLERANCE', 1e-6))
+
+# Bulk RDF import: triples per update_graph batch, N-Triples chunk size and parser processes
+RDF_IMPORT_BATCH_TRIPLES = int(os.getenv('RDF_IMPORT_BATCH_TRIPLES', 100000))
+RDF_IMPORT_CHUNK_BYTES = int(os.getenv('RDF_IMPORT_CHUNK_BYTES', 16 * 1024 * 1024))
+RDF_IMPORT_PROCESSES = int(os.getenv('RDF_IMPORT_PROCESSES', 1))
+
 # Vector DB Configuration
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'false').lower() in ('1', 'true', 'yes')  # Load at startup
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # torch, int8 or onnx
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', 0))  # 0 keeps the runtime default
 VECTOR_DIMENSION = 384  # Dimension for sentence-transformers model
 SIMILARITY_THRESHOLD = 0.7
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))
+EMBEDDING_CACHE_BYTES = int(os.getenv('EMBEDDING_CACHE_BYTES', 64 * 1024 * 1024))  # 0 disables the cache
+EMBEDDING_CACHE_SAVE_INTERVAL = float(os.getenv('EMBEDDING_CACHE_SAVE_INTERVAL', 300))  # Seconds between saves of a changed cache
+VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH', os.path.join(os.getcwd(), "vector_store/"))
+
+# Background compaction rewrites the vector matrix without tombstoned rows once they pass this share of rows
+VECTOR_COMPACTION_RATIO = float(os.getenv('VECTOR_COMPACTION_RATIO', 0.3))
+VECTOR_COMPACTION_MIN_ROWS = int(os.getenv('VECTOR_COMPACTION_MIN_ROWS', 1024))  # Smaller indexes are left alone
+
+# Batch queries: maximum queries per request and score matrix budget per block
+QUERY_BATCH_MAX = int(os.getenv('QUERY_BATCH_MAX', 10000))
+QUERY_SCORE_BYTES = int(os.getenv('QUERY_SCORE_BYTES', 64 * 1024 * 1024))
+
+# Approximate search (IVF) Configuration
+ANN_MIN_VECTORS = int(os.getenv('ANN_MIN_VECTORS', 100000))  # Exact search below this size
+IVF_NLIST = int(os.getenv('IVF_NLIST', 1024))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 16))
+
+# Sharded exact search: worker processes (1 searches in-process) and minimum rows to shard
+SEARCH_SHARDS = int(os.getenv('SEARCH_SHARDS', 1))
+SHARD_MIN_ROWS = int(os.getenv('SHARD_MIN_ROWS', 65536))
+
+# Compressed vector search: none, float16, int8 or pq
+VECTOR_COMPRESSION = os.getenv('VECTOR_COMPRESSION', 'none')
+PQ_SUBSPACES = int(os.getenv('PQ_SUBSPACES', 48))
+RERANK_FACTOR = int(os.getenv('RERANK_FACTOR', 10))  # Candidates re-ranked exactly per requested result
+
+# Lexical (BM25) and hybrid retrieval Configuration
+BM25_K1 = float(os.getenv('BM25_K1', 1.2))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+# Background compaction rewrites the postings without retired documents once they pass this share of document numbers
+BM25_COMPACTION_RATIO = float(os.getenv('BM25_COMPACTION_RATIO', 0.3))
+BM25_COMPACTION_MIN_DOCS = int(os.getenv('BM25_COMPACTION_MIN_DOCS', 1024))  # Smaller indexes are left alone
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', 100))  # Results taken from each stage before fusion
+RRF_K = int(os.getenv('RRF_K', 60))
 
 # Logging Configuration
 LOG_LEVEL = 'DEBUG'
@@ -1,5 +1,6 @@
 import pandas as pd
 from typing import Dict, Any
+from .tabular import TabularPayload
 from ..core.logger import log_info, log_error
 
 class CSVProcessor:
@@ -20,7 +21,7 @@ class CSVProcessor:
             }
 
             return {
-                'content': df.to_dict(orient='records'),
+                'content': TabularPayload.from_dataframe(df),
                 'metadata': {
                     'statistics': stats,
                     'type': 'csv'
@@ -1,12 +1,16 @@
+import hashlib
 import os
-from typing import Dict, Any, Optional
+import tempfile
+from typing import Dict, Any, Optional, Tuple
 from .pdf_processor import PDFProcessor
 from .excel_processor import ExcelProcessor
 from .csv_processor import CSVProcessor
 from .docx_processor import DocxProcessor
 from .image_processor import ImageProcessor
 from ..core.logger import log_info, log_error
-from ..core.config import ALLOWED_EXTENSIONS
+from ..core.config import ALLOWED_EXTENSIONS, UPLOAD_FOLDER
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 class DocumentParser:
     def __init__(self):
@@ -30,6 +34,68 @@ class DocumentParser:
         extension = self.get_file_extension(filename)
         return extension in ALLOWED_EXTENSIONS
 
+    def save_upload(self, file: Any, folder: str = UPLOAD_FOLDER) -> Optional[Tuple[str, str]]:
+        """Stream an uploaded file into ``folder``, hashing it on the way.
+
+        The file is stored under its SHA-256 digest, so re-uploads of the
+        same content map to the same file. Returns ``(path, digest)``.
+        """
+        received = self.receive_upload(file, folder)
+        if not received:
+            return None
+        tmp_path, content_hash = received
+        return self.store_upload(tmp_path, content_hash, file.filename, folder), content_hash
+
+    def receive_upload(self, file: Any, folder: str = UPLOAD_FOLDER) -> Optional[Tuple[str, str]]:
+        """Stream an uploaded file into a temporary file in ``folder``; returns ``(tmp_path, digest)``.
+
+        Move it in place with ``store_upload`` while holding the digest's
+        upload lock, so a concurrent delete of the same content cannot
+        remove it before it is processed.
+        """
+        tmp_path = None
+        try:
+            os.makedirs(folder, exist_ok=True)
+            digest = hashlib.sha256()
+            stream = getattr(file, 'stream', file)
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b''):
+                    digest.update(block)
+                    f.write(block)
+            return tmp_path, digest.hexdigest()
+
+        except Exception as e:
+            log_error(f"Error saving upload {getattr(file, 'filename', '')}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def store_upload(self, tmp_path: str, content_hash: str, filename: str, folder: str = UPLOAD_FOLDER) -> str:
+        """Move a received upload to ``<digest>.<ext>`` in ``folder`` and return its path."""
+        file_path = os.path.join(folder, f"{content_hash}.{self.get_file_extension(filename)}")
+        os.replace(tmp_path, file_path)
+        return file_path
+
+    def remove_upload(self, file_path: Optional[str]) -> bool:
+        """Delete a stored upload once no document needs it; False if it was already gone."""
+        try:
+            if not file_path or not os.path.exists(file_path):
+                return False
+            os.remove(file_path)
+            return True
+        except Exception as e:
+            log_error(f"Error removing upload {file_path}: {str(e)}")
+            return False
+
+    def hash_file(self, file_path: str) -> str:
+        """SHA-256 digest of a file on disk, as computed by ``save_upload``."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
     def parse(self, file_path: str) -> Optional[Dict[str, Any]]:
         """Parse the document and extract structured data."""
         try:
@@ -83,7 +149,7 @@ class DocumentParser:
 
             # Additional processing for specific file types
             if file_type in ['xlsx', 'xls']:
-                structured_data['relationships'] = parsed_data.get('relationships', [])
+                structured_data['relationships'] = content.get('relationships', [])
             elif file_type in ['jpg', 'jpeg', 'png']:
                 structured_data['metadata']['image_info'] = parsed_data.get('image_info', {})
 
@@ -1,7 +1,36 @@
 import pandas as pd
-from typing import Dict, Any, List
+from itertools import combinations
+from typing import Dict, Any, Iterable, Iterator, List
+from .tabular import TabularPayload
 from ..core.logger import log_info, log_error
 
+def column_set(sheet_name: str, columns: List[Any]) -> Dict[str, Any]:
+    """One hyperedge record relating every column of a sheet to every other."""
+    return {
+        'type': 'column_set',
+        'relation': 'column_relationship',
+        'sheet': sheet_name,
+        'columns': columns
+    }
+
+def iter_column_relationships(relationships: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Lazily expand column-set records into pairwise relationship dicts.
+
+    Pairwise records are passed through unchanged, so callers can consume
+    either form.
+    """
+    for record in relationships:
+        if record.get('type') != 'column_set':
+            yield record
+            continue
+        for source, target in combinations(record['columns'], 2):
+            yield {
+                'source': source,
+                'target': target,
+                'type': record['relation'],
+                'sheet': record['sheet']
+            }
+
 class ExcelProcessor:
     def __init__(self, file_path: str):
         self.file_path = file_path
@@ -14,20 +43,12 @@ class ExcelProcessor:
             relationships = []
 
             for sheet_name, df in excel_data.items():
-                # Convert DataFrame to dict format
-                sheet_data = df.to_dict(orient='records')
-                sheets_data[sheet_name] = sheet_data
-
-                # Extract column relationships
-                columns = df.columns.tolist()
-                for i, col1 in enumerate(columns):
-                    for col2 in columns[i+1:]:
-                        relationships.append({
-                            'source': col1,
-                            'target': col2,
-                            'type': 'column_relationship',
-                            'sheet': sheet_name
-                        })
+                # Keep the sheet columnar; rows become dicts only when serialized
+                sheets_data[sheet_name] = TabularPayload.from_dataframe(df)
+
+                # Relate the sheet's columns with one record instead of every pair;
+                # use iter_column_relationships to get the pairs
+                relationships.append(column_set(sheet_name, df.columns.tolist()))
 
             return {
                 'sheets': sheets_data,
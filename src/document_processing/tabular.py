@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import shutil
+import uuid
+import weakref
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from ..core.config import TABULAR_SPILL_PATH, TABULAR_SPILL_ROWS
+
+class Column:
+    """One column: a NumPy array of numbers, or UTF-8 bytes with row offsets.
+
+    String offsets are absolute positions in ``data``, so slices share the
+    buffer. ``nulls`` marks missing strings.
+    """
+
+    def __init__(self, kind: str, values: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None,
+                 data: Optional[np.ndarray] = None, nulls: Optional[np.ndarray] = None):
+        self.kind = kind
+        self.values = values
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> 'Column':
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf':
+            return cls('numeric', values=series.to_numpy())
+        nulls = series.isna().to_numpy()
+        encoded = [b'' if null else str(value).encode('utf-8') for value, null in zip(series, nulls)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls('string', offsets=offsets, data=data, nulls=nulls if nulls.any() else None)
+
+    def slice(self, start: int, stop: int) -> 'Column':
+        nulls = self.nulls[start:stop] if self.nulls is not None else None
+        if self.kind == 'numeric':
+            return Column('numeric', values=self.values[start:stop])
+        return Column('string', offsets=self.offsets[start:stop + 1], data=self.data, nulls=nulls)
+
+    def to_list(self) -> List[Any]:
+        if self.kind == 'numeric':
+            return self.values.tolist()
+        base = int(self.offsets[0])
+        raw = self.data[base:int(self.offsets[-1])].tobytes()
+        bounds = (self.offsets - base).tolist()
+        values = [raw[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)]
+        if self.nulls is not None:
+            for i in np.flatnonzero(self.nulls).tolist():
+                values[i] = None
+        return values
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.values, self.offsets, self.nulls) + ((self.data,) if self.kind == 'string' else ())
+        return sum(array.nbytes for array in arrays if array is not None)
+
+class TabularPayload:
+    """Columnar table content for CSV and Excel nodes.
+
+    Slices are zero-copy views, and rows are only built as dicts by
+    ``iter_rows`` and ``to_records``.
+    """
+
+    def __init__(self, names: List[str], columns: List[Column], rows: int,
+                 base: Optional['TabularPayload'] = None, start: int = 0):
+        self.names = names
+        self.columns = columns
+        self.rows = rows
+        self._path: Optional[str] = None
+        self._base = base
+        self._start = start
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, spill_rows: int = TABULAR_SPILL_ROWS) -> 'TabularPayload':
+        payload = cls([str(name) for name in df.columns],
+                      [Column.from_series(df.iloc[:, i]) for i in range(df.shape[1])], len(df))
+        if spill_rows and len(df) >= spill_rows:
+            payload.spill()
+        return payload
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def path(self) -> Optional[str]:
+        """Spill directory of the table this payload belongs to, if spilled."""
+        return (self._base or self)._path
+
+    def slice(self, start: int, stop: int) -> 'TabularPayload':
+        """Rows ``[start, stop)`` as a view sharing this payload's arrays."""
+        start, stop, _ = slice(start, stop).indices(self.rows)
+        stop = max(start, stop)
+        return TabularPayload(self.names, [column.slice(start, stop) for column in self.columns], stop - start,
+                              self._base or self, self._start + start)
+
+    def iter_rows(self, batch_rows: int = 4096) -> Iterator[Dict[str, Any]]:
+        """Yield rows as dicts, decoding one batch of rows at a time."""
+        for start in range(0, self.rows, batch_rows):
+            part = self.slice(start, start + batch_rows)
+            for values in zip(*(column.to_list() for column in part.columns)):
+                yield dict(zip(self.names, values))
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Materialize the rows as ``to_dict('records')`` would."""
+        return list(self.iter_rows())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns)
+
+    def spill(self, directory: str = TABULAR_SPILL_PATH) -> str:
+        """Write the whole table to disk once and memory-map its columns."""
+        if self._base is not None:
+            return self._base.spill(directory)
+        if self._path is not None:
+            return self._path
+        path = os.path.join(directory, uuid.uuid4().hex)
+        os.makedirs(path, exist_ok=True)
+        _loaded[path] = self  # Before any file, so remove_unused_spills never sees it unclaimed
+        for i, column in enumerate(self.columns):
+            for part in ('values', 'offsets', 'data', 'nulls'):
+                if getattr(column, part) is not None:
+                    np.save(os.path.join(path, f"{i}.{part}.npy"), getattr(column, part))
+        with open(os.path.join(path, 'schema.json'), 'w', encoding='utf-8') as f:
+            json.dump({'names': self.names, 'kinds': [column.kind for column in self.columns],
+                       'rows': self.rows}, f)
+        self.columns = TabularPayload._map_columns(path)
+        self._path = path
+        return path
+
+    @staticmethod
+    def _map_columns(path: str) -> List[Column]:
+        with open(os.path.join(path, 'schema.json'), 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        columns = []
+        for i, kind in enumerate(schema['kinds']):
+            parts = {}
+            for part in ('values', 'offsets', 'data', 'nulls'):
+                file_path = os.path.join(path, f"{i}.{part}.npy")
+                if os.path.exists(file_path):
+                    parts[part] = np.load(file_path, mmap_mode='r')
+            columns.append(Column(kind, **parts))
+        return columns
+
+    @classmethod
+    def load(cls, path: str) -> 'TabularPayload':
+        """Memory-map a spilled payload; loads of one path share their arrays."""
+        payload = _loaded.get(path)
+        if payload is None:
+            with open(os.path.join(path, 'schema.json'), 'r', encoding='utf-8') as f:
+                schema = json.load(f)
+            payload = cls(schema['names'], cls._map_columns(path), schema['rows'])
+            payload._path = path
+            _loaded[path] = payload
+        return payload
+
+    def reference(self, directory: str = TABULAR_SPILL_PATH) -> Dict[str, Any]:
+        """JSON-safe reference to this payload, spilling it to ``directory`` first if needed."""
+        path = self.spill(directory)
+        return {'__tabular__': path, 'rows': [self._start, self._start + self.rows]}
+
+    def __str__(self) -> str:
+        # Same text as Chunker.row_to_text over the equivalent row dicts
+        return "\n".join(", ".join(f"{k}: {v}" for k, v in row.items()) for row in self.iter_rows())
+
+    def __repr__(self) -> str:
+        return f"TabularPayload(rows={self.rows}, columns={self.names})"
+
+# Payloads by spill path, so references to one table map it only once
+_loaded: 'weakref.WeakValueDictionary[str, TabularPayload]' = weakref.WeakValueDictionary()
+SPILL_NAME = re.compile(r'^[0-9a-f]{32}$')
+
+def remove_unused_spills(directory: str, keep: Iterable[str]) -> int:
+    """Delete spill directories under ``directory`` that no live payload maps and ``keep`` does not list.
+
+    ``keep`` holds the spill paths still referenced by persisted records.
+    Returns the number of directories removed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    # Only complete spills are candidates; a spill registers in _loaded before writing its schema
+    candidates = [os.path.abspath(os.path.join(directory, name)) for name in os.listdir(directory)
+                  if SPILL_NAME.match(name) and os.path.exists(os.path.join(directory, name, 'schema.json'))]
+    keep = {os.path.abspath(path) for path in keep}
+    keep.update(os.path.abspath(path) for path in list(_loaded.keys()))
+    removed = 0
+    for path in candidates:
+        if path not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def json_default(value: Any, directory: str = TABULAR_SPILL_PATH) -> Any:
+    """``json.dumps`` default for persisted records: payloads become spill references."""
+    if isinstance(value, TabularPayload):
+        return value.reference(directory)
+    return str(value)
+
+def json_object_hook(obj: Dict[str, Any]) -> Any:
+    """``json.loads`` hook that turns spill references back into payload views."""
+    if '__tabular__' in obj:
+        start, stop = obj['rows']
+        return TabularPayload.load(obj['__tabular__']).slice(start, stop)
+    return obj
+
+def install_json_default(app: Any):
+    """Make a Flask app serialize payloads in responses as lists of row dicts."""
+    fallback: Callable[[Any], Any] = app.json.default
+    app.json.default = lambda value: value.to_records() if isinstance(value, TabularPayload) else fallback(value)
@@ -0,0 +1,180 @@
+import threading
+import time
+import numpy as np
+from scipy import sparse
+from typing import Any, Dict, Iterable, List
+from ..core.logger import log_info
+from ..core.config import (PAGERANK_DAMPING, PAGERANK_TOLERANCE, CONTEXT_HOPS, CONTEXT_NEIGHBORS,
+                           CONTEXT_EXCERPT_CHARS)
+
+# Small attributes returned for each neighbour; content is only sent as an excerpt
+NEIGHBOR_ATTRIBUTES = ('type', 'document_id', 'file_name', 'file_type', 'sheet_name', 'chunk_index')
+
+class PageRankCache:
+    """PageRank of a ``GraphBuilder`` graph, updated on the first read after it changes.
+
+    Edges are treated as undirected unless ``directed`` is set.
+    """
+
+    def __init__(self, builder, damping: float = PAGERANK_DAMPING, tolerance: float = PAGERANK_TOLERANCE,
+                 max_iterations: int = 100, directed: bool = False):
+        self.builder = builder
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.directed = directed
+        self._scores = np.zeros(0)
+        # (transition matrix, unnormalized scores, residual) of the last update
+        self._state = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def scores(self) -> np.ndarray:
+        """PageRank of every interned node code, summing to one."""
+        if not self._stale:
+            return self._scores
+        with self._lock:
+            if self._stale:
+                # Clear the flag first so changes made while computing mark it again
+                self._stale = False
+                self._scores = self._compute()
+            return self._scores
+
+    def _transition(self, graph) -> sparse.csc_matrix:
+        # Copy the edge columns before counting nodes, so every endpoint is below ``size``;
+        # ``types`` is appended last, so it bounds the complete edges, and it is -1 for removed ones
+        live = np.frombuffer(graph.types[:], dtype=np.int32) >= 0
+        count = len(live)
+        sources = np.frombuffer(graph.sources[:count], dtype=np.int32)[live]
+        targets = np.frombuffer(graph.targets[:count], dtype=np.int32)[live]
+        size = len(graph.ids)
+        if not self.directed:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+        out_degree = np.bincount(sources, minlength=size).astype(np.float64)
+        weights = 1.0 / out_degree[sources]
+        return sparse.csc_matrix((weights, (targets, sources)), shape=(size, size))
+
+    def _compute(self) -> np.ndarray:
+        """Update the scores by pushing residuals from the nodes whose links changed.
+
+        With dangling mass spread uniformly, PageRank is ``y / y.sum()`` for
+        ``y = 1 + damping * T @ y``. The unnormalized ``y`` and its residual
+        are kept between updates. A change only moves the residual of the
+        changed columns' targets, and only nodes whose residual is above
+        the tolerance push it on to their neighbours.
+        """
+        start = time.perf_counter()
+        transition = self._transition(self.builder.graph)
+        size = transition.shape[0]
+        if size == 0:
+            self._state = None
+            return np.zeros(0)
+        if self._state is None or self._state[0].shape[0] > size:
+            # Cold start: y = 0 leaves a residual of one everywhere
+            y, residual = np.zeros(size), np.ones(size)
+        else:
+            previous, y, residual = self._state
+            added = size - len(y)
+            previous = sparse.csc_matrix((previous.data, previous.indices,
+                                          np.concatenate([previous.indptr, np.full(added, previous.indptr[-1])])),
+                                         shape=(size, size))
+            y, residual = np.concatenate([y, np.zeros(added)]), np.concatenate([residual, np.ones(added)])
+            # Only the columns of nodes whose out-links changed are non-zero
+            changes = transition - previous
+            changes.eliminate_zeros()
+            residual += self.damping * (changes @ y)
+
+        # Residuals above tolerance / size of the mass are pushed, so the normalized residual ends
+        # below the tolerance, as a power iteration's change between steps would be. The work is
+        # capped at ``max_iterations`` pushes of every node.
+        total = y.sum()
+        pushes = rounds = 0
+        while pushes < self.max_iterations * size:
+            active = np.flatnonzero(np.abs(residual) > self.tolerance / size * max(total, 1.0))
+            if len(active) == 0:
+                break
+            pushed = residual[active]
+            y[active] += pushed
+            total += pushed.sum()
+            residual[active] = 0.0
+            residual += self.damping * (transition[:, active] @ pushed)
+            pushes += len(active)
+            rounds += 1
+        self._state = (transition, y, residual)
+        log_info(f"PageRank over {size} nodes updated in {rounds} rounds, {pushes} node pushes "
+                 f"({time.perf_counter() - start:.3f}s)")
+        return y / total
+
+    def score(self, node_id: str) -> float:
+        node = self.builder.graph.id_codes.get(node_id)
+        scores = self.scores()
+        return float(scores[node]) if node is not None and node < len(scores) else 0.0
+
+    def expand(self, node_ids: Iterable[str], hops: int = CONTEXT_HOPS,
+               limit: int = CONTEXT_NEIGHBORS) -> Dict[str, List[Dict[str, Any]]]:
+        """The ``limit`` most central neighbours within ``hops`` of each node.
+
+        Neighbours are followed in both directions, and nodes in
+        ``node_ids`` are not repeated as each other's neighbours. Each one
+        carries a small ``info`` summary rather than the full node.
+        """
+        node_ids = list(node_ids)
+        expanded = {node_id: [] for node_id in node_ids}
+        if hops <= 0 or limit <= 0:
+            return expanded
+        scores = self.scores()
+        codes = self.builder.graph.id_codes
+        seeds = set(node_ids)
+        for node_id in node_ids:
+            neighbours = [(neighbour, distance)
+                          for neighbour, distance in self.builder.k_hop(node_id, hops, 'both').items()
+                          if neighbour not in seeds]
+            if not neighbours:
+                continue
+            centrality = np.array([scores[codes[neighbour]] if codes[neighbour] < len(scores) else 0.0
+                                   for neighbour, _ in neighbours])
+            top = np.argsort(-centrality, kind='stable')[:limit]
+            expanded[node_id] = [{'node_id': neighbours[i][0], 'distance': neighbours[i][1],
+                                  'centrality': float(centrality[i]), 'info': self.summary(neighbours[i][0])}
+                                 for i in top]
+        return expanded
+
+    def summary(self, node_id: str, excerpt_chars: int = CONTEXT_EXCERPT_CHARS) -> Dict[str, Any]:
+        """A node's small attributes and the start of its text content.
+
+        Attributes are read one at a time, so a document's content or
+        tables are never materialized. Chunked nodes get no excerpt, since
+        their text is in their chunks.
+        """
+        graph = self.builder.graph
+        info = {}
+        for key in NEIGHBOR_ATTRIBUTES:
+            value = graph.attribute(node_id, key)
+            if value is not None:
+                info[key] = value
+        if excerpt_chars > 0 and not graph.attribute(node_id, 'chunked'):
+            content = graph.attribute(node_id, 'content')
+            if isinstance(content, str):
+                info['excerpt'] = content[:excerpt_chars]
+        return info
+
+    # GraphBuilder listener hooks
+
+    def node_added(self, node_id: str, node_data: Dict[str, Any]):
+        self._stale = True
+
+    def edge_added(self, edge: Dict[str, Any]):
+        self._stale = True
+
+    def node_removed(self, node_id: str):
+        self._stale = True
+
+    def graph_cleared(self):
+        with self._lock:
+            self._scores = np.zeros(0)
+            self._state = None
+            self._stale = True
+
+    def graph_compacted(self):
+        # Node codes were renumbered, so the scores no longer line up
+        self.graph_cleared()
@@ -0,0 +1,104 @@
+import re
+from collections import deque
+from typing import Any, Iterable, Iterator, List, Tuple, Union
+from ..document_processing.tabular import TabularPayload
+from ..core.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+TOKEN_PATTERN = re.compile(r'\S+')
+
+class Chunker:
+    """Split node content into bounded, overlapping chunks of whitespace-delimited tokens."""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS):
+        if max_tokens <= 0 or not 0 <= overlap < max_tokens:
+            raise ValueError("Chunk size must be positive and larger than the overlap")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def iter_text_chunks(self, text: str) -> Iterator[str]:
+        """Yield windows of at most ``max_tokens`` tokens sharing ``overlap`` tokens."""
+        spans = deque()
+        new_tokens = 0
+        for match in TOKEN_PATTERN.finditer(text):
+            spans.append((match.start(), match.end()))
+            new_tokens += 1
+            if len(spans) == self.max_tokens:
+                yield text[spans[0][0]:spans[-1][1]]
+                for _ in range(self.max_tokens - self.overlap):
+                    spans.popleft()
+                new_tokens = 0
+        if new_tokens:
+            yield text[spans[0][0]:spans[-1][1]]
+
+    @staticmethod
+    def row_to_text(row: Any) -> str:
+        if isinstance(row, dict):
+            return ", ".join(f"{k}: {v}" for k, v in row.items())
+        if isinstance(row, (list, tuple)):
+            return " | ".join(str(cell) for cell in row)
+        return str(row)
+
+    def _iter_row_windows(self, rows: Iterable[Any]) -> Iterator[Tuple[str, int, int, bool]]:
+        """Chunk windows as ``(text, first_row, stop_row, whole_rows)``.
+
+        ``whole_rows`` is False for the pieces of a single oversized row,
+        which is split like free text.
+        """
+        window: List[str] = []
+        counts: List[int] = []
+        first = 0
+        new_rows = 0
+        for index, row in enumerate(rows):
+            text = self.row_to_text(row)
+            tokens = len(TOKEN_PATTERN.findall(text))
+            if tokens > self.max_tokens:
+                if new_rows:
+                    yield "\n".join(window), first, index, True
+                window, counts, new_rows = [], [], 0
+                for piece in self.iter_text_chunks(text):
+                    yield piece, index, index + 1, False
+                continue
+
+            if new_rows and sum(counts) + tokens > self.max_tokens:
+                yield "\n".join(window), first, index, True
+                while counts and (sum(counts) > self.overlap or sum(counts) + tokens > self.max_tokens):
+                    window.pop(0)
+                    counts.pop(0)
+                    first += 1
+                new_rows = 0
+            if not window:
+                first = index
+            window.append(text)
+            counts.append(tokens)
+            new_rows += 1
+        if new_rows:
+            yield "\n".join(window), first, first + len(window), True
+
+    def iter_record_chunks(self, rows: Iterable[Any]) -> Iterator[str]:
+        """Group table or sheet rows into chunks, carrying trailing rows as overlap."""
+        for text, _, _, _ in self._iter_row_windows(rows):
+            yield text
+
+    def iter_payload_chunks(self, payload: TabularPayload) -> Iterator[Union[str, TabularPayload]]:
+        """Group a columnar table into chunks that are zero-copy row slices.
+
+        Windows match ``iter_record_chunks`` over the same rows; only the
+        pieces of an oversized row are yielded as text.
+        """
+        for text, start, stop, whole_rows in self._iter_row_windows(payload.iter_rows()):
+            yield payload.slice(start, stop) if whole_rows else text
+
+    def iter_chunks(self, content: Any) -> Iterator[str]:
+        """Chunk node content: text, a list of rows, a columnar table or a processor output dict."""
+        if isinstance(content, str):
+            yield from self.iter_text_chunks(content)
+        elif isinstance(content, TabularPayload):
+            yield from self.iter_payload_chunks(content)
+        elif isinstance(content, (list, tuple)):
+            yield from self.iter_record_chunks(content)
+        elif isinstance(content, dict):
+            # Processor outputs keep their body under 'text' or 'content';
+            # tables and sheets become their own nodes and are chunked there
+            for key in ('text', 'content'):
+                if isinstance(content.get(key), (str, list, tuple, dict, TabularPayload)):
+                    yield from self.iter_chunks(content[key])
\ No newline at end of file
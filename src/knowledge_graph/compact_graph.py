@@ -0,0 +1,466 @@
+import json
+from array import array
+from collections.abc import ItemsView, Mapping, Sequence
+import numpy as np
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# Attributes held out-of-line as encoded bytes instead of dictionary-encoded
+OUT_OF_LINE_ATTRIBUTES = ('content',)
+# Node shape of an interned id that was never added, and of a removed node
+ABSENT, REMOVED = -1, -2
+# Returned by BlobStore.get for a released slot
+RELEASED_VALUE = object()
+
+class Interner:
+    """Dictionary encoding: each distinct value gets a dense integer code."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self._codes: Dict[Hashable, int] = {}
+
+    def encode(self, value: Any) -> int:
+        key = (type(value), value)  # Keep 1, 1.0 and True apart
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Any) -> Optional[int]:
+        return self._codes.get((type(value), value))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+class BlobStore:
+    """Byte-encoded storage for large or nested values, addressed by slot.
+
+    Values are stored JSON-encoded, one ``bytes`` object per slot, so a
+    released slot's bytes are freed. Objects JSON cannot encode, such as
+    columnar table payloads, are kept by reference, not copied.
+    """
+
+    def __init__(self):
+        self._slots: List[Optional[Tuple[bytes, List[Any]]]] = []
+        self._bytes = 0
+
+    def append(self, value: Any) -> int:
+        objects = []
+
+        def reference(obj: Any) -> Dict[str, int]:
+            objects.append(obj)
+            return {'__ref__': len(objects) - 1}
+
+        data = json.dumps(value, separators=(',', ':'), default=reference).encode('utf-8')
+        self._slots.append((data, objects))
+        self._bytes += len(data)
+        return len(self._slots) - 1
+
+    def get(self, slot: int, default: Any = None) -> Any:
+        """The value in a slot, or ``default`` once the slot was released."""
+        entry = self._slots[slot]
+        if entry is None:
+            return default
+        data, objects = entry
+        return json.loads(data, object_hook=lambda obj: objects[obj['__ref__']] if obj.keys() == {'__ref__'} else obj)
+
+    def release(self, slot: int):
+        """Drop a dead slot's bytes and the objects it refers to."""
+        entry = self._slots[slot]
+        if entry is not None:
+            self._slots[slot] = None
+            self._bytes -= len(entry[0])
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes + 8 * len(self._slots)
+
+class CompactGraph:
+    """Columnar node and edge storage with CSR adjacency for large knowledge graphs.
+
+    ``nodes`` and ``edges`` are read-only views that build dicts on access. One
+    writer at a time may mutate the graph while any number of threads read it.
+    """
+
+    REBUILD_FRACTION = 8  # Rebuild CSR once pending edges exceed 1/8 of the built ones
+    MIN_REBUILD = 4096
+
+    def __init__(self, clock: int = 0):
+        # Removals are only tracked from this clock on; earlier ones were compacted away
+        self.horizon = clock
+        self.ids: List[str] = []
+        self.id_codes: Dict[str, int] = {}
+        self.shapes = Interner()
+        self.node_shapes = array('i')
+        self.node_count = 0
+        # Change clock: each node's version is the tick of its last change or new outgoing edge
+        self.clock = clock
+        self.versions = array('q')
+        self.columns: Dict[str, Tuple[array, Interner]] = {}
+        self.blobs = BlobStore()
+        self.edge_types = Interner()
+        self.sources = array('i')
+        self.targets = array('i')
+        self.types = array('i')
+        self.edge_count = 0  # Live edges; tombstoned ones keep their slots with type -1
+        # (CSR offsets, neighbours, types and edge indexes per direction, edges added since per direction and node)
+        self._adjacency: Tuple[Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]],
+                               Dict[str, Dict[int, List[int]]]] = ({}, {'out': {}, 'in': {}})
+        self._built = 0
+        self.nodes = NodesView(self)
+        self.edges = EdgesView(self)
+
+    def intern(self, node_id: str) -> int:
+        """Dense integer code of a node id, allocating one for unseen ids."""
+        code = self.id_codes.get(node_id)
+        if code is None:
+            code = self.id_codes[node_id] = len(self.ids)
+            self.ids.append(node_id)
+            self.node_shapes.append(ABSENT)
+            self.versions.append(0)
+        return code
+
+    def _blob_slots(self, node: int) -> List[int]:
+        """Arena slots of a live node's out-of-line values."""
+        if self.node_shapes[node] < 0:
+            return []
+        codes = (self.columns[key][0][node] for key in self.shapes.values[self.node_shapes[node]])
+        return [-2 - code for code in codes if code <= -2]
+
+    def _column(self, key: str) -> Tuple[array, Interner]:
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = (array('i', [-1]) * len(self.ids), Interner())
+        codes = column[0]
+        if len(codes) < len(self.ids):
+            codes.extend([-1] * (len(self.ids) - len(codes)))
+        return column
+
+    def set_node(self, node_id: str, node_data: Dict[str, Any]):
+        """Add or replace a node's attributes."""
+        node = self.intern(node_id)
+        replaced = self._blob_slots(node)
+        for key, value in node_data.items():
+            codes, dictionary = self._column(key)
+            if key in OUT_OF_LINE_ATTRIBUTES or not isinstance(value, (str, int, float, bool, type(None))):
+                codes[node] = -2 - self.blobs.append(value)
+            else:
+                codes[node] = dictionary.encode(value)
+        if self.node_shapes[node] < 0:
+            self.node_count += 1
+        # Set after the values, so lock-free readers never see a half-written node
+        self.node_shapes[node] = self.shapes.encode(tuple(node_data))
+        self.clock += 1
+        self.versions[node] = self.clock
+        for slot in replaced:
+            self.blobs.release(slot)
+
+    def has_node(self, node_id: str) -> bool:
+        code = self.id_codes.get(node_id)
+        return code is not None and self.node_shapes[code] >= 0
+
+    def _value(self, node: int, key: str) -> Any:
+        """One attribute value; raises ``KeyError`` if the node lost it while it was read."""
+        codes, dictionary = self.columns[key]
+        while True:
+            code = codes[node]
+            if code >= 0:
+                return dictionary.values[code]
+            value = self.blobs.get(-2 - code, RELEASED_VALUE)
+            if value is not RELEASED_VALUE:
+                return value
+            # A replaced value is released after its successor is written, so read the code again
+            shape = self.node_shapes[node]
+            if shape < 0 or key not in self.shapes.values[shape]:
+                raise KeyError(self.ids[node])
+
+    def node_data(self, node: int) -> Dict[str, Any]:
+        """Materialize a node's attributes as a new dict."""
+        while True:
+            shape = self.node_shapes[node]
+            if shape < 0:
+                raise KeyError(self.ids[node])
+            try:
+                return {key: self._value(node, key) for key in self.shapes.values[shape]}
+            except KeyError:
+                continue
+
+    def attribute(self, node_id: str, key: str, default: Any = None) -> Any:
+        """One attribute of a node without materializing the rest."""
+        node = self.id_codes.get(node_id)
+        if node is None or self.node_shapes[node] < 0 or key not in self.shapes.values[self.node_shapes[node]]:
+            return default
+        try:
+            return self._value(node, key)
+        except KeyError:
+            return default
+
+    def add_edge(self, source: str, target: str, edge_type: str) -> int:
+        edge = len(self.sources)
+        src, dst = self.intern(source), self.intern(target)
+        self.sources.append(src)
+        self.targets.append(dst)
+        self.types.append(self.edge_types.encode(edge_type))
+        self.edge_count += 1
+        self.clock += 1
+        self.versions[src] = self.clock
+        pending = self._adjacency[1]
+        pending['out'].setdefault(src, []).append(edge)
+        pending['in'].setdefault(dst, []).append(edge)
+        if edge - self._built >= max(self.MIN_REBUILD, self._built // self.REBUILD_FRACTION):
+            self._build()
+        return edge
+
+    def remove_node(self, node_id: str) -> bool:
+        """Drop a node and tombstone all of its edges.
+
+        The id keeps its code, so adding the node again reuses it. Returns
+        False if there was neither a node nor an edge to remove.
+        """
+        node = self.id_codes.get(node_id)
+        if node is None:
+            return False
+        removed = False
+        built, pending = self._adjacency
+        for direction in ('out', 'in'):
+            csr = built.get(direction)
+            if csr is not None and node + 1 < len(csr[0]):
+                offsets, _, _, edges = csr
+                for edge in edges[offsets[node]:offsets[node + 1]].tolist():
+                    removed |= self._remove_edge(edge)
+            for edge in list(pending[direction].get(node, ())):
+                removed |= self._remove_edge(edge)
+        if self.node_shapes[node] >= 0:
+            released = self._blob_slots(node)
+            self.node_shapes[node] = REMOVED
+            self.node_count -= 1
+            for slot in released:
+                self.blobs.release(slot)
+            removed = True
+        self.clock += 1
+        self.versions[node] = self.clock
+        return removed
+
+    def _remove_edge(self, edge: int) -> bool:
+        if self.types[edge] < 0:
+            return False
+        self.types[edge] = -1
+        self.edge_count -= 1
+        source = self.sources[edge]
+        if edge < self._built:
+            built, _ = self._adjacency
+            for direction, node in (('out', source), ('in', self.targets[edge])):
+                offsets, _, types, edges = built[direction]
+                start, stop = offsets[node], offsets[node + 1]
+                types[start:stop][edges[start:stop] == edge] = -1
+        self.clock += 1
+        self.versions[source] = self.clock
+        return True
+
+    def _build(self):
+        """Rebuild the CSR arrays over all live edges and empty the delta lists."""
+        count = len(self.sources)
+        types = np.frombuffer(self.types, dtype=np.int32)[:count]
+        edges = np.flatnonzero(types >= 0)
+        sources = np.frombuffer(self.sources, dtype=np.int32)[:count][edges]
+        targets = np.frombuffer(self.targets, dtype=np.int32)[:count][edges]
+        types = types[edges]
+        csr = {}
+        for direction, keys, values in (('out', sources, targets), ('in', targets, sources)):
+            order = np.argsort(keys, kind='stable')  # Keeps insertion order per node
+            offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=len(self.ids)), out=offsets[1:])
+            csr[direction] = (offsets, values[order], types[order], edges[order])
+        # CSR arrays and their delta lists are published together, as one tuple
+        self._adjacency = (csr, {'out': {}, 'in': {}})
+        self._built = count
+
+    def adjacent(self, node_id: str, direction: str, edge_type: Optional[str] = None) -> Iterator[str]:
+        """Neighbour ids along one direction, one per edge, in insertion order."""
+        node = self.id_codes.get(node_id)
+        if node is None:
+            return
+        type_code = None
+        if edge_type is not None:
+            type_code = self.edge_types.lookup(edge_type)
+            if type_code is None:
+                return
+        built, pending = self._adjacency
+        csr = built.get(direction)
+        if csr is not None and node + 1 < len(csr[0]):
+            offsets, neighbours, types, _ = csr
+            start, stop = offsets[node], offsets[node + 1]
+            types = types[start:stop]
+            found = neighbours[start:stop][types >= 0 if type_code is None else types == type_code]
+            for neighbour in found.tolist():
+                yield self.ids[neighbour]
+        other = self.targets if direction == 'out' else self.sources
+        for edge in pending[direction].get(node, ()):
+            if self.types[edge] >= 0 and (type_code is None or self.types[edge] == type_code):
+                yield self.ids[other[edge]]
+
+    def degree(self, node_id: str, direction: str, edge_type: Optional[str] = None) -> int:
+        """Edge count along one direction; untyped counts scan the CSR type codes, not the neighbours."""
+        if edge_type is not None:
+            return sum(1 for _ in self.adjacent(node_id, direction, edge_type))
+        node = self.id_codes.get(node_id)
+        if node is None:
+            return 0
+        built, pending = self._adjacency
+        csr = built.get(direction)
+        count = 0
+        if csr is not None and node + 1 < len(csr[0]):
+            offsets, _, types, _ = csr
+            count = int(np.count_nonzero(types[offsets[node]:offsets[node + 1]] >= 0))
+        return count + sum(1 for edge in pending[direction].get(node, ()) if self.types[edge] >= 0)
+
+    def changed_nodes(self, since: int) -> List[str]:
+        """Ids of nodes added, replaced or given an outgoing edge after clock ``since``."""
+        versions = np.frombuffer(self.versions[:], dtype=np.int64)
+        shapes = np.frombuffer(self.node_shapes[:len(versions)], dtype=np.int32)
+        return [self.ids[node] for node in np.flatnonzero((versions > since) & (shapes >= 0)).tolist()]
+
+    def removed_nodes(self, since: int) -> List[str]:
+        """Ids of nodes removed after clock ``since`` and not added again."""
+        versions = np.frombuffer(self.versions[:], dtype=np.int64)
+        shapes = np.frombuffer(self.node_shapes[:len(versions)], dtype=np.int32)
+        return [self.ids[node] for node in np.flatnonzero((versions > since) & (shapes == REMOVED)).tolist()]
+
+    def changed_edges(self, since: int) -> Iterator[Dict[str, Any]]:
+        """All outgoing edges of the nodes changed after clock ``since``."""
+        # Edge columns first: ``types`` is appended last, after the edge's nodes exist
+        types = np.frombuffer(self.types[:], dtype=np.int32)
+        sources = np.frombuffer(self.sources[:len(types)], dtype=np.int32)
+        versions = np.frombuffer(self.versions[:], dtype=np.int64)
+        edges = np.flatnonzero((versions[sources] > since) & (types >= 0)).tolist()
+        for index in edges:
+            yield self.edge(index)
+
+    def edge(self, index: int) -> Dict[str, Any]:
+        return {
+            'source': self.ids[self.sources[index]],
+            'target': self.ids[self.targets[index]],
+            'attributes': {'type': self.edge_types.values[self.types[index]]}
+        }
+
+    def dead_fraction(self) -> float:
+        """Share of interned ids and edge slots that belong to removed nodes and edges."""
+        slots = len(self.ids) + len(self.types)
+        return (slots - self.node_count - self.edge_count) / slots if slots else 0.0
+
+    def compacted(self) -> 'CompactGraph':
+        """A copy with only the live nodes and edges, renumbered densely.
+
+        The clock and each node's version carry over, so ``changed_nodes``
+        answers as before, but removals before the copy's ``horizon`` are
+        forgotten.
+        """
+        graph = CompactGraph(clock=self.clock)
+        graph.MIN_REBUILD, graph.REBUILD_FRACTION = self.MIN_REBUILD, self.REBUILD_FRACTION
+        versions = {}
+        for node, node_id in enumerate(self.ids):
+            if self.node_shapes[node] >= 0:
+                graph.set_node(node_id, self.node_data(node))
+                versions[node_id] = self.versions[node]
+        for index in range(len(self.types)):
+            if self.types[index] >= 0:
+                source, target = self.ids[self.sources[index]], self.ids[self.targets[index]]
+                graph.add_edge(source, target, self.edge_types.values[self.types[index]])
+                versions.setdefault(source, self.versions[self.sources[index]])
+                versions.setdefault(target, self.versions[self.targets[index]])
+        for node_id, version in versions.items():
+            graph.versions[graph.id_codes[node_id]] = version
+        graph.clock = self.clock
+        graph._build()
+        return graph
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the arrays and the content arena."""
+        arrays = [self.node_shapes, self.sources, self.targets, self.types] + \
+                 [codes for codes, _ in self.columns.values()]
+        total = sum(a.itemsize * len(a) for a in arrays) + self.blobs.nbytes
+        return total + sum(sum(part.nbytes for part in csr) for csr in self._adjacency[0].values())
+
+class NodesView(Mapping):
+    """Read-only ``{node_id: attributes}`` mapping over a ``CompactGraph``, or over some of its nodes."""
+
+    def __init__(self, graph: CompactGraph, node_ids: Optional[List[str]] = None):
+        self._graph = graph
+        self._node_ids = node_ids
+        self._subset = set(node_ids) if node_ids is not None else None
+
+    def __getitem__(self, node_id: str) -> Dict[str, Any]:
+        node = self._graph.id_codes.get(node_id)
+        if node is None or self._graph.node_shapes[node] < 0 or \
+                (self._subset is not None and node_id not in self._subset):
+            raise KeyError(node_id)
+        return self._graph.node_data(node)
+
+    def __contains__(self, node_id) -> bool:
+        return self._graph.has_node(node_id) and (self._subset is None or node_id in self._subset)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._node_ids is not None:
+            return iter(self._node_ids)
+        shapes = self._graph.node_shapes
+        return (node_id for node, node_id in enumerate(self._graph.ids) if shapes[node] >= 0)
+
+    def __len__(self) -> int:
+        return self._graph.node_count if self._node_ids is None else len(self._node_ids)
+
+    def attribute(self, node_id: str, key: str, default: Any = None) -> Any:
+        """One attribute of any node in the graph, without materializing the node."""
+        return self._graph.attribute(node_id, key, default)
+
+    def items(self) -> ItemsView:
+        return LiveItemsView(self)
+
+class LiveItemsView(ItemsView):
+    """Items of a ``NodesView`` that skip nodes removed while it is iterated."""
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for node_id in self._mapping:
+            try:
+                yield node_id, self._mapping[node_id]
+            except KeyError:
+                continue
+
+class EdgesView(Sequence):
+    """Read-only list of edge dicts over a ``CompactGraph``."""
+
+    def __init__(self, graph: CompactGraph):
+        self._graph = graph
+
+    def _positions(self) -> Optional[np.ndarray]:
+        """Column index of each live edge, or None while no edge has been removed."""
+        types = np.frombuffer(self._graph.types[:], dtype=np.int32)
+        return np.flatnonzero(types >= 0) if self._graph.edge_count < len(types) else None
+
+    def __getitem__(self, index):
+        positions = self._positions()
+        if isinstance(index, slice):
+            indexes = range(*index.indices(len(self)))
+            return [self._graph.edge(i if positions is None else int(positions[i])) for i in indexes]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._graph.edge(index if positions is None else int(positions[index]))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        graph = self._graph
+        for index in range(len(graph.types)):
+            if graph.types[index] >= 0:
+                yield graph.edge(index)
+
+    def __len__(self) -> int:
+        return self._graph.edge_count
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
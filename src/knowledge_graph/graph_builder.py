@@ -1,34 +1,152 @@
-from typing import Dict, Any
+import threading
+from collections import deque
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Dict, Any, Iterator, List, Optional
+from ..core.config import GRAPH_COMPACTION_RATIO, GRAPH_COMPACTION_MIN_NODES
 from ..core.logger import log_info, log_error
+from .chunker import Chunker
+from .compact_graph import CompactGraph, NodesView
 import uuid
 
+DIRECTIONS = ('out', 'in', 'both')
+
 class GraphBuilder:
-    def __init__(self):
-        self.knowledge_graph = {
-            'nodes': {},
-            'edges': [],
-            'metadata': {}
-        }
+    def __init__(self, chunker: Chunker = None):
+        # Columnar node storage with CSR adjacency; see CompactGraph
+        self.graph = CompactGraph()
+        self.metadata = {}
+        # Document id -> its node ids, as an insertion-ordered dict so removals are O(1)
+        self.document_nodes = {}
+        # Content hash of each uploaded file -> id of the document built from it
+        self.document_hashes = {}
+        self.chunker = chunker or Chunker()
+        self.listeners = []
+        # Commits are serialized; reads go through the compact graph without locking
+        self._write_lock = threading.RLock()
+        self._staged = threading.local()
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_lock = threading.Lock()
+
+    def add_listener(self, listener: Any):
+        """Register an object notified of graph changes.
+
+        Listeners may implement any of ``node_added(node_id, node_data)``,
+        ``edge_added(edge)``, ``node_removed(node_id)``,
+        ``document_registered(content_hash, doc_id)``, ``graph_cleared()``
+        and ``graph_compacted()``; a removed node's edges go with it without
+        events of their own. They are called under the write lock, in
+        commit order.
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, event: str, *args):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is None:
+                continue
+            try:
+                handler(*args)
+            except Exception as e:
+                log_error(f"Error notifying {type(listener).__name__} of {event}: {str(e)}")
+
+    @contextmanager
+    def transaction(self):
+        """Stage this thread's node and edge changes and commit them together.
+
+        Staged changes are invisible to readers and listeners until the
+        outermost block exits, then they are applied under the write lock,
+        one commit at a time. Nothing is applied if the block raises.
+        """
+        if getattr(self._staged, 'changes', None) is not None:
+            yield
+            return
+        self._staged.changes = changes = []
+        try:
+            yield
+        finally:
+            self._staged.changes = None
+        with self._write_lock:
+            for apply, args in changes:
+                apply(*args)
+
+    def _write(self, apply, *args):
+        changes = getattr(self._staged, 'changes', None)
+        if changes is not None:
+            changes.append((apply, args))
+            return
+        with self._write_lock:
+            apply(*args)
+
+    def add_node(self, node_id: str, node_data: Dict[str, Any], doc_id: Optional[str] = None):
+        """Add a node, recording it under its document and notifying listeners."""
+        self._write(self._apply_node, node_id, node_data, doc_id or node_data.get('document_id') or node_id)
+
+    def _apply_node(self, node_id: str, node_data: Dict[str, Any], doc_id: str):
+        self.graph.set_node(node_id, node_data)
+        self.document_nodes.setdefault(doc_id, {})[node_id] = None
+        self._notify('node_added', node_id, node_data)
+
+    def add_edge(self, source: str, target: str, edge_type: str):
+        """Add a typed edge; it is visible to traversals immediately."""
+        self._write(self._apply_edge, source, target, edge_type)
+
+    def _apply_edge(self, source: str, target: str, edge_type: str):
+        edge = self.graph.add_edge(source, target, edge_type)
+        self._notify('edge_added', self.graph.edge(edge))
+
+    def remove_node(self, node_id: str, doc_id: Optional[str] = None):
+        """Remove a node together with its edges, notifying listeners."""
+        self._write(self._apply_remove, node_id, doc_id)
 
-    def add_document(self, document_data: Dict[str, Any]) -> str:
-        """Add document data to the knowledge graph."""
+    def _apply_remove(self, node_id: str, doc_id: Optional[str]):
+        doc_id = doc_id or self.graph.attribute(node_id, 'document_id') or node_id
+        content_hash = self.graph.attribute(node_id, 'content_hash')
+        if content_hash and self.document_hashes.get(content_hash) == node_id:
+            del self.document_hashes[content_hash]
+        if not self.graph.remove_node(node_id):
+            return
+        nodes = self.document_nodes.get(doc_id)
+        if nodes is not None:
+            nodes.pop(node_id, None)
+            if not nodes:
+                del self.document_nodes[doc_id]
+        self._notify('node_removed', node_id)
+
+    def is_document(self, doc_id: str) -> bool:
+        """Whether a document node with this id is in the graph."""
+        return self.graph.attribute(doc_id, 'type') == 'document'
+
+    def add_document(self, document_data: Dict[str, Any], doc_id: Optional[str] = None) -> str:
+        """Add document data to the knowledge graph.
+
+        The document's nodes and edges are built outside the write lock and
+        committed in one transaction, so concurrent uploads only serialize
+        on the commit and readers never see a half-added document.
+        """
         try:
-            doc_id = str(uuid.uuid4())
+            doc_id = doc_id or str(uuid.uuid4())
             
             # Create document node
-            self.knowledge_graph['nodes'][doc_id] = {
+            doc_node = {
                 'type': 'document',
                 'content': document_data.get('content', ''),
-                **document_data.get('metadata', {})
+                **document_data.get('metadata', {}),
+                'document_id': doc_id
             }
+            with self.transaction():
+                self._add_chunks(doc_id, doc_id, doc_node)
+                self.add_node(doc_id, doc_node)
 
-            # Handle structured data like tables
-            if isinstance(document_data.get('content'), dict):
-                for key, value in document_data['content'].items():
-                    if key == 'tables':
-                        self._process_tables(doc_id, value)
-                    elif key == 'sheets':  # For Excel files
-                        self._process_excel_sheets(doc_id, value)
+                # Handle structured data like tables
+                if isinstance(document_data.get('content'), dict):
+                    for key, value in document_data['content'].items():
+                        if key == 'tables':
+                            self._process_tables(doc_id, value)
+                        elif key == 'sheets':  # For Excel files
+                            self._process_excel_sheets(doc_id, value)
+                        elif key == 'relationships':
+                            self._process_column_sets(doc_id, value)
 
             log_info(f"Added document to graph with ID: {doc_id}")
             return doc_id
@@ -37,43 +155,260 @@ class GraphBuilder:
             log_error(f"Error adding document to graph: {str(e)}")
             return None
 
+    def remove_document(self, doc_id: str) -> bool:
+        """Remove a document with its table, sheet, column-set and chunk nodes and their edges.
+
+        The work is proportional to the document, not the graph: its node
+        ids are tracked in ``document_nodes`` and edges are tombstoned.
+        """
+        try:
+            if not self.is_document(doc_id):
+                return False
+            with self.transaction():
+                for node_id in self.get_document_nodes(doc_id):
+                    self.remove_node(node_id, doc_id)
+            log_info(f"Removed document {doc_id} from graph")
+            return True
+        except Exception as e:
+            log_error(f"Error removing document {doc_id} from graph: {str(e)}")
+            return False
+
+    def update_document(self, doc_id: str, document_data: Dict[str, Any]) -> Optional[str]:
+        """Replace a document's nodes with ones built from new data, keeping its id.
+
+        The old nodes are removed and the new ones added in one
+        transaction, so no other commit lands between the two. Nodes
+        whose ids and content are unchanged are the same to the vectorizer,
+        which then skips re-embedding them.
+        """
+        try:
+            if not self.is_document(doc_id):
+                return None
+            with self.transaction():
+                for node_id in self.get_document_nodes(doc_id):
+                    self.remove_node(node_id, doc_id)
+                if self.add_document(document_data, doc_id) is None:
+                    raise ValueError("new document data could not be added")
+            log_info(f"Updated document {doc_id} in graph")
+            return doc_id
+        except Exception as e:
+            log_error(f"Error updating document {doc_id} in graph: {str(e)}")
+            return None
+
     def _process_tables(self, doc_id: str, tables: list):
         """Process table data and add to graph."""
         for idx, table in enumerate(tables):
             table_id = f"{doc_id}_table_{idx}"
-            self.knowledge_graph['nodes'][table_id] = {
+            table_node = {
                 'type': 'table',
-                'content': table
+                'content': table,
+                'document_id': doc_id
             }
-            self.knowledge_graph['edges'].append({
-                'source': doc_id,
-                'target': table_id,
-                'attributes': {'type': 'has_table'}
-            })
+            self._add_chunks(doc_id, table_id, table_node)
+            self.add_node(table_id, table_node)
+            self.add_edge(doc_id, table_id, 'has_table')
 
     def _process_excel_sheets(self, doc_id: str, sheets: Dict[str, Any]):
         """Process Excel sheets and add to graph."""
         for sheet_name, data in sheets.items():
             sheet_id = f"{doc_id}_sheet_{sheet_name}"
-            self.knowledge_graph['nodes'][sheet_id] = {
+            sheet_node = {
                 'type': 'sheet',
                 'content': data,
-                'sheet_name': sheet_name
+                'sheet_name': sheet_name,
+                'document_id': doc_id
             }
-            self.knowledge_graph['edges'].append({
-                'source': doc_id,
-                'target': sheet_id,
-                'attributes': {'type': 'has_sheet'}
+            self._add_chunks(doc_id, sheet_id, sheet_node)
+            self.add_node(sheet_id, sheet_node)
+            self.add_edge(doc_id, sheet_id, 'has_sheet')
+
+    def _process_column_sets(self, doc_id: str, relationships: List[Dict[str, Any]]):
+        """Store each sheet's column set as one hyperedge node, without expanding its pairs."""
+        for record in relationships:
+            if record.get('type') != 'column_set':
+                continue
+            sheet_id = f"{doc_id}_sheet_{record['sheet']}"
+            column_set_id = f"{sheet_id}_columns"
+            self.add_node(column_set_id, {
+                'type': 'column_set',
+                'relation': record['relation'],
+                'columns': record['columns'],
+                'sheet_name': record['sheet'],
+                'document_id': doc_id
+            })
+            self.add_edge(sheet_id, column_set_id, 'has_columns')
+
+    def _add_chunks(self, doc_id: str, parent_id: str, parent: Dict[str, Any]):
+        """Stream a node's content into chunk nodes linked to it, if it exceeds one chunk.
+
+        Content that fits in one chunk stays on the parent and is embedded
+        with it. Otherwise the parent is flagged as ``chunked`` so only its
+        chunks get embedded. Call this before adding the parent so listeners
+        see the final flags.
+        """
+        chunks = self.chunker.iter_chunks(parent.get('content'))
+        head = list(islice(chunks, 2))
+        if len(head) < 2:
+            return
+        count = 0
+        for idx, text in enumerate(chain(head, chunks)):
+            chunk_id = f"{parent_id}_chunk_{idx}"
+            self.add_node(chunk_id, {
+                'type': 'chunk',
+                'content': text,
+                'parent': parent_id,
+                'chunk_index': idx,
+                'document_id': doc_id
             })
+            self.add_edge(parent_id, chunk_id, 'has_chunk')
+            count += 1
+        parent['chunked'] = True
+        parent['chunk_count'] = count
+
+    def register_document(self, doc_id: str, content_hash: Optional[str] = None):
+        """Make a document findable by its content hash.
+
+        Call this once the document is fully indexed, so an upload that
+        failed part way is not reported as a duplicate afterwards.
+        """
+        content_hash = content_hash or self.graph.attribute(doc_id, 'content_hash')
+        if content_hash:
+            self._write(self._apply_register, content_hash, doc_id)
+
+    def _apply_register(self, content_hash: str, doc_id: str):
+        if not self.is_document(doc_id) or self.graph.attribute(doc_id, 'content_hash') != content_hash:
+            return
+        self.document_hashes[content_hash] = doc_id
+        self._notify('document_registered', content_hash, doc_id)
+
+    def find_document(self, content_hash: str) -> Optional[str]:
+        """Id of the latest registered document built from a file with this content hash."""
+        return self.document_hashes.get(content_hash)
+
+    def get_document_nodes(self, doc_id: str) -> List[str]:
+        """Get the ids of all nodes created for a document."""
+        return list(self.document_nodes.get(doc_id, ()))
+
+    def _adjacent(self, node_id: str, direction: str, edge_type: Optional[str]) -> Iterator[str]:
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        for side in (('out', 'in') if direction == 'both' else (direction,)):
+            yield from self.graph.adjacent(node_id, side, edge_type)
+
+    def get_neighbors(self, node_id: str, direction: str = 'out', edge_type: Optional[str] = None) -> List[str]:
+        """Distinct neighbours of a node, optionally only along one edge type."""
+        return list(dict.fromkeys(self._adjacent(node_id, direction, edge_type)))
+
+    def degree(self, node_id: str, direction: str = 'both', edge_type: Optional[str] = None) -> int:
+        """Number of edges at a node, counted from the adjacency indexes."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        return sum(self.graph.degree(node_id, side, edge_type)
+                   for side in (('out', 'in') if direction == 'both' else (direction,)))
+
+    def k_hop(self, node_id: str, hops: int = 1, direction: str = 'out',
+              edge_type: Optional[str] = None) -> Dict[str, int]:
+        """Nodes within ``hops`` edges of a node, mapped to their distance.
+
+        Breadth-first over the adjacency indexes, so the cost depends on the
+        size of the neighbourhood, not of the graph.
+        """
+        distances = {node_id: 0}
+        frontier = deque([node_id])
+        while frontier:
+            current = frontier.popleft()
+            if distances[current] >= hops:
+                continue
+            for neighbour in self._adjacent(current, direction, edge_type):
+                if neighbour not in distances:
+                    distances[neighbour] = distances[current] + 1
+                    frontier.append(neighbour)
+        del distances[node_id]
+        return distances
 
     def get_graph(self) -> Dict[str, Any]:
-        """Get the current state of the knowledge graph."""
-        return self.knowledge_graph
+        """Get the current state of the knowledge graph.
+
+        ``nodes`` and ``edges`` are read-only views over the compact store
+        that build each node or edge dict when it is accessed.
+        """
+        return {
+            'nodes': self.graph.nodes,
+            'edges': self.graph.edges,
+            'metadata': self.metadata
+        }
+
+    def export_graph(self) -> Dict[str, Any]:
+        """Export the graph as plain dicts and lists, e.g. for JSON."""
+        return {
+            'nodes': dict(self.graph.nodes.items()),
+            'edges': list(self.graph.edges),
+            'metadata': dict(self.metadata)
+        }
+
+    def checkpoint(self) -> int:
+        """Current change clock; pass it to ``changed_since`` later.
+
+        Checkpoints are only valid within one process, because recovering
+        the graph from its store replays every change.
+        """
+        return self.graph.clock
+
+    def changed_since(self, checkpoint: int) -> Dict[str, Any]:
+        """Nodes changed after a checkpoint, with all of their outgoing edges.
+
+        Shaped like ``get_graph``; ``nodes`` and ``edges`` are built on access.
+        ``removed`` lists the ids of nodes removed since and not added again.
+        Raises ``ValueError`` for a checkpoint older than the last compaction.
+        """
+        if checkpoint < self.graph.horizon:
+            raise ValueError(f"Checkpoint {checkpoint} predates the last compaction at {self.graph.horizon}")
+        node_ids = self.graph.changed_nodes(checkpoint)
+        return {
+            'nodes': NodesView(self.graph, node_ids),
+            'edges': self.graph.changed_edges(checkpoint),
+            'removed': self.graph.removed_nodes(checkpoint),
+            'metadata': self.metadata
+        }
 
     def clear_graph(self):
         """Clear the knowledge graph."""
-        self.knowledge_graph = {
-            'nodes': {},
-            'edges': [],
-            'metadata': {}
-        }
\ No newline at end of file
+        with self._write_lock:
+            self.graph = CompactGraph(clock=self.graph.clock)
+            self.metadata = {}
+            self.document_nodes = {}
+            self.document_hashes = {}
+            self._notify('graph_cleared')
+
+    def compact(self) -> bool:
+        """Rebuild the graph without removed nodes and edges, freeing their ids.
+
+        Holds the write lock, so commits wait while reads carry on over the
+        old graph until the new one is swapped in.
+        """
+        with self._write_lock:
+            try:
+                graph = self.graph
+                dropped = len(graph.ids) - graph.node_count
+                self.graph = graph.compacted()
+                self._notify('graph_compacted')
+                log_info(f"Compacted knowledge graph: {dropped} dead ids dropped, {len(self.graph.ids)} kept")
+                return True
+            except Exception as e:
+                log_error(f"Error compacting knowledge graph: {str(e)}")
+                return False
+
+    def maybe_compact(self, ratio: float = GRAPH_COMPACTION_RATIO,
+                      min_nodes: int = GRAPH_COMPACTION_MIN_NODES) -> bool:
+        """Start compaction in a background thread once dead ids and edges pass ``ratio`` of the slots.
+
+        Returns whether a compaction was started; at most one runs at a time.
+        """
+        if len(self.graph.ids) < min_nodes or self.graph.dead_fraction() <= ratio:
+            return False
+        with self._compactor_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return False
+            self._compactor = threading.Thread(target=self.compact, name='graph-compaction', daemon=True)
+            self._compactor.start()
+        return True
@@ -28,16 +28,20 @@ class GraphManager:
             return False
 
     def update_graph(self, data: Dict[str, Any]) -> bool:
-        """Update the knowledge graph with new data."""
+        """Update the knowledge graph with new data.
+
+        Nodes and edges are added in bulk and logged once, so this is also
+        the path for large imports.
+        """
         try:
-            for node, attributes in data.get('nodes', {}).items():
-                self.add_node(node, attributes)
-            
-            for edge in data.get('edges', []):
-                self.add_edge(edge['source'], edge['target'], edge.get('attributes'))
-            
+            nodes = data.get('nodes', {})
+            edges = data.get('edges', [])
+            self.graph.add_nodes_from((node, attributes or {}) for node, attributes in nodes.items())
+            self.graph.add_edges_from((edge['source'], edge['target'], edge.get('attributes') or {})
+                                      for edge in edges)
+
             self.metadata.update(data.get('metadata', {}))
-            log_info("Graph updated successfully")
+            log_info(f"Graph updated successfully ({len(nodes)} nodes, {len(edges)} edges)")
             return True
         except Exception as e:
             log_error(f"Error updating graph: {str(e)}")
@@ -0,0 +1,309 @@
+import json
+import os
+import re
+import threading
+import time
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+from ..document_processing.tabular import json_default, json_object_hook, remove_unused_spills
+from ..core.logger import log_info, log_error
+from ..core.config import GRAPH_FSYNC, GRAPH_FSYNC_INTERVAL, GRAPH_SNAPSHOT_RECORDS, TABULAR_SPILL_PATH
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+SNAPSHOT_PATTERN = re.compile(r'^snapshot\.(\d+)\.jsonl$')
+WAL_PATTERN = re.compile(r'^wal\.(\d+)\.log$')
+
+class GraphStore:
+    """Durable knowledge graph: a write-ahead log plus periodic snapshots.
+
+    Attached to a ``GraphBuilder``, every change is logged before the call that
+    made it returns; ``fsync`` is ``always``, ``interval`` or ``never``.
+    """
+
+    def __init__(self, path: str, fsync: str = GRAPH_FSYNC, fsync_interval: float = GRAPH_FSYNC_INTERVAL,
+                 snapshot_records: int = GRAPH_SNAPSHOT_RECORDS, spill_path: str = TABULAR_SPILL_PATH):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_records = snapshot_records
+        self.generation = 0  # Generation of the log being appended to
+        self.base = 0  # Generation of the newest snapshot; logs from it on are replayed
+        self.builder = None
+        self._log = None
+        self._records = 0
+        self._unsynced = False
+        self._replaying = False
+        self._lock = threading.RLock()
+        self._snapshotter = None  # Thread writing a snapshot, if any
+        self._flusher = None
+        self._closed = threading.Event()
+        # Columnar tables in logged nodes are spilled next to the log they are referenced from
+        self.spill_paths = (os.path.join(path, 'tabular'), spill_path)
+        self._spill_default = partial(json_default, directory=self.spill_paths[0])
+        self._referenced = set()  # Spill paths referenced since the last log rotation
+
+    def _json_default(self, value: Any) -> Any:
+        encoded = self._spill_default(value)
+        if isinstance(encoded, dict) and '__tabular__' in encoded:
+            self._referenced.add(encoded['__tabular__'])
+        return encoded
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        name = f"snapshot.{generation}.jsonl" if kind == 'snapshot' else f"wal.{generation}.log"
+        return os.path.join(self.path, name)
+
+    def attach(self, builder) -> bool:
+        """Recover the graph into ``builder`` and start logging its changes.
+
+        Register other listeners (e.g. the BM25 index) before attaching so
+        they are rebuilt from the recovered nodes.
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            self.builder = builder
+            start = time.perf_counter()
+            replayed = self._recover()
+            self._log = open(self._file('wal'), 'ab')
+            builder.add_listener(self)
+            if self.fsync == 'interval':
+                self._closed.clear()
+                self._flusher = threading.Thread(target=self._flush_periodically, name='graph-store-fsync', daemon=True)
+                self._flusher.start()
+            log_info(
+                f"Recovered graph from {self.path}: {len(builder.get_graph()['nodes'])} nodes, "
+                f"{replayed} log records replayed ({time.perf_counter() - start:.2f}s)"
+            )
+            return True
+        except Exception as e:
+            log_error(f"Error recovering graph from {self.path}: {str(e)}")
+            return False
+
+    def _recover(self) -> int:
+        names = os.listdir(self.path)
+        snapshots = [int(match.group(1)) for match in map(SNAPSHOT_PATTERN.match, names) if match]
+        logs = [int(match.group(1)) for match in map(WAL_PATTERN.match, names) if match]
+        self.base = max(snapshots, default=0)
+        self.generation = max([self.base] + logs)
+        # Files a snapshot made redundant but a crash kept from being deleted
+        for generation in set(snapshots + logs):
+            if generation < self.base:
+                for kind in ('wal', 'snapshot'):
+                    if os.path.exists(self._file(kind, generation)):
+                        os.remove(self._file(kind, generation))
+
+        self._replaying = True
+        try:
+            self._records = self._load(self.builder, self.base, self.generation)
+        finally:
+            self._replaying = False
+        return self._records
+
+    def _load(self, builder, base: int, last: int) -> int:
+        """Load snapshot ``base`` into ``builder`` and replay logs ``base`` to ``last`` on top."""
+        builder.clear_graph()
+        snapshot_path = self._file('snapshot', base)
+        if os.path.exists(snapshot_path):
+            # Snapshots hold log records, read one line at a time
+            with open(snapshot_path, 'rb') as f:
+                for line in f:
+                    self._apply(builder, json.loads(line, object_hook=json_object_hook))
+        return sum(self._replay(builder, generation) for generation in range(base, last + 1))
+
+    def _replay(self, builder, generation: int) -> int:
+        """Apply one log generation, dropping a torn final record."""
+        wal_path = self._file('wal', generation)
+        if not os.path.exists(wal_path):
+            return 0
+        count = 0
+        valid_bytes = 0
+        with open(wal_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line, object_hook=json_object_hook)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._apply(builder, record)
+                valid_bytes += len(line)
+                count += 1
+        if valid_bytes < os.path.getsize(wal_path):
+            log_info(f"Discarding torn record at the end of {wal_path}")
+            with open(wal_path, 'ab') as f:
+                f.truncate(valid_bytes)
+        return count
+
+    def _apply(self, builder, record: List[Any]):
+        if record[0] == 'node':
+            builder.add_node(record[1], record[2])
+        elif record[0] == 'edge':
+            builder.add_edge(record[1], record[2], record[3])
+        elif record[0] == 'remove':
+            builder.remove_node(record[1])
+        elif record[0] == 'hash':
+            builder.register_document(record[2], record[1])
+        elif record[0] == 'clear':
+            builder.clear_graph()
+
+    def _write_record(self, f, record: List[Any]):
+        line = json.dumps(record, separators=(',', ':'), default=self._json_default)
+        f.write(line.encode('utf-8') + b'\n')
+
+    def _append(self, record: List[Any]):
+        if self._replaying or self._log is None:
+            return
+        with self._lock:
+            self._write_record(self._log, record)
+            self._log.flush()
+            if self.fsync == 'always':
+                os.fsync(self._log.fileno())
+            else:
+                self._unsynced = True
+            self._records += 1
+            if self.snapshot_records and self._records >= self.snapshot_records and self._snapshotter is None:
+                # Only the log rotation happens on the commit path
+                job = self._rotate()
+                self._snapshotter = threading.Thread(target=self._write_snapshot, args=job,
+                                                     name='graph-store-snapshot', daemon=True)
+                self._snapshotter.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.fsync_interval):
+            with self._lock:
+                if not self._unsynced or self._log is None:
+                    continue
+                # fsync a duplicate descriptor so appends are not blocked while it runs
+                fd = os.dup(self._log.fileno())
+                self._unsynced = False
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                log_error(f"Error syncing graph log: {str(e)}")
+            finally:
+                os.close(fd)
+
+    def sync(self):
+        """Force the log to stable storage."""
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._unsynced = False
+
+    def _rotate(self) -> Tuple[int, int]:
+        """Close the log and start a new generation; returns the snapshot to build as ``(base, generation)``."""
+        with self._lock:
+            if self.fsync != 'never':
+                os.fsync(self._log.fileno())
+            self._log.close()
+            self.generation += 1
+            self._log = open(self._file('wal'), 'ab')
+            self._records = 0
+            self._unsynced = False
+            self._referenced = set()
+            return self.base, self.generation
+
+    def snapshot(self) -> bool:
+        """Snapshot the graph as of now and truncate the log; returns once the snapshot is durable."""
+        while True:
+            with self._lock:
+                if self._log is None:
+                    return False
+                running = self._snapshotter
+                if running is None:
+                    job = self._rotate()
+                    self._snapshotter = threading.current_thread()
+                    break
+            running.join()
+        return self._write_snapshot(*job)
+
+    def _write_snapshot(self, base: int, generation: int) -> bool:
+        """Fold snapshot ``base`` and the logs before ``generation`` into snapshot ``generation``.
+
+        The state is rebuilt in a scratch builder, so the live graph is
+        neither locked nor read while the snapshot is written. The snapshot
+        is written as log records, one node, edge or hash per line.
+        """
+        try:
+            start = time.perf_counter()
+            scratch = type(self.builder)()
+            self._load(scratch, base, generation - 1)
+            graph = scratch.get_graph()
+            snapshot_path = self._file('snapshot', generation)
+            tmp_path = snapshot_path + '.tmp'
+            nodes = 0
+            with open(tmp_path, 'wb') as f:
+                for node_id, node_data in graph['nodes'].items():
+                    self._write_record(f, ['node', node_id, node_data])
+                    nodes += 1
+                for edge in graph['edges']:
+                    self._write_record(f, ['edge', edge['source'], edge['target'], edge['attributes'].get('type')])
+                for content_hash, doc_id in scratch.document_hashes.items():
+                    self._write_record(f, ['hash', content_hash, doc_id])
+                f.flush()
+                os.fsync(f.fileno())
+            del scratch, graph
+            os.replace(tmp_path, snapshot_path)
+            self._fsync_dir()
+
+            # The snapshot is the commit point; everything older is now redundant
+            with self._lock:
+                self.base = generation
+            for previous in range(base, generation):
+                for kind in ('wal', 'snapshot'):
+                    if os.path.exists(self._file(kind, previous)):
+                        os.remove(self._file(kind, previous))
+            # Tables of removed nodes were only referenced from the files just dropped
+            with self._lock:
+                referenced = set(self._referenced)
+            spills = sum(remove_unused_spills(directory, referenced) for directory in self.spill_paths)
+
+            log_info(f"Wrote graph snapshot {generation} ({nodes} nodes, "
+                     f"{spills} unused table spills removed, {time.perf_counter() - start:.2f}s)")
+            return True
+        except Exception as e:
+            log_error(f"Error writing graph snapshot: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._snapshotter = None
+
+    def _fsync_dir(self):
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(self.path, os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def close(self):
+        """Wait for a running snapshot, then sync and close the log."""
+        self._closed.set()
+        for thread in (self._snapshotter, self._flusher):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+        with self._lock:
+            if self._log is not None:
+                self.sync()
+                self._log.close()
+                self._log = None
+
+    # GraphBuilder listener hooks
+
+    def node_added(self, node_id: str, node_data: Dict[str, Any]):
+        self._append(['node', node_id, node_data])
+
+    def edge_added(self, edge: Dict[str, Any]):
+        self._append(['edge', edge['source'], edge['target'], edge['attributes'].get('type')])
+
+    def node_removed(self, node_id: str):
+        self._append(['remove', node_id])
+
+    def document_registered(self, content_hash: str, doc_id: str):
+        self._append(['hash', content_hash, doc_id])
+
+    def graph_cleared(self):
+        self._append(['clear'])
\ No newline at end of file
@@ -1,8 +1,27 @@
+import io
+import re
 from rdflib import Graph, Literal, RDF, URIRef
 from rdflib.namespace import RDFS, XSD
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from .graph_manager import GraphManager
 from ..core.logger import log_info, log_error
 
+STREAM_FORMATS = ('nt', 'nquads')
+
+# Characters that must be escaped in N-Triples literals and IRIs
+LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+IRI_UNSAFE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+
+def nt_iri(uri: str) -> str:
+    """An IRI term, percent-encoding characters N-Triples does not allow."""
+    return '<' + IRI_UNSAFE.sub(lambda m: ''.join(f'%{b:02X}' for b in m.group().encode('utf-8')), uri) + '>'
+
+def nt_literal(value: Any) -> str:
+    """A literal term with the lexical form and datatype rdflib's ``Literal`` would give."""
+    literal = Literal(value)
+    lexical = '"' + str(literal).translate(LITERAL_ESCAPES) + '"'
+    return lexical + f'^^<{literal.datatype}>' if literal.datatype is not None else lexical
+
 class RDFConverter:
     def __init__(self, graph):
         self.graph = graph
@@ -55,6 +74,101 @@ class RDFConverter:
             log_error(f"Error converting to RDF: {str(e)}")
             return None
 
+    def _source(self, since: Optional[int]) -> Tuple[Iterable[Tuple[str, Dict[str, Any]]], Iterable[Dict[str, Any]]]:
+        """Node and edge iterators read in place, without an ``export_graph`` copy."""
+        if since is not None:
+            if not hasattr(self.graph, 'changed_since'):
+                raise ValueError("Incremental export needs a graph that tracks changes")
+            changes = self.graph.changed_since(since)
+            return changes['nodes'].items(), changes['edges']
+        if hasattr(self.graph, 'get_graph'):
+            graph_data = self.graph.get_graph()
+            return graph_data['nodes'].items(), graph_data['edges']
+        if isinstance(self.graph, GraphManager):
+            return self.graph.graph.nodes(data=True), (
+                {'source': s, 'target': t, 'attributes': d} for s, t, d in self.graph.graph.edges(data=True))
+        graph_data = self.graph.export_graph()
+        return graph_data['nodes'].items(), graph_data['edges']
+
+    def iter_triples(self, since: Optional[int] = None, graph_name: Optional[str] = None) -> Iterator[str]:
+        """Yield the graph as N-Triples lines, or N-Quads lines in ``graph_name``.
+
+        The triples are the ones ``convert_to_rdf`` builds, produced one
+        node at a time. With ``since`` (a ``checkpoint()`` of the graph) only
+        the nodes changed after it are emitted, with all of their outgoing
+        edges, so a consumer can replace every triple of those subjects.
+        An unusable ``since`` raises ``ValueError`` here, before any line
+        is yielded.
+        """
+        return self._triples(*self._source(since), graph_name)
+
+    def _triples(self, nodes: Iterable[Tuple[str, Dict[str, Any]]], edges: Iterable[Dict[str, Any]],
+                 graph_name: Optional[str]) -> Iterator[str]:
+        end = f" {nt_iri(graph_name)} .\n" if graph_name else " .\n"
+        rdf_type = nt_iri(str(RDF.type))
+        for node_id, attributes in nodes:
+            subject = nt_iri(self.create_uri(node_id))
+            yield f"{subject} {rdf_type} {nt_iri(self.create_uri(attributes.get('type', 'Entity')))}{end}"
+            for key, value in attributes.items():
+                if key != 'type':
+                    yield f"{subject} {nt_iri(self.create_uri(key))} {nt_literal(value)}{end}"
+        for edge in edges:
+            subject, target = nt_iri(self.create_uri(edge['source'])), nt_iri(self.create_uri(edge['target']))
+            for key in edge.get('attributes', {}):
+                yield f"{subject} {nt_iri(self.create_uri(key))} {target}{end}"
+
+    def removed_subjects(self, since: int) -> List[str]:
+        """URIs of the subjects removed after a ``checkpoint()``.
+
+        ``iter_triples(since)`` cannot express removals, so a consumer
+        drops every triple of these subjects instead.
+        """
+        if not hasattr(self.graph, 'changed_since'):
+            raise ValueError("Incremental export needs a graph that tracks changes")
+        return [str(self.create_uri(node_id)) for node_id in self.graph.changed_since(since)['removed']]
+
+    def write_stream(self, destination: Any, format: str = 'nt', since: Optional[int] = None,
+                     graph_name: Optional[str] = None, batch_lines: int = 1024) -> bool:
+        """Stream the graph as N-Triples or N-Quads to a path, file object or socket.
+
+        Lines are written in batches as they are generated, so memory stays
+        flat however large the graph is.
+        """
+        if format not in STREAM_FORMATS:
+            log_error(f"Unsupported stream format: {format}")
+            return False
+        if format == 'nquads':
+            graph_name = graph_name or f"{self.namespace}graph"
+        close = isinstance(destination, str) or hasattr(destination, 'sendall')
+        try:
+            if isinstance(destination, str):
+                out = open(destination, 'wb')
+            elif hasattr(destination, 'sendall'):
+                out = destination.makefile('wb')
+            else:
+                out = destination
+            text = isinstance(out, io.TextIOBase)
+            count, batch = 0, []
+            try:
+                for line in self.iter_triples(since, graph_name if format == 'nquads' else None):
+                    batch.append(line)
+                    if len(batch) >= batch_lines:
+                        out.write(''.join(batch) if text else ''.join(batch).encode('utf-8'))
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    out.write(''.join(batch) if text else ''.join(batch).encode('utf-8'))
+                    count += len(batch)
+                out.flush()
+            finally:
+                if close:
+                    out.close()
+            log_info(f"Streamed {count} RDF statements ({format})")
+            return True
+        except Exception as e:
+            log_error(f"Error streaming RDF: {str(e)}")
+            return False
+
     def save_to_file(self, file_path: str, format: str = 'turtle') -> bool:
         """Save the RDF graph to a file."""
         try:
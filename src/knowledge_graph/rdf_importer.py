@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from rdflib import BNode, Graph, Literal, RDF, URIRef
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .graph_manager import GraphManager
+from ..core.logger import log_info, log_error
+from ..core.config import RDF_IMPORT_BATCH_TRIPLES, RDF_IMPORT_CHUNK_BYTES, RDF_IMPORT_PROCESSES
+
+LINE_FORMATS = ('nt', 'nquads')
+DEFAULT_NAMESPACE = "http://example.org/kg/"
+
+# One N-Triples/N-Quads statement: subject, predicate, object and an ignored graph label
+_NT_LINE = re.compile(
+    r'\s*(?:<([^>]*)>|_:(\S+))'
+    r'\s+<([^>]*)>'
+    r'\s+(?:<([^>]*)>|_:(\S+)|"((?:[^"\\]|\\.)*)"(?:@([A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^<([^>]*)>)?)'
+    r'\s*(?:(?:<[^>]*>|_:\S+)\s*)?\.\s*$'
+)
+_ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+# A parsed statement: (subject, predicate, object, object_is_literal);
+# resources are IRIs or '_:label' blank nodes, literals are Python values
+Triple = Tuple[str, str, Any, bool]
+
+def _unescape(text: str) -> str:
+    if '\\' not in text:
+        return text
+    return _ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None
+                       else _ESCAPES.get(m.group(3), m.group(3)), text)
+
+def _literal_value(lexical: str, language: Optional[str], datatype: Optional[str]) -> Any:
+    literal = Literal(lexical, lang=language, datatype=URIRef(datatype) if datatype else None)
+    value = literal.toPython()
+    return str(value) if isinstance(value, Literal) else value
+
+def parse_nt_line(line: str) -> Optional[Triple]:
+    """Parse one N-Triples or N-Quads line; None for blank, comment or malformed lines."""
+    if not line.strip() or line.lstrip().startswith('#'):
+        return None
+    match = _NT_LINE.match(line)
+    if match is None:
+        return None
+    s_iri, s_bnode, predicate, o_iri, o_bnode, lexical, language, datatype = match.groups()
+    subject = _unescape(s_iri) if s_iri is not None else f"_:{s_bnode}"
+    if lexical is not None:
+        return subject, _unescape(predicate), _literal_value(_unescape(lexical), language, datatype), True
+    return subject, _unescape(predicate), _unescape(o_iri) if o_iri is not None else f"_:{o_bnode}", False
+
+def add_value(attributes: Dict[str, Any], key: str, value: Any):
+    """Set an attribute, collecting the distinct values of a repeated predicate into a list."""
+    if key not in attributes:
+        attributes[key] = value
+        return
+    current = attributes[key]
+    values = list(current) if isinstance(current, list) else [current]
+    for item in value if isinstance(value, list) else [value]:
+        if item not in values:
+            values.append(item)
+    attributes[key] = values if len(values) > 1 else values[0]
+
+def group_triples(triples: Iterable[Triple], namespace: str = DEFAULT_NAMESPACE) -> Dict[str, Any]:
+    """Group statements by subject into ``update_graph`` data.
+
+    This inverts ``RDFConverter``: ``rdf:type`` gives the node ``type``,
+    literal objects become attributes and resource objects become edges
+    typed by their predicate. IRIs in ``namespace`` are shortened to their
+    local name. A predicate repeated with different literals becomes a list.
+    """
+    nodes: Dict[str, Dict[str, Any]] = {}
+    edges: List[Dict[str, Any]] = []
+    rdf_type = str(RDF.type)
+    shorten = lambda iri: iri[len(namespace):] if namespace and iri.startswith(namespace) else iri
+    for subject, predicate, obj, is_literal in triples:
+        attributes = nodes.setdefault(shorten(subject), {})
+        if is_literal:
+            add_value(attributes, shorten(predicate), obj)
+        elif predicate == rdf_type:
+            attributes['type'] = shorten(obj)
+        else:
+            edges.append({'source': shorten(subject), 'target': shorten(obj),
+                          'attributes': {'type': shorten(predicate)}})
+    return {'nodes': nodes, 'edges': edges}
+
+def _parse_chunk(path: str, start: int, stop: int, namespace: str) -> Tuple[Dict[str, Any], int, int]:
+    """Worker task: parse and group the lines in bytes ``[start, stop)`` of a file."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        # Split on b'\n' only: str.splitlines would also break on U+2028 and U+0085 inside literals
+        lines = f.read(stop - start).split(b'\n')
+    triples, skipped = [], 0
+    for line in (raw.decode('utf-8') for raw in lines):
+        triple = parse_nt_line(line)
+        if triple is not None:
+            triples.append(triple)
+        elif line.strip() and not line.lstrip().startswith('#'):
+            skipped += 1
+    return group_triples(triples, namespace), len(triples), skipped
+
+class RDFImporter:
+    """Bulk loader of RDF dumps into a ``GraphManager``.
+
+    N-Triples and N-Quads are applied in batches of ``batch_triples``; other
+    formats are parsed whole by rdflib.
+    """
+
+    def __init__(self, manager: GraphManager, namespace: str = DEFAULT_NAMESPACE,
+                 batch_triples: int = RDF_IMPORT_BATCH_TRIPLES, chunk_bytes: int = RDF_IMPORT_CHUNK_BYTES,
+                 processes: int = RDF_IMPORT_PROCESSES):
+        self.manager = manager
+        self.namespace = namespace
+        self.batch_triples = batch_triples
+        self.chunk_bytes = chunk_bytes
+        self.processes = processes
+
+    def import_file(self, file_path: str, format: Optional[str] = None) -> int:
+        """Load a dump and return the number of statements imported, or -1 on error.
+
+        ``format`` defaults from the extension: ``.nt``/``.nq`` are streamed,
+        anything else is handed to rdflib.
+        """
+        try:
+            if format is None:
+                extension = os.path.splitext(file_path)[1].lower()
+                format = {'.nt': 'nt', '.nq': 'nquads', '.ttl': 'turtle'}.get(extension, 'turtle')
+            if format not in LINE_FORMATS:
+                count = self._apply_batches(self._rdflib_triples(file_path, format))
+            elif self.processes > 1:
+                count = self._import_parallel(file_path)
+            else:
+                count = self._apply_batches(self._line_triples(file_path))
+            log_info(f"Imported {count} RDF statements from {file_path}")
+            return count
+        except Exception as e:
+            log_error(f"Error importing RDF from {file_path}: {str(e)}")
+            return -1
+
+    def _line_triples(self, file_path: str) -> Iterator[Triple]:
+        skipped = 0
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                triple = parse_nt_line(line)
+                if triple is not None:
+                    yield triple
+                elif line.strip() and not line.lstrip().startswith('#'):
+                    skipped += 1
+        if skipped:
+            log_error(f"Skipped {skipped} malformed lines in {file_path}")
+
+    def _rdflib_triples(self, file_path: str, format: str) -> Iterator[Triple]:
+        graph = Graph()
+        graph.parse(file_path, format=format)
+        term = lambda node: f"_:{node}" if isinstance(node, BNode) else str(node)
+        for subject, predicate, obj in graph:
+            if isinstance(obj, Literal):
+                value = obj.toPython()
+                yield term(subject), str(predicate), str(value) if isinstance(value, Literal) else value, True
+            else:
+                yield term(subject), str(predicate), term(obj), False
+
+    def _apply_batches(self, triples: Iterable[Triple]) -> int:
+        count, batch = 0, []
+        for triple in triples:
+            batch.append(triple)
+            if len(batch) >= self.batch_triples:
+                self._apply(group_triples(batch, self.namespace))
+                count += len(batch)
+                batch = []
+        if batch:
+            self._apply(group_triples(batch, self.namespace))
+            count += len(batch)
+        return count
+
+    def _apply(self, data: Dict[str, Any]):
+        # A subject's statements may straddle batches; merge its repeated predicates with the earlier values
+        graph = self.manager.graph
+        for node_id, attributes in data['nodes'].items():
+            if not graph.has_node(node_id):
+                continue
+            existing = graph.nodes[node_id]
+            for key in [key for key in attributes if key != 'type' and key in existing]:
+                merged = {key: existing[key]}
+                add_value(merged, key, attributes[key])
+                attributes[key] = merged[key]
+        if not self.manager.update_graph(data):
+            raise RuntimeError("GraphManager rejected an import batch")
+
+    def _chunks(self, file_path: str) -> List[Tuple[int, int]]:
+        """Byte ranges of about ``chunk_bytes`` that end on line boundaries."""
+        size = os.path.getsize(file_path)
+        bounds = [0]
+        with open(file_path, 'rb') as f:
+            while bounds[-1] < size:
+                f.seek(min(bounds[-1] + self.chunk_bytes, size))
+                f.readline()
+                bounds.append(min(f.tell(), size))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _import_parallel(self, file_path: str) -> int:
+        count = skipped = 0
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as pool:
+            # Keep a bounded number of parsed chunks in flight and apply them in order
+            pending = deque()
+            for start, stop in self._chunks(file_path):
+                pending.append(pool.submit(_parse_chunk, file_path, start, stop, self.namespace))
+                if len(pending) >= 2 * self.processes:
+                    count, skipped = self._apply_chunk(pending.popleft().result(), count, skipped)
+            while pending:
+                count, skipped = self._apply_chunk(pending.popleft().result(), count, skipped)
+        if skipped:
+            log_error(f"Skipped {skipped} malformed lines in {file_path}")
+        return count
+
+    def _apply_chunk(self, result: Tuple[Dict[str, Any], int, int], count: int, skipped: int) -> Tuple[int, int]:
+        data, parsed, bad = result
+        self._apply(data)
+        return count + parsed, skipped + bad
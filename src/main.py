@@ -1,26 +1,67 @@
 from flask import Flask, request, jsonify
-from core.config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, HF_API_KEY, HF_MODEL_ID
+from core.config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, HF_API_KEY, HF_MODEL_ID, VECTOR_STORE_PATH, GRAPH_STORE_PATH, PRELOAD_MODELS, \
+    CONTEXT_HOPS, CONTEXT_NEIGHBORS, GRAPH_MAX_HOPS
 from core.logger import log_info, log_error
+from core.concurrency import KeyedLocks
 from document_processing.document_parser import DocumentParser
+from document_processing.tabular import install_json_default
 from knowledge_graph.graph_builder import GraphBuilder
+from knowledge_graph.graph_store import GraphStore
 from knowledge_graph.rdf_converter import RDFConverter
+from knowledge_graph.centrality import PageRankCache
 from vector_db.vectorizer import Vectorizer
-from vector_db.retriever import Retriever
+from vector_db.retriever import Retriever, SEARCH_MODES
+from vector_db.bm25 import BM25Index
+from vector_db.model_registry import model_registry
+from vector_db.filters import parse_filters, parse_count
 from llm.mistral_client import MistralClient
+from typing import Optional
+import atexit
 import os
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+install_json_default(app)
 
-# Initialize components
-document_parser = DocumentParser()
-graph_builder = GraphBuilder()
-vectorizer = Vectorizer()
-retriever = Retriever(vectorizer)
-mistral_client = MistralClient(
-    api_key=os.getenv('HF_API_KEY', HF_API_KEY),
-    model_id=os.getenv('HF_MODEL_ID', HF_MODEL_ID)
-)
+# Components are built by create_app(), not at import: sharded search workers
+# are spawned processes that re-import this script, and must not recover or
+# truncate the graph and vector stores
+document_parser = graph_builder = lexical_index = context_ranker = graph_store = None
+vectorizer = retriever = mistral_client = None
+upload_locks = KeyedLocks()  # Per content hash, so identical concurrent uploads are processed once
+document_locks = KeyedLocks()  # Per document id, so updates and deletes of one document do not interleave
+
+def create_app() -> Flask:
+    """Initialize components, recovering the graph and vector stores, and return the app."""
+    global document_parser, graph_builder, lexical_index, context_ranker, graph_store
+    global vectorizer, retriever, mistral_client
+    document_parser = DocumentParser()
+    graph_builder = GraphBuilder()
+    lexical_index = BM25Index()
+    graph_builder.add_listener(lexical_index)
+    context_ranker = PageRankCache(graph_builder)
+    graph_builder.add_listener(context_ranker)
+    graph_store = GraphStore(GRAPH_STORE_PATH)
+    graph_store.attach(graph_builder)
+    vectorizer = Vectorizer(store_path=VECTOR_STORE_PATH)
+    atexit.register(vectorizer.close)
+    retriever = Retriever(vectorizer, lexical_index=lexical_index)
+    atexit.register(retriever.close)
+    if PRELOAD_MODELS:
+        model_registry.warm_up(freeze=True)
+    mistral_client = MistralClient(
+        api_key=os.getenv('HF_API_KEY', HF_API_KEY),
+        model_id=os.getenv('HF_MODEL_ID', HF_MODEL_ID)
+    )
+    return app
+
+def remove_unused_upload(content_hash: str, file_path: Optional[str]):
+    """Delete a stored upload unless a registered document was built from the same content.
+
+    The caller holds the content hash's upload lock.
+    """
+    if graph_builder.find_document(content_hash) is None:
+        document_parser.remove_upload(file_path)
 
 @app.route('/upload', methods=['POST'])
 def upload_document():
@@ -35,45 +76,168 @@ def upload_document():
         return jsonify({'error': 'Invalid file type'}), 400
 
     try:
-        # Save and process file
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        
-        # Parse document
-        parsed_data = document_parser.extract_data(file_path)
-        if not parsed_data:
-            return jsonify({'error': 'Failed to parse document'}), 500
+        # Save the file under its content hash; known content skips parsing and embedding
+        force = request.values.get('force', '').lower() in ('1', 'true', 'yes')
+        received = document_parser.receive_upload(file, app.config['UPLOAD_FOLDER'])
+        if not received:
+            return jsonify({'error': 'Failed to save document'}), 500
+        tmp_path, content_hash = received
 
-        # Update knowledge graph
-        graph_builder.update_graph(parsed_data)
-        
-        # Update vector database
-        vectorizer.convert_to_vector(graph_builder.get_graph())
+        with upload_locks.hold(content_hash):
+            file_path = document_parser.store_upload(tmp_path, content_hash, file.filename, app.config['UPLOAD_FOLDER'])
+            doc_id = None if force else graph_builder.find_document(content_hash)
+            if doc_id:
+                log_info(f"Skipping already processed upload {file.filename} ({doc_id})")
+                return jsonify({'message': 'Document already processed', 'document_id': doc_id,
+                                'duplicate': True}), 200
 
-        return jsonify({'message': 'Document processed successfully'}), 200
+            # Parse document
+            parsed_data = document_parser.extract_data(file_path)
+            if not parsed_data:
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to parse document'}), 500
+            parsed_data['metadata'].update({'content_hash': content_hash, 'file_name': file.filename})
+
+            # Update knowledge graph
+            doc_id = graph_builder.add_document(parsed_data)
+            if not doc_id:
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to add to knowledge graph'}), 500
+
+            # Update vector database with the new document's nodes only
+            node_ids = graph_builder.get_document_nodes(doc_id)
+            if not vectorizer.vectorize_nodes(graph_builder.get_graph(), node_ids) or not vectorizer.flush():
+                # Roll back so a retry processes the file again instead of reporting a duplicate
+                graph_builder.remove_document(doc_id)
+                vectorizer.remove_nodes(node_ids)
+                remove_unused_upload(content_hash, file_path)
+                return jsonify({'error': 'Failed to update vector database'}), 500
+            graph_builder.register_document(doc_id)
+
+        return jsonify({'message': 'Document processed successfully', 'document_id': doc_id,
+                        'duplicate': False}), 200
 
     except Exception as e:
         log_error(f"Error processing upload: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/documents/<doc_id>', methods=['PUT'])
+def update_document(doc_id):
+    if not graph_builder.is_document(doc_id):
+        return jsonify({'error': 'Document not found'}), 404
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+
+    if not document_parser.validate_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    try:
+        force = request.values.get('force', '').lower() in ('1', 'true', 'yes')
+        received = document_parser.receive_upload(file, app.config['UPLOAD_FOLDER'])
+        if not received:
+            return jsonify({'error': 'Failed to save document'}), 500
+        tmp_path, content_hash = received
+
+        with document_locks.hold(doc_id), upload_locks.hold(content_hash):
+            file_path = document_parser.store_upload(tmp_path, content_hash, file.filename, app.config['UPLOAD_FOLDER'])
+            if not graph_builder.is_document(doc_id):
+                return jsonify({'error': 'Document not found'}), 404
+            if not force and graph_builder.find_document(content_hash) == doc_id:
+                return jsonify({'message': 'Document unchanged', 'document_id': doc_id, 'unchanged': True}), 200
+
+            parsed_data = document_parser.extract_data(file_path)
+            if not parsed_data:
+                return jsonify({'error': 'Failed to parse document'}), 500
+            parsed_data['metadata'].update({'content_hash': content_hash, 'file_name': file.filename})
+
+            # Replace the document's nodes, then re-embed only the ones whose content changed
+            old_ids = graph_builder.get_document_nodes(doc_id)
+            old_hash = graph_builder.graph.attribute(doc_id, 'content_hash')
+            old_path = graph_builder.graph.attribute(doc_id, 'file_path')
+            if not graph_builder.update_document(doc_id, parsed_data):
+                return jsonify({'error': 'Failed to update knowledge graph'}), 500
+            node_ids = list(dict.fromkeys(old_ids + graph_builder.get_document_nodes(doc_id)))
+            if not vectorizer.vectorize_nodes(graph_builder.get_graph(), node_ids) or not vectorizer.flush():
+                return jsonify({'error': 'Failed to update vector database'}), 500
+            graph_builder.register_document(doc_id)
+
+        if old_hash and old_hash != content_hash:
+            with upload_locks.hold(old_hash):
+                remove_unused_upload(old_hash, old_path)
+        vectorizer.maybe_compact()
+        lexical_index.maybe_compact()
+        graph_builder.maybe_compact()
+        return jsonify({'message': 'Document updated successfully', 'document_id': doc_id,
+                        'unchanged': False}), 200
+
+    except Exception as e:
+        log_error(f"Error updating document {doc_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/documents/<doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    try:
+        with document_locks.hold(doc_id):
+            if not graph_builder.is_document(doc_id):
+                return jsonify({'error': 'Document not found'}), 404
+            node_ids = graph_builder.get_document_nodes(doc_id)
+            content_hash = graph_builder.graph.attribute(doc_id, 'content_hash')
+            file_path = graph_builder.graph.attribute(doc_id, 'file_path')
+            if not graph_builder.remove_document(doc_id):
+                return jsonify({'error': 'Failed to remove from knowledge graph'}), 500
+            vectorizer.remove_nodes(node_ids)
+            if not vectorizer.flush():
+                return jsonify({'error': 'Failed to update vector database'}), 500
+
+        if content_hash:
+            with upload_locks.hold(content_hash):
+                remove_unused_upload(content_hash, file_path)
+        # Space held by tombstoned rows, retired BM25 documents and removed nodes is reclaimed in the background
+        vectorizer.maybe_compact()
+        lexical_index.maybe_compact()
+        graph_builder.maybe_compact()
+        return jsonify({'message': 'Document deleted successfully', 'document_id': doc_id,
+                        'removed_nodes': len(node_ids)}), 200
+
+    except Exception as e:
+        log_error(f"Error deleting document {doc_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/query', methods=['POST'])
 def query_knowledge_base():
     data = request.get_json()
     if not data or 'query' not in data:
         return jsonify({'error': 'No query provided'}), 400
+    try:
+        filters = parse_filters(data.get('filters'))
+        top_k = parse_count(data.get('top_k'), 'top_k', 5, minimum=1)
+        context_hops = min(parse_count(data.get('context_hops'), 'context_hops', CONTEXT_HOPS), GRAPH_MAX_HOPS)
+        context_neighbors = parse_count(data.get('context_neighbors'), 'context_neighbors', CONTEXT_NEIGHBORS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    mode = data.get('mode', 'vector')
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f'mode must be one of {", ".join(SEARCH_MODES)}'}), 400
 
     try:
-        # Get similar nodes from vector database
-        similar_nodes = retriever.get_similar_nodes(data['query'])
+        # Get similar nodes from vector database, restricted by any filters
+        similar_nodes = retriever.get_similar_nodes(data['query'], top_k, filters, mode)
         
-        # Get context from similar nodes
+        # Get context from similar nodes, each with its most central graph neighbours
+        neighbors = context_ranker.expand([node_id for node_id, _ in similar_nodes],
+                                          context_hops, context_neighbors)
         context = []
         for node_id, score in similar_nodes:
             node_info = retriever.get_node_info(node_id)
             context.append({
                 'node_id': node_id,
                 'similarity': score,
-                'info': node_info
+                'info': node_info,
+                'neighbors': neighbors[node_id]
             })
 
         # Generate response using Mistral
@@ -93,4 +257,4 @@ def query_knowledge_base():
 if __name__ == '__main__':
     # Create upload folder if it doesn't exist
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
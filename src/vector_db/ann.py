@@ -0,0 +1,258 @@
+import argparse
+import os
+import threading
+import time
+from array import array
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .index import VectorIndex
+from ..core.logger import log_info, log_error
+from ..core.config import IVF_NLIST, IVF_NPROBE
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over a ``VectorIndex``.
+
+    A query only scores the rows in its ``nprobe`` nearest cells; ``sync``
+    assigns new rows and ``rebuild`` retrains the centroids.
+    """
+
+    def __init__(self, vectors: VectorIndex, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE,
+                 train_sample: int = 64, n_iter: int = 10, seed: int = 0, compressed=None):
+        self.vectors = vectors
+        self.compressed = compressed
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[array] = []
+        self._assigned_rows = 0
+        self._epoch = None  # ``VectorIndex.epoch`` the cells were assigned in
+        # Cells are extended by whichever query syncs first; readers copy rows out under it
+        self._lock = threading.RLock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, matrix: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Index of the nearest centroid for each row, computed in bounded chunks."""
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk_size):
+            block = np.asarray(matrix[start:start + chunk_size])
+            assignments[start:start + chunk_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self) -> bool:
+        """Fit coarse centroids with spherical k-means on a sample of live rows."""
+        epoch = self.vectors.epoch
+        live_rows = np.flatnonzero(self.vectors.get_live_mask())
+        if len(live_rows) == 0:
+            return False
+
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, len(live_rows))
+        sample_size = min(len(live_rows), nlist * self.train_sample)
+        sample_rows = np.sort(rng.choice(live_rows, size=sample_size, replace=False))
+        sample = np.asarray(self.vectors.get_matrix()[sample_rows])
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty cells from random sample points
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            centroids = VectorIndex.normalize(sums)
+
+        with self._lock:
+            self._lists = [array('q') for _ in range(nlist)]
+            self._assigned_rows = 0
+            self._epoch = epoch
+            self.centroids = centroids
+        return True
+
+    def sync(self):
+        """Assign rows appended to the underlying index since the last call."""
+        with self._lock:
+            if not self.is_trained:
+                return
+            epoch = self.vectors.epoch
+            if epoch % 2:
+                return  # Rows are being renumbered; a later call catches up
+            if epoch != self._epoch:
+                self._lists = [array('q') for _ in self._lists]
+                self._assigned_rows = 0
+                self._epoch = epoch
+            row_count = self.vectors.row_count
+            if row_count <= self._assigned_rows:
+                return
+
+            start = self._assigned_rows
+            rows = np.arange(start, row_count)
+            rows = rows[self.vectors.live_at(rows)]
+            if len(rows):
+                assignments = self._assign(self.vectors.get_matrix()[rows])
+                order = np.argsort(assignments, kind='stable')
+                cells, boundaries = np.unique(assignments[order], return_index=True)
+                for cell, members in zip(cells, np.split(rows[order], boundaries[1:])):
+                    self._lists[cell].extend(members.tolist())
+            self._assigned_rows = row_count
+            if self.vectors.epoch != epoch:
+                self._epoch = None  # Compacted meanwhile: start over next time
+
+    def rebuild(self) -> bool:
+        """Retrain centroids and reassign all live rows, dropping tombstones."""
+        try:
+            start = time.perf_counter()
+            if not self.train():
+                return False
+            self.sync()
+            log_info(
+                f"Rebuilt IVF index: {len(self.vectors)} vectors in {len(self._lists)} cells "
+                f"({time.perf_counter() - start:.2f}s)"
+            )
+            return True
+        except Exception as e:
+            log_error(f"Error rebuilding IVF index: {str(e)}")
+            return False
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None,
+               mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Approximate top-k search that only scans the closest ``nprobe`` cells.
+
+        ``mask`` (see ``VectorIndex.filter_mask``) restricts the probed rows
+        before any of them are scored.
+        """
+        if not self.is_trained or top_k <= 0:
+            if mask is not None:
+                return self.vectors.search_rows(VectorIndex.normalize(query_vector), np.flatnonzero(mask), top_k)
+            return self.vectors.search(query_vector, top_k)
+        self.sync()
+
+        query = VectorIndex.normalize(query_vector)
+        with self._lock:
+            nprobe = min(nprobe or self.nprobe, len(self._lists))
+            centroid_scores = self.centroids @ query
+            cells = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            rows = np.concatenate([
+                np.frombuffer(self._lists[cell], dtype=np.int64) for cell in cells
+            ]) if len(cells) else np.zeros(0, dtype=np.int64)
+
+        if mask is not None:
+            rows = rows[rows < len(mask)]
+            rows = rows[mask[rows]]
+        else:
+            rows = rows[self.vectors.live_at(rows)]
+        if len(rows) == 0:
+            return []
+
+        rows.sort()
+        if self.compressed is not None and self.compressed.is_trained:
+            approximate = self.compressed.score_rows(query, rows)
+            candidates = min(len(rows), top_k * self.compressed.rerank_factor)
+            if candidates < len(rows):
+                rows = rows[np.argpartition(-approximate, candidates - 1)[:candidates]]
+            return self.compressed.rerank(query, rows, top_k)
+
+        return self.vectors.search_rows(query, rows, top_k)
+
+    def save(self, path: str) -> bool:
+        """Persist centroids and cell membership next to the vector store."""
+        try:
+            if not self.is_trained:
+                return False
+            lengths = np.array([len(cell) for cell in self._lists], dtype=np.int64)
+            members = np.concatenate([np.frombuffer(cell, dtype=np.int64) for cell in self._lists])
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, centroids=self.centroids, lengths=lengths, members=members,
+                     assigned_rows=np.array(self._assigned_rows),
+                     epoch=np.array(-1 if self._epoch is None else self._epoch))
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            log_error(f"Error saving IVF index to {path}: {str(e)}")
+            return False
+
+    def load(self, path: str) -> bool:
+        """Load a saved IVF index; returns False if it is missing or stale."""
+        try:
+            if not os.path.exists(path):
+                return False
+            with np.load(path) as data:
+                assigned_rows = int(data['assigned_rows'])
+                epoch = int(data['epoch']) if 'epoch' in data.files else 0
+                if assigned_rows > self.vectors.row_count or epoch != self.vectors.epoch:
+                    log_info(f"Ignoring stale IVF index at {path}")
+                    return False
+                self.centroids = data['centroids']
+                members = data['members']
+                offsets = np.concatenate([[0], np.cumsum(data['lengths'])])
+            self._lists = [array('q', members[offsets[i]:offsets[i + 1]].tolist())
+                           for i in range(len(offsets) - 1)]
+            self._assigned_rows = assigned_rows
+            self._epoch = epoch
+            return True
+        except Exception as e:
+            log_error(f"Error loading IVF index from {path}: {str(e)}")
+            return False
+
+def benchmark_recall(ann_index: IVFIndex, queries: np.ndarray, top_k: int = 10,
+                     nprobe_values: Sequence[int] = (1, 2, 4, 8, 16, 32)) -> List[Dict[str, Any]]:
+    """Measure recall@k and latency of the IVF index against exact search."""
+    exact_results = []
+    start = time.perf_counter()
+    for query in queries:
+        exact_results.append({node_id for node_id, _ in ann_index.vectors.search(query, top_k)})
+    exact_ms = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+
+    report = []
+    for nprobe in nprobe_values:
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, exact_results):
+            found = {node_id for node_id, _ in ann_index.search(query, top_k, nprobe=nprobe)}
+            hits += len(found & expected)
+        latency_ms = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+        total = sum(len(expected) for expected in exact_results)
+        report.append({
+            'nprobe': nprobe,
+            'recall_at_k': hits / total if total else 1.0,
+            'latency_ms': latency_ms,
+            'exact_latency_ms': exact_ms
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the IVF index of a vector store.")
+    parser.add_argument('command', choices=['rebuild', 'benchmark'])
+    parser.add_argument('--store', required=True, help="Vector store directory")
+    parser.add_argument('--nlist', type=int, default=IVF_NLIST)
+    parser.add_argument('--queries', type=int, default=200, help="Number of sampled benchmark queries")
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    from .store import VectorStore
+    vectors, _, _ = VectorStore(args.store).open()
+    ivf = IVFIndex(vectors, nlist=args.nlist)
+    ivf_path = os.path.join(args.store, 'ivf.npz')
+
+    if args.command == 'rebuild' or not ivf.load(ivf_path):
+        ivf.rebuild()
+        ivf.save(ivf_path)
+    if args.command == 'benchmark':
+        # Use perturbed stored vectors as queries so no model is needed
+        rng = np.random.default_rng(0)
+        live_rows = np.flatnonzero(vectors.get_live_mask())
+        rows = rng.choice(live_rows, size=min(args.queries, len(live_rows)), replace=False)
+        queries = vectors.get_matrix()[np.sort(rows)] + rng.normal(scale=0.05, size=(len(rows), vectors.dimension))
+        for result in benchmark_recall(ivf, queries, top_k=args.top_k):
+            print(f"nprobe={result['nprobe']:<4} recall@{args.top_k}={result['recall_at_k']:.3f} "
+                  f"latency={result['latency_ms']:.2f}ms exact={result['exact_latency_ms']:.2f}ms")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+import math
+import re
+import threading
+from array import array
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.logger import log_info, log_error
+from ..core.config import BM25_K1, BM25_B, BM25_COMPACTION_RATIO, BM25_COMPACTION_MIN_DOCS
+
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+(?:[-_./][0-9a-z]+)*')
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; compound codes such as ``A-100`` also yield their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r'[-_./]', token) if part)
+    return tokens
+
+def node_text(node_data: Dict[str, Any]) -> str:
+    """Searchable text of a node: its attribute values, including table and sheet cells."""
+    return " ".join(str(value) for value in node_data.values())
+
+class BM25Index:
+    """In-process BM25 index over node text, updated as a ``GraphBuilder`` listener.
+
+    Like the vectorizer, it skips parents of chunked nodes.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_freq: Dict[str, int] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_terms: List[Optional[Dict[str, int]]] = []
+        self._lengths = array('f')
+        self._live = bytearray()  # One flag per document number, read as a NumPy bool array
+        self._docs: Dict[str, int] = {}
+        self._total_length = 0.0
+        self._retired = 0
+
+    def add(self, node_id: str, text: str):
+        """Index or re-index a node's text."""
+        terms: Dict[str, int] = {}
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0) + 1
+        with self._lock:
+            self._remove(node_id)
+            doc = len(self._doc_ids)
+            self._doc_ids.append(node_id)
+            self._doc_terms.append(terms)
+            length = sum(terms.values())
+            self._lengths.append(length)
+            self._live.append(1)
+            self._total_length += length
+            self._docs[node_id] = doc
+            for term, frequency in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array('q'), array('f'))
+                postings[0].append(doc)
+                postings[1].append(frequency)
+                self._doc_freq[term] = self._doc_freq.get(term, 0) + 1
+
+    def _remove(self, node_id: str) -> bool:
+        doc = self._docs.pop(node_id, None)
+        if doc is None:
+            return False
+        for term in self._doc_terms[doc]:
+            self._doc_freq[term] -= 1
+        self._total_length -= self._lengths[doc]
+        self._doc_ids[doc] = None
+        self._doc_terms[doc] = None
+        self._live[doc] = 0
+        self._retired += 1
+        return True
+
+    def remove(self, node_id: str) -> bool:
+        with self._lock:
+            return self._remove(node_id)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k nodes by BM25 score; only documents containing a query term are scored."""
+        terms = set(tokenize(query))
+        with self._lock:
+            live = len(self._docs)
+            if live == 0 or top_k <= 0:
+                return []
+            average_length = self._total_length / live or 1.0
+            lengths = np.frombuffer(self._lengths, dtype=np.float32)
+            matched, partial = [], []
+            for term in terms:
+                postings = self._postings.get(term)
+                frequency = self._doc_freq.get(term, 0)
+                if postings is None or frequency == 0:
+                    continue
+                idf = math.log(1 + (live - frequency + 0.5) / (frequency + 0.5))
+                docs = np.frombuffer(postings[0], dtype=np.int64)
+                tf = np.frombuffer(postings[1], dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                matched.append(docs)
+                partial.append(idf * tf * (self.k1 + 1) / (tf + norm))
+            if not matched:
+                return []
+
+            # Sum per-term contributions per document, then drop retired documents
+            docs, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(partial))
+            alive = np.frombuffer(self._live, dtype=np.bool_)[docs]
+            docs, scores = docs[alive], scores[alive]
+            k = min(top_k, len(scores))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(self._doc_ids[docs[i]], float(scores[i])) for i in top]
+
+    def compact(self) -> bool:
+        """Rewrite the postings without retired documents, renumbering the live ones in order.
+
+        Holds the index lock, so updates and searches wait until it is done.
+        """
+        with self._lock:
+            try:
+                dropped = self._retired
+                if dropped == 0:
+                    return True
+                live = np.frombuffer(self._live, dtype=np.bool_)
+                kept = np.flatnonzero(live)
+                renumber = np.cumsum(live, dtype=np.int64) - 1
+                postings: Dict[str, Tuple[array, array]] = {}
+                for term, (docs, frequencies) in self._postings.items():
+                    docs = np.frombuffer(docs, dtype=np.int64)
+                    keep = live[docs]
+                    if not keep.any():
+                        continue
+                    postings[term] = (array('q', renumber[docs[keep]].tobytes()),
+                                      array('f', np.frombuffer(frequencies, dtype=np.float32)[keep].tobytes()))
+                lengths = array('f', np.frombuffer(self._lengths, dtype=np.float32)[kept].tobytes())
+
+                self._postings = postings
+                self._doc_freq = {term: frequency for term, frequency in self._doc_freq.items() if term in postings}
+                self._doc_ids = [self._doc_ids[doc] for doc in kept.tolist()]
+                self._doc_terms = [self._doc_terms[doc] for doc in kept.tolist()]
+                self._lengths = lengths
+                self._live = bytearray(b'\x01' * len(kept))
+                self._docs = {node_id: doc for doc, node_id in enumerate(self._doc_ids)}
+                self._retired = 0
+                log_info(f"Compacted BM25 index: {dropped} retired documents dropped, {len(kept)} kept")
+                return True
+            except Exception as e:
+                log_error(f"Error compacting BM25 index: {str(e)}")
+                return False
+
+    def maybe_compact(self, ratio: float = BM25_COMPACTION_RATIO, min_docs: int = BM25_COMPACTION_MIN_DOCS) -> bool:
+        """Start compaction in a background thread once retired documents pass ``ratio`` of the numbers.
+
+        Returns whether a compaction was started; at most one runs at a time.
+        """
+        numbered = len(self._doc_ids)
+        if numbered < min_docs or self._retired <= ratio * numbered:
+            return False
+        with self._compactor_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return False
+            self._compactor = threading.Thread(target=self.compact, name='bm25-compaction', daemon=True)
+            self._compactor.start()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._docs
+
+    # GraphBuilder listener hooks
+
+    def node_added(self, node_id: str, node_data: Dict[str, Any]):
+        if node_data.get('chunked'):
+            self.remove(node_id)
+        else:
+            self.add(node_id, node_text(node_data))
+
+    def node_removed(self, node_id: str):
+        self.remove(node_id)
+
+    def graph_cleared(self):
+        with self._lock:
+            self._reset()
\ No newline at end of file
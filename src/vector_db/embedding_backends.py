@@ -0,0 +1,111 @@
+import argparse
+import re
+import time
+import numpy as np
+import sentence_transformers
+from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, List, Sequence
+from ..core.logger import log_info
+from ..core.config import HF_API_KEY, EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_THREADS
+
+BACKENDS = ('torch', 'int8', 'onnx')
+ONNX_MIN_VERSION = (3, 2)  # First sentence-transformers release with backend='onnx'
+
+# Mixed sample used when no parity texts are given
+PARITY_TEXTS = [
+    "Quarterly revenue grew 12% compared to the previous year.",
+    "type: table content: [['Region', 'Sales'], ['North', '1200'], ['South', '950']]",
+    "The contract may be terminated with thirty days written notice.",
+    "sheet_name: Inventory content: [{'sku': 'A-100', 'qty': 42}]",
+    "How many employees joined the engineering team in March?",
+    "Invoice 2024-117 was paid on 3 May by bank transfer.",
+    "short",
+    "A much longer passage that describes the knowledge graph, its document nodes, "
+    "the tables and sheets extracted from uploads and the chunks that are embedded for search."
+]
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+def load_model(model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND,
+               threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """Load a sentence-transformers model on the ``torch``, ``int8`` or ``onnx`` backend.
+
+    ``threads`` > 0 pins the intra-op thread count.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if backend == 'onnx':
+        installed = tuple(int(part) for part in re.findall(r'\d+', sentence_transformers.__version__)[:2])
+        if installed < ONNX_MIN_VERSION:
+            raise ImportError(f"The onnx embedding backend needs sentence-transformers>=3.2, "
+                              f"found {sentence_transformers.__version__}")
+        from onnxruntime import SessionOptions
+        options = SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        return SentenceTransformer(
+            model_name,
+            token=HF_API_KEY,
+            backend='onnx',
+            model_kwargs={'provider': 'CPUExecutionProvider', 'session_options': options}
+        )
+
+    _set_torch_threads(threads)
+    model = SentenceTransformer(model_name, token=HF_API_KEY, device='cpu' if backend == 'int8' else None)
+    if backend == 'int8':
+        import torch
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def parity_check(reference: Any, candidate: Any, texts: Sequence[str] = PARITY_TEXTS,
+                 batch_size: int = 32) -> Dict[str, Any]:
+    """Cosine agreement and speed of a candidate backend against a reference model."""
+    texts = list(texts)
+    timings = []
+    embeddings: List[np.ndarray] = []
+    for model in (reference, candidate):
+        model.encode(texts[:1], convert_to_numpy=True)  # Exclude one-off initialisation
+        start = time.perf_counter()
+        embeddings.append(np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True),
+                                     dtype=np.float32))
+        timings.append(time.perf_counter() - start)
+
+    expected, actual = embeddings
+    if expected.shape != actual.shape:
+        raise ValueError(f"Backend output shape {actual.shape} does not match reference {expected.shape}")
+    norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    norms[norms == 0] = 1.0
+    cosines = (expected * actual).sum(axis=1) / norms
+    return {
+        'texts': len(texts),
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        'reference_seconds': timings[0],
+        'candidate_seconds': timings[1],
+        'speedup': timings[0] / timings[1] if timings[1] > 0 else float('inf')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against PyTorch.")
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    parser.add_argument('--backend', choices=BACKENDS, default=EMBEDDING_BACKEND)
+    parser.add_argument('--threads', type=int, default=EMBEDDING_THREADS)
+    parser.add_argument('--min-cosine', type=float, default=0.99, help="Fail below this per-text cosine")
+    args = parser.parse_args()
+
+    reference = load_model(args.model, 'torch', args.threads)
+    candidate = load_model(args.model, args.backend, args.threads)
+    report = parity_check(reference, candidate)
+    log_info(f"Parity of {args.backend} backend: {report}")
+    print(f"backend={args.backend} mean_cosine={report['mean_cosine']:.5f} min_cosine={report['min_cosine']:.5f} "
+          f"speedup={report['speedup']:.2f}x")
+    if report['min_cosine'] < args.min_cosine:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
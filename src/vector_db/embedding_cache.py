@@ -0,0 +1,177 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from typing import Any, Dict, Optional
+from ..core.logger import log_info, log_error
+from ..core.config import EMBEDDING_BACKEND, EMBEDDING_CACHE_BYTES, EMBEDDING_CACHE_SAVE_INTERVAL
+
+# Rough per-entry bookkeeping cost (key, OrderedDict node, array header)
+ENTRY_OVERHEAD_BYTES = 200
+
+class EmbeddingCache:
+    """Bounded LRU cache of embeddings keyed by model, backend and normalized text.
+
+    With ``persist_path`` it is loaded on start, saved in the background by
+    ``maybe_save`` and saved once more by ``close``.
+    """
+
+    def __init__(self, model_name: str, max_bytes: int = EMBEDDING_CACHE_BYTES,
+                 persist_path: Optional[str] = None, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        self._entries: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._changes = 0  # Puts since the last save
+        self._saved_at = time.monotonic()
+        self._save_lock = threading.Lock()
+        self._saver: Optional[threading.Thread] = None
+        if persist_path:
+            self.load()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+    def key(self, text: str) -> str:
+        """Cache key for a text under this cache's model and backend."""
+        payload = f"{self.model_name}\0{self.backend}\0{self.normalize_text(text)}".encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return a copy of the cached embedding, or None on a miss."""
+        return self.get_by_key(self.key(text))
+
+    def put(self, text: str, vector: np.ndarray):
+        """Cache an embedding, evicting least recently used entries over budget."""
+        self.put_by_key(self.key(text), vector)
+
+    def get_by_key(self, key: str) -> Optional[np.ndarray]:
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector.copy()
+
+    def put_by_key(self, key: str, vector: np.ndarray):
+        if self.max_bytes <= 0:
+            return
+        vector = np.array(vector, dtype=np.float32)
+        size = vector.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes + ENTRY_OVERHEAD_BYTES
+            self._entries[key] = vector
+            self._bytes += size
+            self._changes += 1
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def save(self, path: Optional[str] = None) -> bool:
+        """Write the cache, oldest entries first, so a load restores LRU order."""
+        path = path or self.persist_path
+        if not path:
+            return False
+        with self._save_lock:
+            # Entries are never modified in place, so they can be stacked outside the lock
+            with self._lock:
+                keys = np.array(list(self._entries.keys()), dtype='U32')
+                entries = list(self._entries.values())
+                changes, self._changes = self._changes, 0
+            try:
+                vectors = np.stack(entries) if entries else np.zeros((0, 0), np.float32)
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                tmp_path = path + '.tmp.npz'
+                np.savez(tmp_path, model_name=np.array(self.model_name), backend=np.array(self.backend),
+                         keys=keys, vectors=vectors)
+                os.replace(tmp_path, path)
+                self._saved_at = time.monotonic()
+                return True
+            except Exception as e:
+                with self._lock:
+                    self._changes += changes
+                log_error(f"Error saving embedding cache to {path}: {str(e)}")
+                return False
+
+    def maybe_save(self, interval: float = EMBEDDING_CACHE_SAVE_INTERVAL) -> bool:
+        """Save in a background thread if the cache changed and ``interval`` seconds passed since the last save.
+
+        Returns whether a save was started; at most one runs at a time.
+        """
+        if not self.persist_path or not self._changes or time.monotonic() - self._saved_at < interval:
+            return False
+        with self._save_lock:
+            if self._saver is not None and self._saver.is_alive():
+                return False
+            self._saver = threading.Thread(target=self.save, name='embedding-cache-save', daemon=True)
+            self._saver.start()
+        return True
+
+    def close(self) -> bool:
+        """Wait for a background save, then save any changes made since."""
+        saver = self._saver
+        if saver is not None:
+            saver.join()
+        return self.save() if self._changes else True
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Warm the cache from disk; entries for another model or backend are ignored."""
+        path = path or self.persist_path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if str(data['model_name']) != self.model_name or \
+                        'backend' not in data.files or str(data['backend']) != self.backend:
+                    return False
+                keys, vectors = data['keys'], data['vectors']
+            with self._lock:
+                for key, vector in zip(keys, vectors):
+                    self._entries[str(key)] = vector
+                    self._bytes += vector.nbytes + ENTRY_OVERHEAD_BYTES
+                while self._bytes > self.max_bytes and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.nbytes + ENTRY_OVERHEAD_BYTES
+            log_info(f"Loaded {len(self._entries)} cached embeddings from {path}")
+            return True
+        except Exception as e:
+            log_error(f"Error loading embedding cache from {path}: {str(e)}")
+            return False
\ No newline at end of file
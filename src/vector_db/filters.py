@@ -0,0 +1,125 @@
+import numpy as np
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Union
+
+FilterSpec = Mapping[str, Union[str, Iterable[str]]]
+
+# Node attributes indexed for filtered search
+FILTER_ATTRIBUTES = ('type', 'file_type', 'document_id')
+
+def parse_filters(raw: Any) -> Optional[Dict[str, List[str]]]:
+    """Validate a request's ``filters`` object into attribute -> accepted values."""
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    filters = {}
+    for attribute, value in raw.items():
+        if attribute not in FILTER_ATTRIBUTES:
+            raise ValueError(f"Unknown filter attribute: {attribute}")
+        values = value if isinstance(value, list) else [value]
+        if not all(isinstance(v, str) for v in values):
+            raise ValueError(f"Filter values for {attribute} must be strings")
+        filters[attribute] = values
+    return filters
+
+def parse_count(raw: Any, name: str, default: int, minimum: int = 0) -> int:
+    """Validate an integer request parameter such as ``top_k``, falling back to ``default``."""
+    if raw is None:
+        return default
+    if isinstance(raw, bool) or not isinstance(raw, (int, float, str)) or \
+            (isinstance(raw, float) and not raw.is_integer()):
+        raise ValueError(f"{name} must be an integer")
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return value
+
+class Bitmap:
+    """Packed bit array over index rows, starting at the first row it covers.
+
+    Values such as a document id only ever cover a short run of rows, so a
+    bitmap stores bytes from its first set row onwards instead of one bit
+    for every row in the index.
+    """
+
+    def __init__(self, first_row: int):
+        self.start = first_row // 8
+        self.bits = np.zeros(8, dtype=np.uint8)
+        self.length = 0
+
+    def set(self, row: int):
+        byte = row // 8 - self.start
+        if byte >= len(self.bits):
+            bits = np.zeros(max(byte + 1, len(self.bits) * 2), dtype=np.uint8)
+            bits[:len(self.bits)] = self.bits
+            self.bits = bits
+        self.bits[byte] |= np.uint8(0x80 >> (row % 8))
+        self.length = max(self.length, byte + 1)
+
+    def or_into(self, target: np.ndarray):
+        """OR these bits into a packed array covering the whole index."""
+        stop = min(self.start + self.length, len(target))
+        if stop > self.start:
+            target[self.start:stop] |= self.bits[:stop - self.start]
+
+    def rows_in(self, start: int, stop: int) -> np.ndarray:
+        """Set rows within ``[start, stop)``."""
+        first = max(start // 8, self.start)
+        last = min((stop + 7) // 8, self.start + self.length)
+        if last <= first:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(np.unpackbits(self.bits[first - self.start:last - self.start])) + first * 8
+        return rows[(rows >= start) & (rows < stop)]
+
+class FilterBitmaps:
+    """Inverted bitmaps from ``(attribute, value)`` to the index rows carrying it.
+
+    Bits are set when rows are appended, so a filtered query only combines
+    a few packed arrays (OR across the values of one attribute, AND across
+    attributes) instead of reading node metadata. Tombstoned rows keep
+    their bits; callers combine the result with the index's live mask.
+    """
+
+    def __init__(self):
+        self._bitmaps: Dict[str, Dict[str, Bitmap]] = {}
+
+    def add(self, row: int, attributes: Optional[Mapping[str, Any]]):
+        for attribute, value in (attributes or {}).items():
+            if value is None:
+                continue
+            values = self._bitmaps.setdefault(attribute, {})
+            bitmap = values.get(str(value))
+            if bitmap is None:
+                bitmap = values[str(value)] = Bitmap(row)
+            bitmap.set(row)
+
+    def mask(self, filters: FilterSpec, size: int) -> np.ndarray:
+        """Boolean mask over ``size`` rows matching every attribute in ``filters``.
+
+        A filter value may be a single string or a list of accepted values.
+        """
+        nbytes = (size + 7) // 8
+        combined = np.full(nbytes, 0xFF, dtype=np.uint8)
+        for attribute, wanted in filters.items():
+            if isinstance(wanted, str) or not isinstance(wanted, Iterable):
+                wanted = [wanted]
+            values = self._bitmaps.get(attribute, {})
+            matched = np.zeros(nbytes, dtype=np.uint8)
+            for value in wanted:
+                bitmap = values.get(str(value))
+                if bitmap is not None:
+                    bitmap.or_into(matched)
+            combined &= matched
+        return np.unpackbits(combined, count=size).astype(bool)
+
+    def attributes_for_rows(self, start: int, stop: int) -> List[Dict[str, str]]:
+        """Attributes recorded for each row in ``[start, stop)``, used when persisting."""
+        result: List[Dict[str, str]] = [{} for _ in range(max(0, stop - start))]
+        for attribute, values in self._bitmaps.items():
+            for value, bitmap in values.items():
+                for row in bitmap.rows_in(start, stop):
+                    result[row - start][attribute] = value
+        return result
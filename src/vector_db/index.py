@@ -0,0 +1,287 @@
+import numpy as np
+from typing import Any, Dict, List, Tuple, Iterator, Optional, Mapping
+from .filters import FilterBitmaps, FilterSpec
+from ..core.config import QUERY_SCORE_BYTES
+
+COMPACT_CHUNK_ROWS = 65536
+
+class VectorIndex(Mapping):
+    """Append-only vector index backed by one contiguous float32 matrix, searched by cosine similarity.
+
+    Replaced and removed rows are tombstones until ``compact``. The index is a
+    read-only ``node_id -> vector`` mapping.
+    """
+
+    def __init__(self, dimension: Optional[int] = None, initial_capacity: int = 1024, storage=None):
+        self.dimension = dimension
+        self.initial_capacity = max(1, initial_capacity)
+        self.storage = storage
+        self._matrix = None
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+        self.filters = FilterBitmaps()
+        self.epoch = 0  # Advanced by two per compaction and odd while it swaps arrays, so readers detect torn reads
+
+    @classmethod
+    def from_arrays(cls, matrix: np.ndarray, ids: List[Optional[str]], storage=None,
+                    attributes: Optional[List[Optional[Dict[str, Any]]]] = None) -> 'VectorIndex':
+        """Build an index over an existing matrix; ``None`` ids mark tombstoned rows."""
+        index = cls(dimension=matrix.shape[1], storage=storage)
+        index._matrix = matrix
+        index._ids = list(ids)
+        index._size = len(index._ids)
+        index._live = np.zeros(matrix.shape[0], dtype=bool)
+        for row, node_id in enumerate(index._ids):
+            if node_id is not None:
+                index._rows[node_id] = row
+                index._live[row] = True
+                if attributes:
+                    index.filters.add(row, attributes[row])
+        return index
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize a vector or a matrix of row vectors as float32."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, capacity: int):
+        """Grow the backing matrix geometrically so appends stay amortized O(1)."""
+        current = self._matrix.shape[0] if self._matrix is not None else 0
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2, self.initial_capacity)
+        if self.storage is not None:
+            self._matrix = self.storage.resize(self._matrix, self._size, new_capacity, self.dimension)
+        else:
+            matrix = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+            if self._size:
+                matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+        live = np.zeros(new_capacity, dtype=bool)
+        live[:self._size] = self._live[:self._size]
+        self._live = live
+
+    def add(self, node_id: str, vector: np.ndarray, attributes: Optional[Dict[str, Any]] = None):
+        """Insert or replace the vector stored for a node."""
+        self.add_batch([node_id], np.asarray(vector)[np.newaxis, :], [attributes])
+
+    def add_batch(self, node_ids: List[str], vectors: np.ndarray,
+                  attributes: Optional[List[Optional[Dict[str, Any]]]] = None):
+        """Append vectors for several nodes in one copy, tombstoning replaced rows."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(node_ids) != vectors.shape[0]:
+            raise ValueError("Expected one vector row per node id")
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(
+                f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dimension}"
+            )
+        if not node_ids:
+            return
+
+        start = self._size
+        self._reserve(start + len(node_ids))
+        self._matrix[start:start + len(node_ids)] = self.normalize(vectors)
+        for row, node_id in enumerate(node_ids, start):
+            self._tombstone(node_id)
+            self._rows[node_id] = row
+            self._ids.append(node_id)
+            self._live[row] = True
+            if attributes:
+                self.filters.add(row, attributes[row - start])
+        self._size = start + len(node_ids)
+
+    def _tombstone(self, node_id: str) -> bool:
+        row = self._rows.pop(node_id, None)
+        if row is None:
+            return False
+        self._live[row] = False
+        self._ids[row] = None
+        return True
+
+    def remove(self, node_id: str) -> bool:
+        """Drop a node by tombstoning its row."""
+        return self._tombstone(node_id)
+
+    def compact(self, matrix: Optional[np.ndarray] = None) -> np.ndarray:
+        """Drop tombstoned rows, renumbering the live ones in their current order.
+
+        ``matrix`` is a buffer that already holds the live rows in that
+        order, such as a new store file; otherwise they are copied into a
+        new in-memory matrix. Returns the old row number of each new row.
+        """
+        rows = np.flatnonzero(self._live[:self._size])
+        if matrix is None:
+            matrix = np.zeros((max(len(rows), self.initial_capacity), self.dimension or 0), dtype=np.float32)
+            for start in range(0, len(rows), COMPACT_CHUNK_ROWS):
+                chunk = rows[start:start + COMPACT_CHUNK_ROWS]
+                matrix[start:start + len(chunk)] = self._matrix[chunk]
+        attributes = self.filters.attributes_for_rows(0, self._size)
+        filters = FilterBitmaps()
+        ids = []
+        for new_row, row in enumerate(rows.tolist()):
+            filters.add(new_row, attributes[row])
+            ids.append(self._ids[row])
+        live = np.zeros(matrix.shape[0], dtype=bool)
+        live[:len(rows)] = True
+        row_map = {node_id: row for row, node_id in enumerate(ids)}
+
+        self.epoch += 1
+        self._matrix, self._live, self._ids, self._rows, self.filters = matrix, live, ids, row_map, filters
+        self._size = len(ids)
+        self.epoch += 1
+        return rows
+
+    def _view(self) -> Tuple[int, np.ndarray, np.ndarray, List[Optional[str]]]:
+        """Size, matrix, live mask and ids as one consistent snapshot for a lock-free read.
+
+        Appends write the arrays before publishing the new size, and arrays
+        only grow, so reading the size first keeps every row below it valid
+        in the arrays read after it.
+        """
+        size = self._size
+        return size, self._matrix, self._live, self._ids
+
+    def filter_mask(self, filters: FilterSpec, size: Optional[int] = None) -> np.ndarray:
+        """Mask over used rows that are live and match every filter."""
+        size = self._size if size is None else size
+        live = self._live
+        mask = self.filters.mask(filters, size)
+        mask &= live[:size]
+        return mask
+
+    def filter_rows(self, filters: FilterSpec) -> np.ndarray:
+        """Sorted live rows whose attributes match every filter."""
+        return np.flatnonzero(self.filter_mask(filters))
+
+    def search_rows(self, query: np.ndarray, rows: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Score only the given sorted rows and return the best ``top_k``."""
+        if len(rows) == 0 or top_k <= 0:
+            return []
+        _, matrix, _, ids = self._view()
+        scores = np.asarray(matrix[rows]) @ query
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results = ((ids[rows[i]], float(scores[i])) for i in top)
+        # A row tombstoned after ``rows`` was computed has lost its id
+        return [(node_id, score) for node_id, score in results if node_id is not None]
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5,
+               filters: Optional[FilterSpec] = None) -> List[Tuple[str, float]]:
+        """Return the ``top_k`` most similar node ids with cosine scores.
+
+        With ``filters``, only rows matching the filter bitmaps are scored.
+        """
+        size, matrix, live, ids = self._view()
+        live_count = len(self._rows)
+        if live_count == 0 or size == 0 or top_k <= 0:
+            return []
+
+        query = self.normalize(query_vector)
+        if filters:
+            return self.search_rows(query, np.flatnonzero(self.filter_mask(filters, size)), top_k)
+        scores = matrix[:size] @ query
+        live = live[:size]
+        if not live.all():
+            scores[~live] = -np.inf
+        k = min(top_k, size)
+        if k < size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results = ((ids[row], float(scores[row])) for row in top if live[row])
+        return [(node_id, score) for node_id, score in results if node_id is not None]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5, rows: Optional[np.ndarray] = None,
+                     score_bytes: int = QUERY_SCORE_BYTES) -> Iterator[List[Tuple[str, float]]]:
+        """Yield top-k results for each query row, scored with matrix-matrix products.
+
+        Queries are processed in blocks sized so the block's score matrix
+        stays within ``score_bytes``, and results are yielded as each block
+        finishes. ``rows`` restricts scoring to a sorted subset of live rows.
+        """
+        size, matrix, live, ids = self._view()
+        queries = self.normalize(np.atleast_2d(queries))
+        if rows is None and not live[:size].all():
+            rows = np.flatnonzero(live[:size])
+        candidates = len(rows) if rows is not None else size
+        if candidates == 0 or top_k <= 0 or len(self._rows) == 0:
+            for _ in range(len(queries)):
+                yield []
+            return
+
+        # Gather the candidate rows once for the whole batch
+        matrix = np.asarray(matrix[rows]) if rows is not None else matrix[:size]
+        k = min(top_k, candidates)
+        block = max(1, score_bytes // (4 * candidates))
+        for start in range(0, len(queries), block):
+            scores = queries[start:start + block] @ matrix.T
+            if k < candidates:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(candidates), (len(scores), candidates))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for query_top, query_scores in zip(top, top_scores):
+                positions = rows[query_top] if rows is not None else query_top
+                results = ((ids[row], float(score)) for row, score in zip(positions, query_scores))
+                yield [(node_id, score) for node_id, score in results if node_id is not None]
+
+    def get_matrix(self) -> np.ndarray:
+        """Read-only view of all used rows of the matrix, tombstones included."""
+        if self._matrix is None:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        view = self._matrix[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def get_live_mask(self) -> np.ndarray:
+        """Boolean mask over used rows that is False for tombstones."""
+        return self._live[:self._size].copy()
+
+    def live_at(self, rows: np.ndarray) -> np.ndarray:
+        """Liveness of the given rows without copying the whole mask."""
+        return self._live[rows]
+
+    def ids_at(self, rows) -> List[Optional[str]]:
+        """Node ids stored at the given rows."""
+        return [self._ids[row] for row in rows]
+
+    def get_ids(self) -> List[Optional[str]]:
+        """Node ids in row order, with ``None`` for tombstoned rows."""
+        return list(self._ids)
+
+    def get_row(self, node_id: str) -> Optional[int]:
+        """Matrix row currently holding a node's vector."""
+        return self._rows.get(node_id)
+
+    @property
+    def row_count(self) -> int:
+        """Number of used rows, tombstones included."""
+        return self._size
+
+    @property
+    def tombstone_count(self) -> int:
+        return self._size - len(self._rows)
+
+    def __getitem__(self, node_id: str) -> np.ndarray:
+        return np.array(self._matrix[self._rows[node_id]])
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rows))
+
+    def __len__(self) -> int:
+        return len(self._rows)
\ No newline at end of file
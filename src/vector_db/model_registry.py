@@ -0,0 +1,59 @@
+import gc
+import threading
+import time
+from sentence_transformers import SentenceTransformer
+from typing import Dict, Iterable, Optional, Tuple
+from .embedding_backends import load_model
+from ..core.logger import log_info, log_error
+from ..core.config import EMBEDDING_MODEL, EMBEDDING_BACKEND
+
+class ModelRegistry:
+    """Process-wide cache of embedding models, loaded once per model and backend on first use."""
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str], SentenceTransformer] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+        """Return the shared model, loading it on the first call."""
+        model = self._models.get((model_name, backend))
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get((model_name, backend))
+            if model is None:
+                start = time.perf_counter()
+                model = load_model(model_name, backend)
+                self._models[(model_name, backend)] = model
+                log_info(f"Loaded embedding model {model_name} ({backend}) in {time.perf_counter() - start:.2f}s")
+            return model
+
+    def warm_up(self, model_names: Optional[Iterable[str]] = None, backend: str = EMBEDDING_BACKEND,
+                freeze: bool = False) -> bool:
+        """Load models ahead of the first request.
+
+        Call this before forking workers with ``freeze=True`` to move the
+        loaded objects out of the garbage collector's reach (``gc.freeze``),
+        so collections in the workers do not touch and copy the shared pages.
+        No inference is run here, because initialising torch's thread pools
+        before a fork can hang the children.
+        """
+        try:
+            for model_name in model_names or [EMBEDDING_MODEL]:
+                self.get(model_name, backend)
+            if freeze:
+                gc.freeze()
+            return True
+        except Exception as e:
+            log_error(f"Error warming up embedding models: {str(e)}")
+            return False
+
+    def is_loaded(self, model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND) -> bool:
+        return (model_name, backend) in self._models
+
+    def clear(self):
+        """Drop all loaded models."""
+        with self._lock:
+            self._models.clear()
+
+model_registry = ModelRegistry()
\ No newline at end of file
@@ -0,0 +1,308 @@
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .index import VectorIndex
+from ..core.logger import log_info, log_error
+from ..core.config import PQ_SUBSPACES, RERANK_FACTOR
+
+SCORE_CHUNK_ROWS = 65536
+
+class Float16Codec:
+    """Half-precision copy of each vector (2x smaller than float32)."""
+
+    name = 'float16'
+
+    def train(self, sample: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) @ query
+
+    def code_shape(self, dimension: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        return (dimension,), np.dtype(np.float16)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+class ScalarQuantizer:
+    """Per-dimension int8 scalar quantization (4x smaller than float32).
+
+    Each dimension is mapped linearly from its trained ``[min, max]`` range
+    onto 256 levels. Scores are computed directly on the codes:
+    ``x ~ (c + 128) * scale + min``, so ``x . q = c . (scale * q) + const``.
+    """
+
+    name = 'int8'
+
+    def __init__(self):
+        self.minimum = None
+        self.scale = None
+
+    def train(self, sample: np.ndarray):
+        self.minimum = sample.min(axis=0).astype(np.float32)
+        span = sample.max(axis=0) - self.minimum
+        self.scale = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.minimum) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        weights = self.scale * query
+        offset = float(128.0 * weights.sum() + self.minimum @ query)
+        return codes.astype(np.float32) @ weights + offset
+
+    def code_shape(self, dimension: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        return (dimension,), np.dtype(np.int8)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return {'minimum': self.minimum, 'scale': self.scale}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        self.minimum = state['minimum']
+        self.scale = state['scale']
+
+class ProductQuantizer:
+    """Product quantization: ``m`` subspaces of 256 centroids, one byte per subspace per vector."""
+
+    name = 'pq'
+
+    def __init__(self, m: int = PQ_SUBSPACES, ksub: int = 256, n_iter: int = 15, seed: int = 0):
+        self.m = m
+        self.ksub = ksub
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None  # (m, ksub, dsub)
+
+    def _subspaces(self, dimension: int) -> int:
+        # Use the largest subspace count <= m that divides the dimension evenly
+        return max(d for d in range(1, min(self.m, dimension) + 1) if dimension % d == 0)
+
+    def train(self, sample: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        n, dimension = sample.shape
+        self.m = self._subspaces(dimension)
+        ksub = min(self.ksub, n)
+        parts = sample.reshape(n, self.m, dimension // self.m)
+        centroids = np.empty((self.m, self.ksub, dimension // self.m), dtype=np.float32)
+        for j in range(self.m):
+            points = parts[:, j, :]
+            codebook = points[rng.choice(n, size=ksub, replace=False)].copy()
+            for _ in range(self.n_iter):
+                assignments = self._nearest(points, codebook)
+                sums = np.zeros_like(codebook)
+                np.add.at(sums, assignments, points)
+                counts = np.bincount(assignments, minlength=ksub)
+                empty = counts == 0
+                counts[empty] = 1
+                codebook = sums / counts[:, np.newaxis]
+                if empty.any():
+                    codebook[empty] = points[rng.choice(n, size=int(empty.sum()))]
+            centroids[j, :ksub] = codebook
+            centroids[j, ksub:] = codebook[0]
+        self.centroids = centroids
+
+    @staticmethod
+    def _nearest(points: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+        distances = (codebook ** 2).sum(axis=1) - 2 * points @ codebook.T
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        parts = vectors.reshape(len(vectors), self.m, -1)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = self._nearest(parts[:, j, :], self.centroids[j])
+        return codes
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = np.einsum('jkd,jd->jk', self.centroids, query.reshape(self.m, -1))
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+    def code_shape(self, dimension: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        return (self._subspaces(dimension),), np.dtype(np.uint8)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return {'centroids': self.centroids}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        self.centroids = state['centroids']
+        self.m = self.centroids.shape[0]
+
+CODECS = {
+    'float16': Float16Codec,
+    'int8': ScalarQuantizer,
+    'pq': ProductQuantizer
+}
+
+class CompressedIndex:
+    """Compact codes of a ``VectorIndex``, scanned before the best candidates are re-scored at full precision."""
+
+    def __init__(self, vectors: VectorIndex, mode: str = 'int8', rerank_factor: int = RERANK_FACTOR,
+                 pq_subspaces: int = PQ_SUBSPACES, train_size: int = 65536, seed: int = 0):
+        if mode not in CODECS:
+            raise ValueError(f"Unknown compression mode: {mode}")
+        self.vectors = vectors
+        self.mode = mode
+        self.codec = ProductQuantizer(m=pq_subspaces, seed=seed) if mode == 'pq' else CODECS[mode]()
+        self.rerank_factor = max(1, rerank_factor)
+        self.train_size = train_size
+        self.seed = seed
+        self.is_trained = False
+        self._codes = None
+        self._assigned_rows = 0
+        self._epoch = None  # ``VectorIndex.epoch`` the codes were encoded in
+        self._lock = threading.RLock()
+
+    def train(self) -> bool:
+        """Fit the codec on a sample of live rows and re-encode everything."""
+        live_rows = np.flatnonzero(self.vectors.get_live_mask())
+        if len(live_rows) == 0:
+            return False
+        rng = np.random.default_rng(self.seed)
+        sample_rows = np.sort(rng.choice(live_rows, size=min(len(live_rows), self.train_size), replace=False))
+        self.codec.train(np.asarray(self.vectors.get_matrix()[sample_rows]))
+        self.is_trained = True
+        self._codes = None
+        self._assigned_rows = 0
+        self.sync()
+        log_info(f"Trained {self.mode} compression: {self.memory_bytes()} bytes for {self._assigned_rows} rows")
+        return True
+
+    def sync(self):
+        """Encode rows appended to the underlying index since the last call."""
+        with self._lock:
+            if not self.is_trained:
+                return
+            epoch = self.vectors.epoch
+            if epoch % 2:
+                return  # Rows are being renumbered; a later call catches up
+            if epoch != self._epoch:
+                self._assigned_rows = 0  # Compaction renumbered the rows; re-encode them
+                self._epoch = epoch
+            row_count = self.vectors.row_count
+            if row_count <= self._assigned_rows:
+                return
+
+            shape, dtype = self.codec.code_shape(self.vectors.dimension)
+            capacity = self._codes.shape[0] if self._codes is not None else 0
+            if row_count > capacity:
+                codes = np.zeros((max(row_count, capacity * 2, 1024),) + shape, dtype=dtype)
+                if self._assigned_rows:
+                    codes[:self._assigned_rows] = self._codes[:self._assigned_rows]
+                self._codes = codes
+
+            matrix = self.vectors.get_matrix()
+            for start in range(self._assigned_rows, row_count, SCORE_CHUNK_ROWS):
+                stop = min(start + SCORE_CHUNK_ROWS, row_count)
+                self._codes[start:stop] = self.codec.encode(matrix[start:stop])
+            self._assigned_rows = row_count
+            if self.vectors.epoch != epoch:
+                self._epoch = None  # Compacted meanwhile: start over next time
+
+    def memory_bytes(self) -> int:
+        """Resident size of the codes for the rows assigned so far."""
+        if self._codes is None:
+            return 0
+        return int(self._codes[:self._assigned_rows].nbytes)
+
+    def score_rows(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores from the codes, for all rows or a subset."""
+        self.sync()
+        if rows is not None:
+            return self.codec.score(query, self._codes[rows])
+        scores = np.empty(self._assigned_rows, dtype=np.float32)
+        for start in range(0, self._assigned_rows, SCORE_CHUNK_ROWS):
+            stop = min(start + SCORE_CHUNK_ROWS, self._assigned_rows)
+            scores[start:stop] = self.codec.score(query, self._codes[start:stop])
+        return scores
+
+    def rerank(self, query: np.ndarray, rows: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Exact cosine scores for candidate rows, read from the full-precision matrix."""
+        if len(rows) == 0:
+            return []
+        rows = np.sort(rows)
+        scores = np.asarray(self.vectors.get_matrix()[rows]) @ query
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        ids = self.vectors.ids_at(rows[top])
+        return [(node_id, float(scores[i])) for node_id, i in zip(ids, top)]
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Scan the codes, then re-rank the best candidates exactly.
+
+        ``rows`` restricts the scan to a sorted subset of live rows, such as
+        the output of ``VectorIndex.filter_rows``.
+        """
+        if top_k <= 0 or len(self.vectors) == 0:
+            return []
+        if not self.is_trained and not self.train():
+            if rows is not None:
+                return self.vectors.search_rows(VectorIndex.normalize(query_vector), rows, top_k)
+            return self.vectors.search(query_vector, top_k)
+
+        query = VectorIndex.normalize(query_vector)
+        if rows is not None:
+            if len(rows) == 0:
+                return []
+            approximate = self.score_rows(query, rows)
+            candidates = min(len(rows), top_k * self.rerank_factor)
+            if candidates < len(rows):
+                rows = rows[np.argpartition(-approximate, candidates - 1)[:candidates]]
+            return self.rerank(query, rows, top_k)
+
+        scores = self.score_rows(query)
+        live = self.vectors.live_at(np.arange(len(scores)))
+        scores[~live] = -np.inf
+        candidates = min(len(self.vectors), top_k * self.rerank_factor)
+        rows = np.argpartition(-scores, candidates - 1)[:candidates] if candidates < len(scores) \
+            else np.arange(len(scores))
+        return self.rerank(query, rows[live[rows]], top_k)
+
+    def save(self, path: str) -> bool:
+        """Persist the trained codec and codes next to the vector store."""
+        try:
+            if not self.is_trained:
+                return False
+            state = {f"codec_{key}": value for key, value in self.codec.get_state().items()}
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, mode=np.array(self.mode), codes=self._codes[:self._assigned_rows],
+                     assigned_rows=np.array(self._assigned_rows),
+                     epoch=np.array(-1 if self._epoch is None else self._epoch), **state)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            log_error(f"Error saving compressed index to {path}: {str(e)}")
+            return False
+
+    def load(self, path: str) -> bool:
+        """Load saved codes; returns False if they are missing, stale or use another mode."""
+        try:
+            if not os.path.exists(path):
+                return False
+            with np.load(path) as data:
+                assigned_rows = int(data['assigned_rows'])
+                epoch = int(data['epoch']) if 'epoch' in data.files else 0
+                if str(data['mode']) != self.mode or assigned_rows > self.vectors.row_count \
+                        or epoch != self.vectors.epoch:
+                    log_info(f"Ignoring stale compressed index at {path}")
+                    return False
+                self.codec.set_state({key[len('codec_'):]: data[key] for key in data.files
+                                      if key.startswith('codec_')})
+                self._codes = data['codes']
+            self._assigned_rows = assigned_rows
+            self._epoch = epoch
+            self.is_trained = True
+            return True
+        except Exception as e:
+            log_error(f"Error loading compressed index from {path}: {str(e)}")
+            return False
\ No newline at end of file
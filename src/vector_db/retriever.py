@@ -1,35 +1,232 @@
+import os
+import threading
+import time
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 from scipy.spatial.distance import cosine
 from .vectorizer import Vectorizer
-from ..core.logger import log_info, log_error
+from .index import VectorIndex
+from .filters import FilterSpec
+from .ann import IVFIndex
+from .quantization import CompressedIndex
+from .sharding import ShardedSearcher
+from .bm25 import BM25Index
+from ..core.logger import log_info, log_warning, log_error
+from ..core.config import ANN_MIN_VECTORS, VECTOR_COMPRESSION, SEARCH_SHARDS, HYBRID_CANDIDATES, RRF_K
+
+# vector: dense only; hybrid: reciprocal-rank fusion of BM25 and dense results;
+# shortlist: dense scoring of the BM25 candidates only
+SEARCH_MODES = ('vector', 'hybrid', 'shortlist')
 
 class Retriever:
-    def __init__(self, vectorizer: Vectorizer):
+    def __init__(self, vectorizer: Vectorizer, ann_index: Optional[IVFIndex] = None,
+                 ann_min_vectors: int = ANN_MIN_VECTORS, compression: str = VECTOR_COMPRESSION,
+                 shards: int = SEARCH_SHARDS, lexical_index: Optional[BM25Index] = None,
+                 hybrid_candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K):
         self.vectorizer = vectorizer
+        self.ann_min_vectors = ann_min_vectors
+        self.lexical_index = lexical_index
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        # Guards the one-off lazy training below when several queries arrive at once
+        self._train_lock = threading.Lock()
+        self.sharded = ShardedSearcher(vectorizer.vectors, shards) if shards > 1 else None
+
+        self.compressed_index = None
+        if compression and compression != 'none':
+            if vectorizer.store is None:
+                # Re-ranking reads the float32 matrix, which only a store keeps out of RAM
+                log_warning(f"Vector compression '{compression}' without a vector store keeps "
+                            f"the full-precision vectors in memory")
+            self.compressed_index = CompressedIndex(vectorizer.vectors, mode=compression)
+            if self._store_file('compressed.npz'):
+                self.compressed_index.load(self._store_file('compressed.npz'))
+
+        self.ann_index = ann_index or IVFIndex(vectorizer.vectors, compressed=self.compressed_index)
+        if ann_index is None and self._store_file('ivf.npz'):
+            self.ann_index.load(self._store_file('ivf.npz'))
+
+    def _store_file(self, name: str) -> Optional[str]:
+        if self.vectorizer.store is None:
+            return None
+        return os.path.join(self.vectorizer.store.path, name)
+
+    def _ensure_compressed(self):
+        if self.compressed_index is not None and not self.compressed_index.is_trained:
+            with self._train_lock:
+                if not self.compressed_index.is_trained and self.compressed_index.train() \
+                        and self._store_file('compressed.npz'):
+                    self.compressed_index.save(self._store_file('compressed.npz'))
+
+    def close(self):
+        """Stop the shard workers and release their shared memory."""
+        if self.sharded is not None:
+            self.sharded.close()
 
     def calculate_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors."""
         return 1 - cosine(vec1, vec2)
 
-    def get_similar_nodes(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
-        """Retrieve top-k similar nodes for a given query."""
-        try:
-            query_vector = self.vectorizer.text_to_vector(query)
-            similarities = []
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 5,
+                      filters: Optional[FilterSpec] = None) -> List[Tuple[str, float]]:
+        """Search by vector, switching to the IVF index once the corpus is large.
+
+        ``filters`` maps an attribute (``type``, ``file_type``,
+        ``document_id``) to a value or list of values. Matching rows come
+        from the filter bitmaps; a selective filter is searched exactly over
+        just those rows, since IVF cells would mostly hold non-matching rows.
+        """
+        self._ensure_compressed()
+        mask = self.vectorizer.vectors.filter_mask(filters) if filters else None
+        return self._search(query_vector, top_k, mask)
+
+    def _search(self, query_vector: np.ndarray, top_k: int, mask: Optional[np.ndarray]) -> List[Tuple[str, float]]:
+        candidates = int(mask.sum()) if mask is not None else len(self.vectorizer.vectors)
+        if candidates < self.ann_min_vectors:
+            rows = np.flatnonzero(mask) if mask is not None else None
+            if self.compressed_index is not None:
+                return self.compressed_index.search(query_vector, top_k, rows=rows)
+            if rows is not None:
+                return self.vectorizer.vectors.search_rows(VectorIndex.normalize(query_vector), rows, top_k)
+            if self.sharded is not None:
+                return self.sharded.search(query_vector, top_k)
+            return self.vectorizer.vectors.search(query_vector, top_k)
+
+        if not self.ann_index.is_trained:
+            with self._train_lock:
+                if not self.ann_index.is_trained and self.ann_index.rebuild() and self._store_file('ivf.npz'):
+                    self.ann_index.save(self._store_file('ivf.npz'))
+        return self.ann_index.search(query_vector, top_k, mask=mask)
 
-            for node_id, vector in self.vectorizer.get_all_vectors().items():
-                similarity = self.calculate_similarity(query_vector, vector)
-                similarities.append((node_id, similarity))
+    def search_batch(self, query_vectors: np.ndarray, top_k: int = 5,
+                     filters: Optional[FilterSpec] = None) -> Iterator[List[Tuple[str, float]]]:
+        """Yield results for many query vectors, in order.
+
+        On the exact path all queries are scored together with blocked
+        matrix-matrix products. Compressed and IVF searches stay per query,
+        but they share one filter mask.
+        """
+        self._ensure_compressed()
+        vectors = self.vectorizer.vectors
+        mask = vectors.filter_mask(filters) if filters else None
+        candidates = int(mask.sum()) if mask is not None else len(vectors)
+        if self.compressed_index is None and candidates < self.ann_min_vectors:
+            rows = np.flatnonzero(mask) if mask is not None else None
+            yield from vectors.search_batch(query_vectors, top_k, rows)
+            return
+        for query_vector in query_vectors:
+            yield self._search(query_vector, top_k, mask)
+
+    def _lexical_candidates(self, query: str, mask: Optional[np.ndarray]) -> List[Tuple[str, float]]:
+        """BM25 candidates, restricted to vectorized rows that pass the filter mask."""
+        if self.lexical_index is None:
+            return []
+        results = self.lexical_index.search(query, self.hybrid_candidates)
+        if mask is None:
+            return results
+        rows = [self.vectorizer.vectors.get_row(node_id) for node_id, _ in results]
+        return [result for result, row in zip(results, rows) if row is not None and row < len(mask) and mask[row]]
 
-            # Sort by similarity score in descending order
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:top_k]
+    def hybrid_search(self, query: str, query_vector: np.ndarray, top_k: int = 5,
+                      filters: Optional[FilterSpec] = None) -> List[Tuple[str, float]]:
+        """Fuse BM25 and dense rankings with reciprocal-rank fusion.
+
+        Each stage contributes ``1 / (rrf_k + rank)`` per node, so exact-term
+        matches surface even when their embeddings are not the closest.
+        """
+        self._ensure_compressed()
+        mask = self.vectorizer.vectors.filter_mask(filters) if filters else None
+        fused: Dict[str, float] = {}
+        for results in (self._search(query_vector, self.hybrid_candidates, mask),
+                        self._lexical_candidates(query, mask)):
+            for rank, (node_id, _) in enumerate(results, 1):
+                fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+
+    def shortlist_search(self, query: str, query_vector: np.ndarray, top_k: int = 5,
+                         filters: Optional[FilterSpec] = None) -> List[Tuple[str, float]]:
+        """Dense-score only the BM25 candidates, falling back to a full search without any."""
+        self._ensure_compressed()
+        vectors = self.vectorizer.vectors
+        mask = vectors.filter_mask(filters) if filters else None
+        rows = [vectors.get_row(node_id) for node_id, _ in self._lexical_candidates(query, mask)]
+        rows = np.array(sorted(row for row in rows if row is not None), dtype=np.int64)
+        if len(rows) == 0:
+            return self._search(query_vector, top_k, mask)
+        return vectors.search_rows(VectorIndex.normalize(query_vector), rows, top_k)
+
+    def _stable(self, search, *args):
+        """Run a search, repeating it if the index was compacted meanwhile.
+
+        Compaction renumbers rows without blocking readers, so a search that
+        overlapped it may have mixed old and new rows. ``VectorIndex.epoch``
+        is odd during the swap and changes with it, like a seqlock.
+        """
+        vectors = self.vectorizer.vectors
+        while True:
+            epoch = vectors.epoch
+            if epoch % 2 == 0:
+                try:
+                    results = search(*args)
+                except Exception:
+                    if vectors.epoch == epoch:
+                        raise
+                    continue
+                if vectors.epoch == epoch:
+                    return results
+            time.sleep(0)
+
+    def get_similar_nodes(self, query: str, top_k: int = 5, filters: Optional[FilterSpec] = None,
+                          mode: str = 'vector') -> List[Tuple[str, float]]:
+        """Retrieve top-k similar nodes for a given query, optionally filtered.
+
+        ``mode`` is one of ``SEARCH_MODES``; the lexical modes need a
+        ``lexical_index``.
+        """
+        try:
+            query_vector = self.vectorizer.text_to_vector(query)
+            if mode == 'hybrid':
+                return self._stable(self.hybrid_search, query, query_vector, top_k, filters)
+            if mode == 'shortlist':
+                return self._stable(self.shortlist_search, query, query_vector, top_k, filters)
+            return self._stable(self.search_vector, query_vector, top_k, filters)
 
         except Exception as e:
             log_error(f"Error retrieving similar nodes: {str(e)}")
             return []
 
+    def get_similar_nodes_batch(self, queries: List[str], top_k: int = 5,
+                                filters: Optional[FilterSpec] = None) -> Iterator[List[Tuple[str, float]]]:
+        """Retrieve top-k similar nodes for each query, encoding all queries in batches.
+
+        Results are checked against ``VectorIndex.epoch`` like ``_stable``;
+        after a compaction the remaining queries are searched again. Errors
+        are logged and raised, so a consumer can tell a failed stream from
+        a finished one.
+        """
+        try:
+            query_vectors = self.vectorizer.texts_to_vectors(queries)
+            vectors = self.vectorizer.vectors
+            done = 0
+            while done < len(query_vectors):
+                epoch = vectors.epoch
+                if epoch % 2:
+                    time.sleep(0)
+                    continue
+                try:
+                    for results in self.search_batch(query_vectors[done:], top_k, filters):
+                        if vectors.epoch != epoch:
+                            break
+                        yield results
+                        done += 1
+                except Exception:
+                    if vectors.epoch == epoch:
+                        raise
+
+        except Exception as e:
+            log_error(f"Error retrieving similar nodes for batch: {str(e)}")
+            raise
+
     def get_node_info(self, node_id: str) -> Dict[str, Any]:
         """Get metadata for a specific node."""
         return self.vectorizer.metadata.get(node_id, {})
\ No newline at end of file
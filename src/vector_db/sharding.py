@@ -0,0 +1,157 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .index import VectorIndex
+from ..core.logger import log_info, log_error
+from ..core.config import SEARCH_SHARDS, SHARD_MIN_ROWS
+
+# Arrays mapped by this worker process, keyed by descriptor:
+# (role, kind, location, shape, dtype) with kind 'shm' or 'file'
+_attached: Dict[Tuple, Tuple[Optional[shared_memory.SharedMemory], np.ndarray]] = {}
+
+def _attach(descriptor: Tuple) -> np.ndarray:
+    """Map a shared array once per worker, releasing the role's older mappings."""
+    entry = _attached.get(descriptor)
+    if entry is not None:
+        return entry[1]
+    for stale in [key for key in _attached if key[0] == descriptor[0]]:
+        block, _ = _attached.pop(stale)
+        if block is not None:
+            block.close()
+
+    role, kind, location, shape, dtype = descriptor
+    if kind == 'shm':
+        block = shared_memory.SharedMemory(name=location)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    else:
+        block = None
+        array = np.memmap(location, dtype=dtype, mode='r', shape=shape)
+    _attached[descriptor] = (block, array)
+    return array
+
+def _search_shard(matrix: Tuple, live: Tuple, start: int, stop: int,
+                  query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Worker task: local top-k over rows ``[start, stop)`` of the shared matrix."""
+    scores = np.asarray(_attach(matrix)[start:stop]) @ query
+    scores[~_attach(live)[start:stop]] = -np.inf
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.isfinite(scores[top])]
+    return top + start, scores[top]
+
+class ShardedSearcher:
+    """Exact search split across worker processes that each score a contiguous range of rows."""
+
+    def __init__(self, vectors: VectorIndex, shards: int = SEARCH_SHARDS, min_rows: int = SHARD_MIN_ROWS):
+        self.vectors = vectors
+        self.shards = shards
+        self.min_rows = min_rows
+        self._pool = None
+        self._lock = threading.Lock()
+        self._blocks: Dict[str, shared_memory.SharedMemory] = {}
+        self._retired: Dict[str, shared_memory.SharedMemory] = {}
+        self._descriptors: Dict[str, Tuple] = {}
+        self._published_rows = 0
+        self._version = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers re-import the launching script as __mp_main__, so entry points
+            # must build their components under a __main__ guard or factory (see main.py)
+            self._pool = ProcessPoolExecutor(max_workers=self.shards,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            log_info(f"Started {self.shards} vector search workers")
+        return self._pool
+
+    def _shared_array(self, role: str, shape: Tuple[int, ...], dtype: np.dtype) -> Tuple[np.ndarray, bool]:
+        """Shared array for a role, reallocated geometrically; also reports whether it is new."""
+        descriptor = self._descriptors.get(role)
+        if descriptor is not None and descriptor[1] == 'shm' and descriptor[3][0] >= shape[0] \
+                and descriptor[3][1:] == shape[1:]:
+            return np.ndarray(descriptor[3], dtype=dtype, buffer=self._blocks[role].buf), False
+
+        capacity = max(shape[0], 2 * descriptor[3][0] if descriptor else 0, 1024)
+        full_shape = (capacity,) + tuple(shape[1:])
+        nbytes = int(np.prod(full_shape)) * np.dtype(dtype).itemsize
+        block = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+        # Keep the previous block for one generation so in-flight tasks can still attach
+        old = self._retired.pop(role, None)
+        if old is not None:
+            old.close()
+            old.unlink()
+        if role in self._blocks:
+            self._retired[role] = self._blocks[role]
+        self._blocks[role] = block
+        self._descriptors[role] = (role, 'shm', block.name, full_shape, np.dtype(dtype).str)
+        return np.ndarray(full_shape, dtype=dtype, buffer=block.buf), True
+
+    def publish(self):
+        """Make rows and tombstones changed since the last call visible to workers."""
+        # Rows are append-only between compactions, so these counts identify the state
+        version = (self.vectors.epoch, self.vectors.row_count, self.vectors.tombstone_count)
+        if version == self._version:
+            return
+        renumbered = self._version is None or self._version[0] != version[0]
+        size = self.vectors.row_count
+        matrix_file = self.vectors.storage.matrix_file() if self.vectors.storage is not None else None
+        if matrix_file is not None:
+            # Writes through the parent's memmap share the page cache with the workers' mappings
+            path, shape = matrix_file
+            self._descriptors['matrix'] = ('matrix', 'file', path, shape, np.dtype(np.float32).str)
+        else:
+            shared, fresh = self._shared_array('matrix', (size, self.vectors.dimension), np.float32)
+            start = 0 if fresh or renumbered else self._published_rows
+            shared[start:size] = self.vectors.get_matrix()[start:size]
+
+        live, _ = self._shared_array('live', (size,), np.bool_)
+        live[:size] = self.vectors.get_live_mask()
+        self._published_rows = size
+        self._version = version
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Exact top-k search, fanned out over the worker pool for large indexes."""
+        if top_k <= 0 or len(self.vectors) == 0:
+            return []
+        if self.shards <= 1 or self.vectors.row_count < self.min_rows:
+            return self.vectors.search(query_vector, top_k)
+        try:
+            with self._lock:
+                self.publish()
+                matrix, live = self._descriptors['matrix'], self._descriptors['live']
+                size = self._published_rows
+
+            query = VectorIndex.normalize(query_vector)
+            bounds = np.linspace(0, size, self.shards + 1).astype(int)
+            pool = self._executor()
+            futures = [pool.submit(_search_shard, matrix, live, int(start), int(stop), query, top_k)
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            parts = [future.result() for future in futures]
+            rows = np.concatenate([part[0] for part in parts])
+            scores = np.concatenate([part[1] for part in parts])
+            if len(rows) == 0:
+                return []
+
+            k = min(top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            ids = self.vectors.ids_at(rows[top])
+            # A row may have been tombstoned while the workers were scoring
+            return [(node_id, float(scores[i])) for node_id, i in zip(ids, top) if node_id is not None]
+
+        except Exception as e:
+            log_error(f"Error in sharded search, falling back to a local scan: {str(e)}")
+            return self.vectors.search(query_vector, top_k)
+
+    def close(self):
+        """Stop the workers and release the shared memory blocks."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for block in list(self._blocks.values()) + list(self._retired.values()):
+            block.close()
+            block.unlink()
+        self._blocks, self._retired, self._descriptors = {}, {}, {}
+        self._version = None
\ No newline at end of file
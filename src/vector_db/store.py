@@ -0,0 +1,338 @@
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Tuple
+from .index import VectorIndex, COMPACT_CHUNK_ROWS
+from ..core.logger import log_info, log_error
+
+MANIFEST_FILE = 'manifest.json'
+ROW_DTYPE = np.float32
+GENERATION_PATTERN = re.compile(r'^(?:vectors|ids|metadata)\.(\d+)\.(?:f32|log|jsonl)$')
+
+class MetadataSidecar(MutableMapping):
+    """Node metadata stored as JSON lines in the store's sidecar file.
+
+    Committed entries are read from disk on access using the offsets kept
+    in the id table; new or changed entries stay in memory until the next
+    ``VectorStore.flush``.
+    """
+
+    def __init__(self, path: Optional[str] = None, offsets: Dict[str, Tuple[int, int]] = None):
+        self.path = path
+        self._offsets = offsets or {}
+        self._pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __getitem__(self, node_id: str) -> Any:
+        if node_id in self._pending:
+            return self._pending[node_id]
+        with self._lock:
+            offset, length = self._offsets[node_id]
+            if self._file is None:
+                self._file = open(self.path, 'rb')
+            self._file.seek(offset)
+            raw = self._file.read(length)
+        return json.loads(raw)
+
+    def __setitem__(self, node_id: str, value: Any):
+        self._pending[node_id] = value
+
+    def __delitem__(self, node_id: str):
+        found = node_id in self._pending or node_id in self._offsets
+        self._pending.pop(node_id, None)
+        self._offsets.pop(node_id, None)
+        if not found:
+            raise KeyError(node_id)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._pending or node_id in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self._pending)
+        yield from [node_id for node_id in list(self._offsets) if node_id not in self._pending]
+
+    def __len__(self) -> int:
+        return len(self._offsets) + sum(1 for node_id in self._pending if node_id not in self._offsets)
+
+    def pending_items(self) -> List[Tuple[str, Any]]:
+        """Entries that have not been written to the sidecar yet."""
+        return list(self._pending.items())
+
+    def mark_committed(self, offsets: Dict[str, Tuple[int, int]]):
+        """Record sidecar offsets for entries that were just flushed."""
+        for node_id, location in offsets.items():
+            self._offsets[node_id] = location
+            self._pending.pop(node_id, None)
+
+    def rebase(self, path: str, offsets: Dict[str, Tuple[int, int]]):
+        """Switch to a rewritten sidecar file holding every entry at ``offsets``."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path = path
+            self._offsets = offsets
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class VectorStore:
+    """Persistent vector store in a directory on disk.
+
+    ``flush`` commits atomically; ``open`` discards anything written after the
+    last commit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = {
+            'version': 1,
+            'generation': 0,
+            'dimension': None,
+            'rows': 0,
+            'ids_bytes': 0,
+            'metadata_bytes': 0
+        }
+        self._committed_live = np.zeros(0, dtype=bool)
+        self._matrix = None
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.manifest['generation'] if generation is None else generation
+        names = {
+            'vectors': f"vectors.{generation}.f32",
+            'ids': f"ids.{generation}.log",
+            'metadata': f"metadata.{generation}.jsonl"
+        }
+        return os.path.join(self.path, names[kind])
+
+    def resize(self, matrix: Optional[np.ndarray], size: int, capacity: int, dimension: int) -> np.ndarray:
+        """Grow the memory-mapped matrix file; existing rows stay where they are on disk."""
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest['dimension'] = dimension
+        data_path = self._file('vectors')
+        row_bytes = dimension * np.dtype(ROW_DTYPE).itemsize
+        with open(data_path, 'ab') as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        if matrix is not None and isinstance(matrix, np.memmap):
+            matrix.flush()
+        self._matrix = np.memmap(data_path, dtype=ROW_DTYPE, mode='r+', shape=(capacity, dimension))
+        return self._matrix
+
+    def matrix_file(self) -> Optional[Tuple[str, Tuple[int, int]]]:
+        """Path and shape of the mapped matrix file, for readers in other processes."""
+        if self._matrix is None:
+            return None
+        return self._file('vectors'), tuple(self._matrix.shape)
+
+    def open(self) -> Tuple[VectorIndex, MetadataSidecar, Dict[str, str]]:
+        """Open the store, returning the index, metadata mapping and content hashes.
+
+        Only the id table is read eagerly; vectors and metadata are paged in
+        lazily from their files.
+        """
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return VectorIndex(storage=self), MetadataSidecar(self._file('metadata')), {}
+
+        with open(manifest_path, 'r') as f:
+            self.manifest = json.load(f)
+        self._remove_other_generations()
+
+        # Discard log bytes written by a flush that never committed
+        for kind, key in (('ids', 'ids_bytes'), ('metadata', 'metadata_bytes')):
+            with open(self._file(kind), 'ab') as f:
+                if f.tell() > self.manifest[key]:
+                    f.truncate(self.manifest[key])
+
+        rows = self.manifest['rows']
+        ids: List[Optional[str]] = [None] * rows
+        attributes: List[Optional[Dict[str, Any]]] = [None] * rows
+        hashes: Dict[str, str] = {}
+        offsets: Dict[str, Tuple[int, int]] = {}
+        with open(self._file('ids'), 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record[0] == 'add':
+                    _, row, node_id, digest = record[:4]
+                    ids[row] = node_id
+                    hashes[node_id] = digest
+                    if len(record) > 4:
+                        attributes[row] = record[4]
+                elif record[0] == 'del':
+                    ids[record[1]] = None
+                elif record[0] == 'meta':
+                    offsets[record[1]] = (record[2], record[3])
+
+        live_ids = {node_id for node_id in ids if node_id is not None}
+        hashes = {node_id: digest for node_id, digest in hashes.items() if node_id in live_ids}
+        offsets = {node_id: loc for node_id, loc in offsets.items() if node_id in live_ids}
+
+        dimension = self.manifest['dimension']
+        capacity = 0
+        if dimension and os.path.exists(self._file('vectors')):
+            row_bytes = dimension * np.dtype(ROW_DTYPE).itemsize
+            capacity = max(rows, os.path.getsize(self._file('vectors')) // row_bytes)
+        if capacity:
+            self._matrix = np.memmap(self._file('vectors'), dtype=ROW_DTYPE, mode='r+', shape=(capacity, dimension))
+            index = VectorIndex.from_arrays(self._matrix, ids, storage=self, attributes=attributes)
+        else:
+            index = VectorIndex(dimension=dimension, storage=self)
+        index.epoch = 2 * self.manifest['generation']
+        self._committed_live = index.get_live_mask()
+
+        log_info(f"Opened vector store {self.path} with {len(index)} vectors")
+        return index, MetadataSidecar(self._file('metadata'), offsets), hashes
+
+    def flush(self, index: VectorIndex, metadata: MutableMapping, hashes: Dict[str, str]) -> bool:
+        """Durably commit everything added to the index since the last flush."""
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            committed = self.manifest['rows']
+            size = index.row_count
+            live = index.get_live_mask()
+            ids = index.get_ids()
+
+            records = [['del', int(row)] for row in
+                       np.flatnonzero(self._committed_live[:committed] & ~live[:committed])]
+            attributes = index.filters.attributes_for_rows(committed, size)
+            records += [['add', row, ids[row], hashes.get(ids[row]), attributes[row - committed]]
+                        for row in range(committed, size) if live[row]]
+
+            if isinstance(metadata, MetadataSidecar):
+                changed = [(node_id, value) for node_id, value in metadata.pending_items() if node_id in index]
+            else:
+                changed = [(ids[row], metadata.get(ids[row])) for row in range(committed, size) if live[row]]
+
+            if isinstance(self._matrix, np.memmap):
+                self._matrix.flush()
+
+            offsets = {}
+            with open(self._file('metadata'), 'ab') as f:
+                f.truncate(self.manifest['metadata_bytes'])
+                position = self.manifest['metadata_bytes']
+                for node_id, value in changed:
+                    line = json.dumps(value, default=str).encode('utf-8') + b'\n'
+                    f.write(line)
+                    offsets[node_id] = (position, len(line))
+                    records.append(['meta', node_id, position, len(line)])
+                    position += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+                metadata_bytes = position
+
+            with open(self._file('ids'), 'ab') as f:
+                f.truncate(self.manifest['ids_bytes'])
+                for record in records:
+                    f.write(json.dumps(record).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+                ids_bytes = f.tell()
+
+            manifest = dict(self.manifest, dimension=index.dimension, rows=size,
+                            ids_bytes=ids_bytes, metadata_bytes=metadata_bytes)
+            self._write_manifest(manifest)
+            self.manifest = manifest
+            self._committed_live = live
+            if isinstance(metadata, MetadataSidecar):
+                metadata.mark_committed(offsets)
+
+            log_info(f"Flushed vector store {self.path}: {size - committed} new rows, {len(records)} records")
+            return True
+        except Exception as e:
+            log_error(f"Error flushing vector store {self.path}: {str(e)}")
+            return False
+
+    def compact(self, index: VectorIndex, metadata: MutableMapping, hashes: Dict[str, str]) -> bool:
+        """Rewrite the store without tombstoned rows as its next generation.
+
+        Pending changes are flushed first. The live rows, their id records
+        and metadata are copied to new files, the manifest commits them,
+        and then ``index`` and ``metadata`` are switched over and the old
+        files deleted. Callers must hold off writers until it returns.
+        """
+        try:
+            if not self.flush(index, metadata, hashes):
+                return False
+            start = time.perf_counter()
+            generation = self.manifest['generation'] + 1
+            rows = np.flatnonzero(index.get_live_mask())
+            ids = index.ids_at(rows)
+            attributes = index.filters.attributes_for_rows(0, index.row_count)
+
+            matrix = np.memmap(self._file('vectors', generation), dtype=ROW_DTYPE, mode='w+',
+                               shape=(max(len(rows), 1), index.dimension))
+            source = index.get_matrix()
+            for offset in range(0, len(rows), COMPACT_CHUNK_ROWS):
+                chunk = rows[offset:offset + COMPACT_CHUNK_ROWS]
+                matrix[offset:offset + len(chunk)] = source[chunk]
+            matrix.flush()
+
+            offsets = {}
+            with open(self._file('metadata', generation), 'wb') as f:
+                for node_id in ids:
+                    line = json.dumps(metadata.get(node_id), default=str).encode('utf-8') + b'\n'
+                    offsets[node_id] = (f.tell(), len(line))
+                    f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                metadata_bytes = f.tell()
+
+            with open(self._file('ids', generation), 'wb') as f:
+                for row, node_id in enumerate(ids):
+                    record = ['add', row, node_id, hashes.get(node_id), attributes[rows[row]]]
+                    f.write(json.dumps(record).encode('utf-8') + b'\n')
+                for node_id, (offset, length) in offsets.items():
+                    f.write(json.dumps(['meta', node_id, offset, length]).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+                ids_bytes = f.tell()
+
+            manifest = dict(self.manifest, generation=generation, rows=len(rows),
+                            ids_bytes=ids_bytes, metadata_bytes=metadata_bytes)
+            self._write_manifest(manifest)
+            dropped = index.row_count - len(rows)
+            self.manifest = manifest
+            self._matrix = matrix
+            index.compact(matrix)
+            self._committed_live = index.get_live_mask()
+            if isinstance(metadata, MetadataSidecar):
+                metadata.rebase(self._file('metadata'), offsets)
+            self._remove_other_generations()
+
+            log_info(f"Compacted vector store {self.path} to generation {generation}: {len(rows)} rows kept, "
+                     f"{dropped} tombstones dropped ({time.perf_counter() - start:.2f}s)")
+            return True
+        except Exception as e:
+            log_error(f"Error compacting vector store {self.path}: {str(e)}")
+            return False
+
+    def _remove_other_generations(self):
+        """Delete files left by an earlier generation or by an interrupted compaction."""
+        for name in os.listdir(self.path):
+            match = GENERATION_PATTERN.match(name)
+            if match and int(match.group(1)) != self.manifest['generation']:
+                os.remove(os.path.join(self.path, name))
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        """Atomically replace the manifest; this is the commit point of a flush."""
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, manifest_path)
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(self.path, os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
\ No newline at end of file
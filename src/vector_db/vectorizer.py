@@ -1,50 +1,300 @@
+import hashlib
+import os
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Iterable, Optional
 from ..core.logger import log_info, log_error
-from ..core.config import HF_API_KEY
+from ..core.config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, \
+    VECTOR_COMPACTION_RATIO, VECTOR_COMPACTION_MIN_ROWS
+from .index import VectorIndex
+from .store import VectorStore
+from .embedding_cache import EmbeddingCache
+from .model_registry import model_registry
 
 class Vectorizer:
-    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(
+    def __init__(self, model_name: str = EMBEDDING_MODEL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, store_path: Optional[str] = None,
+                 backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        if store_path:
+            self.store = VectorStore(store_path)
+            self.vectors, self.metadata, self.node_hashes = self.store.open()
+        else:
+            self.store = None
+            self.vectors = VectorIndex()
+            self.metadata = {}
+            self.node_hashes = {}
+        self.embedding_cache = EmbeddingCache(
             model_name,
-            token=HF_API_KEY  # Add Hugging Face token for private models
+            persist_path=os.path.join(store_path, 'embedding_cache.npz') if store_path else None,
+            backend=backend
         )
-        self.vectors = {}
-        self.metadata = {}
+        self.batch_size = batch_size
+        self.last_batch_stats = {}
+        # Serializes index commits and flushes; searches read the append-only index without it
+        self._write_lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Shared embedding model, loaded on first use."""
+        return model_registry.get(self.model_name, self.backend)
 
     def text_to_vector(self, text: str) -> np.ndarray:
-        """Convert text to vector representation."""
-        return self.model.encode(text, convert_to_numpy=True)
+        """Convert text to vector representation, reusing cached embeddings."""
+        vector = self.embedding_cache.get(text)
+        if vector is None:
+            vector = self.model.encode(text, convert_to_numpy=True)
+            self.embedding_cache.put(text, vector)
+        return vector
+
+    def texts_to_vectors(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Encode many texts in length-bucketed batches.
+
+        Cached and duplicate texts are encoded once at most. The rest are
+        sorted by length so each batch holds similarly sized inputs and
+        little compute goes to padding. Rows of the result line up with the
+        input order.
+        """
+        batch_size = max(1, batch_size or self.batch_size)
+        start = time.perf_counter()
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = self.embedding_cache.key(text)
+            cached = self.embedding_cache.get_by_key(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+
+        keys = list(missing)
+        order = sorted(range(len(keys)), key=lambda k: len(texts[missing[keys[k]][0]]))
+        for offset in range(0, len(order), batch_size):
+            bucket = [keys[k] for k in order[offset:offset + batch_size]]
+            encoded = self.model.encode(
+                [texts[missing[key][0]] for key in bucket],
+                batch_size=len(bucket),
+                convert_to_numpy=True
+            )
+            for key, vector in zip(bucket, encoded):
+                self.embedding_cache.put_by_key(key, vector)
+                for position in missing[key]:
+                    results[position] = vector
+
+        elapsed = time.perf_counter() - start
+        self.last_batch_stats = {
+            'nodes': len(texts),
+            'encoded': len(keys),
+            'batch_size': batch_size,
+            'seconds': elapsed,
+            'nodes_per_second': len(texts) / elapsed if elapsed > 0 else 0.0
+        }
+        if texts:
+            log_info(
+                f"Embedded {len(texts)} texts ({len(keys)} encoded) in {elapsed:.2f}s "
+                f"({self.last_batch_stats['nodes_per_second']:.1f} nodes/s, batch size {batch_size})"
+            )
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(results).astype(np.float32, copy=False)
+
+    def node_to_text(self, node_data: Dict[str, Any]) -> str:
+        """Combine all node attributes into a single text."""
+        return " ".join([f"{k}: {v}" for k, v in node_data.items()])
+
+    def filter_attributes(self, node_data: Dict[str, Any],
+                          nodes: Optional[Dict[str, Any]] = None,
+                          file_types: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Attributes indexed in the filter bitmaps for a node.
+
+        Child nodes (tables, sheets, chunks) inherit the file type of the
+        document they belong to, looked up once per document via ``file_types``.
+        """
+        document_id = node_data.get('document_id')
+        file_type = node_data.get('file_type')
+        if file_type is None and nodes and document_id is not None:
+            if file_types is not None and document_id in file_types:
+                file_type = file_types[document_id]
+            else:
+                file_type = self._document_file_type(nodes, document_id)
+                if file_types is not None:
+                    file_types[document_id] = file_type
+        return {'type': node_data.get('type'), 'file_type': file_type, 'document_id': document_id}
+
+    def _document_file_type(self, nodes: Dict[str, Any], document_id: str) -> Any:
+        """The document's file type, read without materializing its content."""
+        if hasattr(nodes, 'attribute'):
+            return nodes.attribute(document_id, 'file_type')
+        document = nodes.get(document_id)
+        return document.get('file_type') if document else None
+
+    def content_hash(self, text: str) -> str:
+        """Hash the text a node is embedded from."""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
 
     def vectorize_node(self, node_id: str, node_data: Dict[str, Any]) -> bool:
         """Vectorize a single node from the knowledge graph."""
         try:
-            # Combine all node attributes into a single text
-            text = " ".join([f"{k}: {v}" for k, v in node_data.items()])
+            text = self.node_to_text(node_data)
             vector = self.text_to_vector(text)
-            self.vectors[node_id] = vector
-            self.metadata[node_id] = node_data
+            with self._write_lock:
+                self.vectors.add(node_id, vector, self.filter_attributes(node_data))
+                self.metadata[node_id] = node_data
+                self.node_hashes[node_id] = self.content_hash(text)
             return True
         except Exception as e:
             log_error(f"Error vectorizing node {node_id}: {str(e)}")
             return False
 
+    def remove_node(self, node_id: str) -> bool:
+        """Drop a node's vector, metadata and content hash."""
+        with self._write_lock:
+            self.metadata.pop(node_id, None)
+            self.node_hashes.pop(node_id, None)
+            return self.vectors.remove(node_id)
+
+    def remove_nodes(self, node_ids: Iterable[str]) -> int:
+        """Tombstone several nodes' vectors under one lock; returns how many were indexed."""
+        with self._write_lock:
+            return sum(self.remove_node(node_id) for node_id in node_ids)
+
+    def vectorize_nodes(self, graph_data: Dict[str, Any], node_ids: Iterable[str],
+                        batch_size: Optional[int] = None) -> bool:
+        """Vectorize only the given nodes, skipping ones whose content is unchanged.
+
+        Changed nodes are embedded in batches. Ids that are no longer in the
+        graph are removed from the index. Embedding runs without the write
+        lock; only appending each finished batch to the index holds it, so
+        concurrent uploads overlap and queries never wait.
+        """
+        try:
+            nodes = graph_data['nodes']
+            flush_size = max(1, batch_size or self.batch_size) * 16
+            pending_ids, pending_nodes, pending_texts, pending_hashes = [], [], [], []
+            file_types = {}
+            embedded = skipped = removed = 0
+
+            def flush():
+                vectors = self.texts_to_vectors(pending_texts, batch_size)
+                attributes = [self.filter_attributes(node_data, nodes, file_types)
+                              for node_data in pending_nodes]
+                with self._write_lock:
+                    self.vectors.add_batch(pending_ids, vectors, attributes)
+                    for node_id, node_data, digest in zip(pending_ids, pending_nodes, pending_hashes):
+                        self.metadata[node_id] = node_data
+                        self.node_hashes[node_id] = digest
+                pending_ids.clear()
+                pending_nodes.clear()
+                pending_texts.clear()
+                pending_hashes.clear()
+
+            for node_id in node_ids:
+                node_data = nodes.get(node_id)
+                if node_data is None:
+                    removed += self.remove_node(node_id)
+                    continue
+                if node_data.get('chunked'):
+                    # Content is represented by the node's chunks
+                    self.remove_node(node_id)
+                    skipped += 1
+                    continue
+
+                text = self.node_to_text(node_data)
+                digest = self.content_hash(text)
+                if self.node_hashes.get(node_id) == digest and node_id in self.vectors:
+                    skipped += 1
+                    continue
+
+                pending_ids.append(node_id)
+                pending_nodes.append(node_data)
+                pending_texts.append(text)
+                pending_hashes.append(digest)
+                embedded += 1
+                if len(pending_ids) >= flush_size:
+                    flush()
+
+            if pending_ids:
+                flush()
+
+            log_info(f"Vectorized {embedded} nodes ({skipped} unchanged, {removed} removed)")
+            return True
+        except Exception as e:
+            log_error(f"Error vectorizing nodes: {str(e)}")
+            return False
+
     def convert_to_vector(self, graph_data: Dict[str, Any]) -> bool:
-        """Convert entire knowledge graph to vector representations."""
+        """Sync vectors with the whole knowledge graph, embedding only new or changed nodes."""
         try:
-            for node_id, attributes in graph_data['nodes'].items():
-                self.vectorize_node(node_id, attributes)
+            stale = [node_id for node_id in self.node_hashes if node_id not in graph_data['nodes']]
+            if not self.vectorize_nodes(graph_data, list(graph_data['nodes']) + stale):
+                return False
             log_info("Successfully converted graph to vectors")
             return True
         except Exception as e:
             log_error(f"Error converting graph to vectors: {str(e)}")
             return False
 
+    def flush(self) -> bool:
+        """Commit pending vectors to the on-disk store, if one is configured.
+
+        The embedding cache is saved separately, in the background and at
+        most every ``EMBEDDING_CACHE_SAVE_INTERVAL`` seconds.
+        """
+        if self.store is None:
+            return True
+        with self._write_lock:
+            flushed = self.store.flush(self.vectors, self.metadata, self.node_hashes)
+        self.embedding_cache.maybe_save()
+        return flushed
+
+    def close(self) -> bool:
+        """Save the embedding cache on shutdown."""
+        return self.embedding_cache.close()
+
+    def compact(self) -> bool:
+        """Rewrite the index without its tombstoned rows.
+
+        Holds the write lock, so commits wait while searches carry on over
+        the old arrays until the new ones are swapped in.
+        """
+        with self._write_lock:
+            try:
+                dropped = self.vectors.tombstone_count
+                if dropped == 0:
+                    return True
+                if self.store is not None:
+                    return self.store.compact(self.vectors, self.metadata, self.node_hashes)
+                self.vectors.compact()
+                log_info(f"Compacted vector index: {dropped} tombstones dropped, {len(self.vectors)} rows kept")
+                return True
+            except Exception as e:
+                log_error(f"Error compacting vector index: {str(e)}")
+                return False
+
+    def maybe_compact(self, ratio: float = VECTOR_COMPACTION_RATIO,
+                      min_rows: int = VECTOR_COMPACTION_MIN_ROWS) -> bool:
+        """Start compaction in a background thread once tombstones pass ``ratio`` of the rows.
+
+        Returns whether a compaction was started; at most one runs at a time.
+        """
+        rows = self.vectors.row_count
+        if rows < min_rows or self.vectors.tombstone_count <= ratio * rows:
+            return False
+        with self._compactor_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return False
+            self._compactor = threading.Thread(target=self.compact, name='vector-compaction', daemon=True)
+            self._compactor.start()
+        return True
+
     def get_vector(self, node_id: str) -> np.ndarray:
         """Retrieve vector for a specific node."""
         return self.vectors.get(node_id)
 
-    def get_all_vectors(self) -> Dict[str, np.ndarray]:
-        """Get all vectorized representations."""
+    def get_all_vectors(self) -> Mapping[str, np.ndarray]:
+        """Get all vectorized representations as a node id -> vector mapping."""
         return self.vectors
\ No newline at end of file
@@ -1,11 +1,20 @@
+import hashlib
+import io
+import json
 import unittest
 import os
+import tempfile
+import numpy as np
+import pandas as pd
+from werkzeug.datastructures import FileStorage
 from src.document_processing.document_parser import DocumentParser
 from src.document_processing.pdf_processor import PDFProcessor
-from src.document_processing.excel_processor import ExcelProcessor
+from src.document_processing.excel_processor import ExcelProcessor, iter_column_relationships
 from src.document_processing.csv_processor import CSVProcessor
 from src.document_processing.docx_processor import DocxProcessor
 from src.document_processing.image_processor import ImageProcessor
+from src.document_processing.tabular import TabularPayload, json_default, json_object_hook
+from src.knowledge_graph.graph_builder import GraphBuilder
 
 class TestDocumentProcessing(unittest.TestCase):
     def setUp(self):
@@ -43,5 +52,85 @@ class TestDocumentProcessing(unittest.TestCase):
         processor = ImageProcessor("test.jpg")
         self.assertIsNotNone(processor)
 
+class TestUploadHashing(unittest.TestCase):
+    def test_uploads_are_stored_by_content_hash(self):
+        parser = DocumentParser()
+        content = b"sku,qty\nA-100,3\n" * 1000
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path, digest = parser.save_upload(FileStorage(io.BytesIO(content), filename='report.csv'), tmp_dir)
+            self.assertEqual(digest, hashlib.sha256(content).hexdigest())
+            self.assertEqual(path, os.path.join(tmp_dir, f"{digest}.csv"))
+            self.assertEqual(parser.hash_file(path), digest)
+
+            again, _ = parser.save_upload(FileStorage(io.BytesIO(content), filename='copy.csv'), tmp_dir)
+            self.assertEqual(again, path)
+            self.assertEqual(os.listdir(tmp_dir), [os.path.basename(path)])
+
+            self.assertTrue(parser.remove_upload(path))
+            self.assertFalse(parser.remove_upload(path))
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+class TestExcelColumnSets(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'book.xlsx')
+        with pd.ExcelWriter(self.path) as writer:
+            pd.DataFrame({f"c{i}": [i] for i in range(30)}).to_excel(writer, sheet_name='Wide', index=False)
+            pd.DataFrame({'sku': ['A-100'], 'qty': [42]}).to_excel(writer, sheet_name='Stock', index=False)
+
+    def test_one_record_per_sheet(self):
+        data = ExcelProcessor(self.path).extract_data()
+        self.assertEqual([(r['type'], r['sheet'], len(r['columns'])) for r in data['relationships']],
+                         [('column_set', 'Wide', 30), ('column_set', 'Stock', 2)])
+
+        pairs = list(iter_column_relationships(data['relationships']))
+        self.assertEqual(len(pairs), 30 * 29 // 2 + 1)
+        self.assertEqual(pairs[-1], {'source': 'sku', 'target': 'qty', 'type': 'column_relationship',
+                                     'sheet': 'Stock'})
+        legacy = {'source': 'a', 'target': 'b', 'type': 'column_relationship', 'sheet': 'S'}
+        self.assertEqual(list(iter_column_relationships([legacy])), [legacy])
+
+    def test_graph_stores_hyperedge(self):
+        builder = GraphBuilder()
+        doc_id = builder.add_document({'content': ExcelProcessor(self.path).extract_data(), 'metadata': {}})
+        column_sets = [node_id for node_id, node in builder.get_graph()['nodes'].items()
+                       if node['type'] == 'column_set']
+        self.assertEqual(column_sets, [f"{doc_id}_sheet_Wide_columns", f"{doc_id}_sheet_Stock_columns"])
+        self.assertEqual(builder.get_neighbors(f"{doc_id}_sheet_Stock", edge_type='has_columns'),
+                         [f"{doc_id}_sheet_Stock_columns"])
+        self.assertEqual(builder.get_graph()['nodes'][column_sets[1]]['columns'], ['sku', 'qty'])
+
+class TestTabularPayload(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'sku': [f"A-{i}" if i % 5 else None for i in range(20)],
+            'qty': np.arange(20),
+            'price': np.linspace(0.5, 10, 20),
+            'note': ["caf\u00e9"] * 20
+        })
+
+    def test_records_and_zero_copy_slices(self):
+        payload = TabularPayload.from_dataframe(self.df, spill_rows=0)
+        records = self.df.astype(object).where(self.df.notna(), None).to_dict(orient='records')
+        self.assertEqual(payload.to_records(), records)
+
+        part = payload.slice(4, 9)
+        self.assertEqual(part.to_records(), records[4:9])
+        self.assertEqual(part.slice(1, 3).to_records(), records[5:7])
+        self.assertTrue(np.shares_memory(part.columns[1].values, payload.columns[1].values))
+        self.assertIs(part.columns[0].data, payload.columns[0].data)
+        self.assertEqual(str(part).splitlines()[0], "sku: A-4, qty: 4, price: 2.5, note: caf\u00e9")
+
+    def test_spill_and_reference(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            payload = TabularPayload.from_dataframe(self.df, spill_rows=0)
+            payload.spill(tmp_dir)
+            self.assertIsInstance(payload.columns[1].values, np.memmap)
+            reference = json.loads(json.dumps(payload.slice(2, 6), default=json_default),
+                                   object_hook=json_object_hook)
+            self.assertEqual(reference.to_records(), payload.slice(2, 6).to_records())
+            self.assertIs(TabularPayload.load(payload.path), payload)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
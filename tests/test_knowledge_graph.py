@@ -1,7 +1,24 @@
+import io
+import os
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+import networkx as nx
+import pandas as pd
+from rdflib import Dataset, Graph, URIRef
+from rdflib.compare import isomorphic
 from src.knowledge_graph.graph_builder import GraphBuilder
 from src.knowledge_graph.rdf_converter import RDFConverter
 from src.knowledge_graph.graph_manager import GraphManager
+from src.knowledge_graph.chunker import Chunker
+from src.knowledge_graph.graph_store import GraphStore
+from src.knowledge_graph.compact_graph import CompactGraph
+from src.knowledge_graph.centrality import PageRankCache
+from src.knowledge_graph.rdf_importer import RDFImporter, parse_nt_line
+from src.vector_db.bm25 import BM25Index
+from src.document_processing.tabular import TabularPayload
 
 class TestKnowledgeGraph(unittest.TestCase):
 
@@ -34,5 +51,563 @@ class TestKnowledgeGraph(unittest.TestCase):
         update_result = self.graph_manager.update_graph()
         self.assertTrue(update_result)
 
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        self.chunker = Chunker(max_tokens=4, overlap=1)
+
+    def test_text_chunks_are_bounded_and_overlap(self):
+        chunks = list(self.chunker.iter_text_chunks("a b c d e f g"))
+        self.assertEqual(chunks, ["a b c d", "d e f g"])
+        self.assertEqual(list(self.chunker.iter_text_chunks("a b c d e")), ["a b c d", "d e"])
+        self.assertEqual(list(self.chunker.iter_text_chunks("")), [])
+
+    def test_record_chunks_group_rows(self):
+        rows = [{'id': 1}, {'id': 2}, {'id': 3}, ['x', 'y']]
+        chunker = Chunker(max_tokens=4, overlap=2)
+        self.assertEqual(list(chunker.iter_record_chunks(rows)),
+                         ["id: 1\nid: 2", "id: 2\nid: 3", "x | y"])
+
+    def test_graph_builder_adds_linked_chunk_nodes(self):
+        builder = GraphBuilder(chunker=self.chunker)
+        doc_id = builder.add_document({
+            'content': {'text': "one two three four five six", 'tables': [[['h1', 'h2'], ['a', 'b']]]},
+            'metadata': {'file_type': 'docx'}
+        })
+        nodes = builder.get_graph()['nodes']
+        self.assertTrue(nodes[doc_id]['chunked'])
+        self.assertEqual(nodes[doc_id]['chunk_count'], 2)
+        self.assertEqual(nodes[f"{doc_id}_chunk_1"]['content'], "four five six")
+        self.assertEqual(nodes[f"{doc_id}_table_0_chunk_0"]['parent'], f"{doc_id}_table_0")
+        self.assertIn({'source': doc_id, 'target': f"{doc_id}_chunk_0", 'attributes': {'type': 'has_chunk'}},
+                      builder.get_graph()['edges'])
+        self.assertEqual(len(builder.get_document_nodes(doc_id)), 6)
+
+    def test_columnar_chunks_are_row_slices(self):
+        chunker = Chunker(max_tokens=12, overlap=4)
+        df = pd.DataFrame({'sku': [f"A-{i}" for i in range(10)], 'qty': list(range(10))})
+        payload = TabularPayload.from_dataframe(df, spill_rows=0)
+        chunks = list(chunker.iter_chunks(payload))
+        self.assertTrue(all(isinstance(chunk, TabularPayload) for chunk in chunks))
+        self.assertEqual([str(chunk) for chunk in chunks],
+                         list(chunker.iter_record_chunks(df.to_dict(orient='records'))))
+
+        builder = GraphBuilder(chunker=chunker)
+        doc_id = builder.add_document({'content': {'sheets': {'Stock': payload}}, 'metadata': {}})
+        chunk = builder.get_graph()['nodes'][f"{doc_id}_sheet_Stock_chunk_1"]['content']
+        self.assertIs(chunk.columns[1].values.base, payload.columns[1].values.base)
+
+class TestAdjacency(unittest.TestCase):
+    def setUp(self):
+        self.builder = GraphBuilder(chunker=Chunker(max_tokens=4, overlap=1))
+        self.doc_id = self.builder.add_document({
+            'content': {'text': "one two three four five six", 'tables': [[['h1', 'h2'], ['v1', 'v2']]]},
+            'metadata': {'file_type': 'docx'}
+        })
+
+    def test_neighbors_and_degree(self):
+        doc_id = self.doc_id
+        self.assertEqual(self.builder.get_neighbors(doc_id, edge_type='has_table'), [f"{doc_id}_table_0"])
+        self.assertEqual(self.builder.get_neighbors(f"{doc_id}_chunk_0", direction='in'), [doc_id])
+        self.assertEqual(self.builder.degree(doc_id), 3)
+        self.assertEqual(self.builder.degree(doc_id, 'out', 'has_chunk'), 2)
+        self.assertEqual(self.builder.degree(f"{doc_id}_table_0"), 3)
+        with self.assertRaises(ValueError):
+            self.builder.get_neighbors(doc_id, direction='sideways')
+
+    def test_k_hop_traversal(self):
+        doc_id = self.doc_id
+        self.assertEqual(self.builder.k_hop(doc_id, hops=2), {
+            f"{doc_id}_chunk_0": 1, f"{doc_id}_chunk_1": 1,
+            f"{doc_id}_table_0": 1, f"{doc_id}_table_0_chunk_0": 2, f"{doc_id}_table_0_chunk_1": 2
+        })
+        self.assertEqual(set(self.builder.k_hop(f"{doc_id}_chunk_0", hops=2, direction='both')),
+                         {doc_id, f"{doc_id}_chunk_1", f"{doc_id}_table_0"})
+        self.builder.clear_graph()
+        self.assertEqual(self.builder.k_hop(doc_id), {})
+
+    def test_remove_and_update_document(self):
+        doc_id = self.doc_id
+        other_id = self.builder.add_document({'content': "seven eight", 'metadata': {'file_type': 'txt'}})
+        graph = self.builder.get_graph()
+        self.assertTrue(self.builder.remove_document(doc_id))
+        self.assertFalse(self.builder.remove_document(doc_id))
+        # Content within one chunk is embedded on its node, without chunk nodes
+        self.assertEqual(list(graph['nodes']), [other_id])
+        self.assertNotIn('chunked', graph['nodes'][other_id])
+        self.assertEqual(list(graph['edges']), [])
+        self.assertEqual(self.builder.get_document_nodes(doc_id), [])
+        self.assertEqual(self.builder.degree(f"{doc_id}_table_0"), 0)
+
+        self.assertEqual(self.builder.update_document(other_id, {'content': {'tables': [[['h3']]]}}), other_id)
+        self.assertEqual(self.builder.get_neighbors(other_id), [f"{other_id}_table_0"])
+        self.assertEqual(len(graph['edges']), 1)
+        self.assertIsNone(self.builder.update_document(doc_id, {'content': "gone"}))
+
+    def test_removed_tables_are_released(self):
+        payload = TabularPayload.from_dataframe(pd.DataFrame({'sku': ['A-1', 'B-2']}), spill_rows=0)
+        doc_id = self.builder.add_document({'content': {'sheets': {'Stock': payload}}, 'metadata': {}})
+        checkpoint = self.builder.checkpoint()
+        blobs = self.builder.graph.blobs
+        objects = [obj for slot in blobs._slots if slot is not None for obj in slot[1]]
+        self.assertIn(payload, [getattr(obj, '_base', None) or obj for obj in objects])
+        self.builder.remove_document(doc_id)
+        live = [slot for slot in blobs._slots if slot is not None]
+        self.assertEqual([obj for _, objects in live for obj in objects], [])
+        self.assertEqual(blobs.nbytes, sum(len(data) for data, _ in live) + 8 * len(blobs._slots))
+        self.assertEqual(set(self.builder.changed_since(checkpoint)['removed']),
+                         {doc_id, f"{doc_id}_sheet_Stock"})
+
+    def test_compaction_frees_removed_nodes(self):
+        doc_id = self.doc_id
+        other_id = self.builder.add_document({'content': "seven eight nine ten eleven", 'metadata': {'file_type': 'txt'}})
+        checkpoint = self.builder.checkpoint()
+        self.builder.remove_document(doc_id)
+        self.assertFalse(self.builder.maybe_compact(ratio=0.9, min_nodes=0))
+        ids = len(self.builder.graph.ids)
+        nodes = self.builder.export_graph()['nodes']
+        changed = list(self.builder.changed_since(checkpoint - 1)['nodes'])
+
+        self.assertTrue(self.builder.compact())
+        self.assertLess(len(self.builder.graph.ids), ids)
+        self.assertEqual(self.builder.graph.dead_fraction(), 0.0)
+        self.assertEqual(self.builder.export_graph()['nodes'], nodes)
+        self.assertEqual(self.builder.get_neighbors(other_id), [f"{other_id}_chunk_0", f"{other_id}_chunk_1"])
+        self.assertEqual(self.builder.checkpoint(), self.builder.graph.horizon)
+        self.assertEqual(list(self.builder.changed_since(self.builder.checkpoint())['nodes']), [])
+        with self.assertRaises(ValueError):
+            self.builder.changed_since(checkpoint - 1)
+        self.assertEqual(changed, [other_id])
+        self.builder.add_node('late', {'type': 'chunk'})
+        self.assertEqual(list(self.builder.changed_since(self.builder.graph.horizon)['nodes']), ['late'])
+
+class TestConcurrentWrites(unittest.TestCase):
+    def test_transaction_commits_atomically(self):
+        builder = GraphBuilder()
+        with builder.transaction():
+            builder.add_node('a', {'type': 'document'})
+            builder.add_edge('a', 'b', 'links')
+            self.assertNotIn('a', builder.get_graph()['nodes'])
+        self.assertEqual(builder.get_neighbors('a'), ['b'])
+
+        with self.assertRaises(RuntimeError):
+            with builder.transaction():
+                builder.add_node('c', {'type': 'document'})
+                raise RuntimeError("parse failed")
+        self.assertNotIn('c', builder.get_graph()['nodes'])
+
+    def test_uploads_and_lock_free_reads(self):
+        builder = GraphBuilder(chunker=Chunker(max_tokens=4, overlap=1))
+        builder.graph.MIN_REBUILD = 8
+        ranker = PageRankCache(builder)
+        builder.add_listener(ranker)
+        done = threading.Event()
+        errors = []
+
+        def upload(worker):
+            try:
+                for i in range(20):
+                    builder.add_document({'content': {'text': f"worker {worker} document {i} text",
+                                                      'tables': [[['h1', 'h2'], [worker, i]]]}})
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not done.is_set():
+                    graph = builder.get_graph()
+                    for node_id in list(graph['nodes'])[-20:]:
+                        builder.k_hop(node_id, 2, 'both')
+                    builder.changed_since(0)['nodes'].keys()
+                    ranker.scores()
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        writers = [threading.Thread(target=upload, args=(worker,)) for worker in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(builder.document_nodes), 80)
+        graph = builder.get_graph()
+        self.assertEqual(len(graph['edges']), len(graph['nodes']) - 80)  # One tree per document
+        self.assertAlmostEqual(float(ranker.scores().sum()), 1.0)
+
+class TestCompactGraph(unittest.TestCase):
+    def test_nodes_round_trip(self):
+        graph = CompactGraph()
+        nodes = {
+            'a': {'type': 'table', 'content': [['h1', 'h2'], [1, 2]], 'count': 1, 'flag': True},
+            'b': {'flag': 1, 'type': 'table', 'content': "text", 'ratio': 1.0, 'missing': None},
+            'c': {'type': 'sheet', 'content': {'rows': [{'sku': 'A-100'}]}}
+        }
+        for node_id, data in nodes.items():
+            graph.set_node(node_id, data)
+        graph.set_node('a', {'type': 'chunk', 'content': "replaced"})
+
+        nodes['a'] = {'type': 'chunk', 'content': "replaced"}
+        self.assertEqual(dict(graph.nodes.items()), nodes)
+        self.assertEqual(list(graph.nodes['b']), ['flag', 'type', 'content', 'ratio', 'missing'])
+        self.assertIs(graph.nodes['b']['flag'], 1)
+        self.assertEqual(graph.attribute('c', 'type'), 'sheet')
+        self.assertEqual(len(graph.columns['type'][1]), 3)
+        self.assertNotIn('d', graph.nodes)
+        self.assertEqual(len(graph.nodes), 3)
+
+    def test_adjacency_across_rebuilds(self):
+        graph = CompactGraph()
+        graph.MIN_REBUILD = 4
+        for i in range(10):
+            graph.add_edge('hub', f"n{i}", 'even' if i % 2 == 0 else 'odd')
+        graph.add_edge('n1', 'hub', 'back')
+
+        self.assertGreater(graph._built, 0)
+        self.assertTrue(graph._adjacency[1]['out'])
+        self.assertEqual(list(graph.adjacent('hub', 'out')), [f"n{i}" for i in range(10)])
+        self.assertEqual(list(graph.adjacent('hub', 'out', 'odd')), ['n1', 'n3', 'n5', 'n7', 'n9'])
+        self.assertEqual(list(graph.adjacent('hub', 'in')), ['n1'])
+        self.assertEqual(graph.degree('hub', 'out'), 10)
+        self.assertEqual(graph.degree('hub', 'out', 'even'), 5)
+        self.assertEqual(list(graph.adjacent('hub', 'out', 'unknown')), [])
+        self.assertEqual(graph.edges[-1], {'source': 'n1', 'target': 'hub', 'attributes': {'type': 'back'}})
+
+        # Removing a node tombstones its edges in the built CSR arrays and in the delta lists
+        graph.set_node('n1', {'type': 'chunk'})
+        self.assertTrue(graph.remove_node('n1'))
+        self.assertNotIn('n1', graph.nodes)
+        self.assertEqual(list(graph.adjacent('hub', 'out', 'odd')), ['n3', 'n5', 'n7', 'n9'])
+        self.assertEqual(list(graph.adjacent('hub', 'in')), [])
+        self.assertEqual(graph.degree('hub', 'out'), 9)
+        self.assertEqual(len(graph.edges), 9)
+        self.assertEqual(graph.edges[-1], {'source': 'hub', 'target': 'n9', 'attributes': {'type': 'odd'}})
+        graph._build()
+        self.assertEqual(list(graph.adjacent('hub', 'out')), [f"n{i}" for i in range(10) if i != 1])
+
+class TestRDFStreaming(unittest.TestCase):
+    def setUp(self):
+        self.builder = GraphBuilder()
+        self.doc_id = self.builder.add_document({
+            'content': {'text': 'He said "hi"\nthen left \\ early', 'tables': [[['h1', 'h2']]]},
+            'metadata': {'file_type': 'docx', 'pages': 3}
+        })
+
+    def test_stream_matches_converted_graph(self):
+        manager = GraphManager()
+        manager.update_graph(self.builder.export_graph())
+        expected = RDFConverter(manager).convert_to_rdf()
+
+        for graph in (manager, self.builder):
+            out = io.BytesIO()
+            self.assertTrue(RDFConverter(graph).write_stream(out))
+            streamed = Graph().parse(data=out.getvalue().decode('utf-8'), format='nt')
+            self.assertTrue(isomorphic(streamed, expected))
+
+    def test_nquads_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'graph.nq')
+            self.assertTrue(RDFConverter(self.builder).write_stream(path, format='nquads'))
+            dataset = Dataset()
+            dataset.parse(path, format='nquads')
+        self.assertEqual(len(dataset.graph(URIRef("http://example.org/kg/graph"))), len(list(RDFConverter(self.builder).iter_triples())))
+        self.assertFalse(RDFConverter(self.builder).write_stream(io.BytesIO(), format='turtle'))
+
+    def test_incremental_export(self):
+        checkpoint = self.builder.checkpoint()
+        self.assertEqual(list(RDFConverter(self.builder).iter_triples(since=checkpoint)), [])
+
+        self.builder.add_node('note', {'type': 'note', 'content': "new"})
+        self.builder.add_edge(self.doc_id, 'note', 'has_note')
+        subjects = {line.split(' ', 1)[0] for line in RDFConverter(self.builder).iter_triples(since=checkpoint)}
+        self.assertEqual(subjects, {'<http://example.org/kg/note>', f'<http://example.org/kg/{self.doc_id}>'})
+        self.assertEqual(self.builder.changed_since(checkpoint)['nodes'].keys(), {self.doc_id, 'note'})
+
+        # Removals cannot be expressed as triples, so they are listed separately
+        checkpoint = self.builder.checkpoint()
+        self.builder.remove_node('note')
+        self.builder.remove_node(f"{self.doc_id}_chunk_0")
+        self.builder.add_node(f"{self.doc_id}_chunk_0", {'type': 'chunk', 'content': "back"})
+        self.assertEqual(RDFConverter(self.builder).removed_subjects(checkpoint), ['http://example.org/kg/note'])
+        self.assertEqual(RDFConverter(self.builder).removed_subjects(self.builder.checkpoint()), [])
+
+class TestRDFImport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.builder = GraphBuilder(chunker=Chunker(max_tokens=4, overlap=1))
+        self.doc_id = self.builder.add_document({
+            'content': {'text': 'one "two" three\nfour five six', 'tables': [[['h1', 'h2']]]},
+            'metadata': {'file_type': 'docx', 'pages': 3}
+        })
+        self.path = os.path.join(self.tmp_dir.name, 'dump.nt')
+        self.assertTrue(RDFConverter(self.builder).write_stream(self.path))
+
+    def test_round_trip(self):
+        manager = GraphManager()
+        importer = RDFImporter(manager, batch_triples=7)
+        self.assertEqual(importer.import_file(self.path), len(list(RDFConverter(self.builder).iter_triples())))
+
+        exported = manager.export_graph()
+        self.assertEqual(exported['nodes'].keys(), self.builder.get_graph()['nodes'].keys())
+        # Structured content is exported as its string form; scalar attributes keep their types
+        chunk_id = f"{self.doc_id}_chunk_1"
+        self.assertEqual(exported['nodes'][chunk_id], self.builder.get_graph()['nodes'][chunk_id])
+        self.assertIs(exported['nodes'][self.doc_id]['chunked'], True)
+        self.assertEqual(len(exported['edges']), len(self.builder.get_graph()['edges']))
+
+    def test_parallel_chunks_match_serial(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('_:b1 <http://example.org/kg/knows> _:b2 .\nnot a triple\n'
+                    '_:b2 <http://example.org/kg/name> "B"@en .\n'
+                    '_:b2 <http://example.org/kg/alias> "B1" .\n' * 2 + '_:b2 <http://example.org/kg/alias> "B2" .\n'
+                    '_:b3 <http://example.org/kg/note> "line\u2028break" .\n')
+        serial, parallel = GraphManager(), GraphManager()
+        expected = RDFImporter(serial).import_file(self.path)
+        self.assertEqual(RDFImporter(parallel, chunk_bytes=64, processes=2).import_file(self.path), expected)
+        self.assertEqual(parallel.export_graph()['nodes'], serial.export_graph()['nodes'])
+        self.assertEqual(serial.export_graph()['nodes']['_:b2'], {'name': 'B', 'alias': ['B1', 'B2']})
+        self.assertEqual(parallel.export_graph()['nodes']['_:b3'], {'note': 'line\u2028break'})
+        self.assertTrue(serial.graph.has_edge('_:b1', '_:b2'))
+
+    def test_turtle_and_line_parsing(self):
+        path = os.path.join(self.tmp_dir.name, 'dump.ttl')
+        Graph().parse(self.path, format='nt').serialize(destination=path, format='turtle')
+        manager = GraphManager()
+        self.assertGreater(RDFImporter(manager).import_file(path), 0)
+        self.assertEqual(manager.export_graph()['nodes'][self.doc_id]['pages'], 3)
+        self.assertEqual(parse_nt_line('<s> <p> "a\\tb\\u00e9"^^<http://www.w3.org/2001/XMLSchema#string> .'),
+                         ('s', 'p', 'a\tb\u00e9', True))
+        self.assertIsNone(parse_nt_line('# comment'))
+
+class TestPageRankCache(unittest.TestCase):
+    def setUp(self):
+        self.builder = GraphBuilder(chunker=Chunker(max_tokens=4, overlap=1))
+        self.ranker = PageRankCache(self.builder, tolerance=1e-10, max_iterations=1000)
+        self.builder.add_listener(self.ranker)
+        self.doc_id = self.builder.add_document({
+            'content': {'text': "one two three four five six seven", 'tables': [[['h1', 'h2']]]},
+            'metadata': {'file_type': 'docx'}
+        })
+
+    def reference(self):
+        graph = nx.Graph()
+        graph.add_nodes_from(self.builder.graph.ids)
+        graph.add_edges_from((edge['source'], edge['target']) for edge in self.builder.get_graph()['edges'])
+        return nx.pagerank(graph, tol=1e-12, max_iter=10000)
+
+    def test_matches_networkx_after_updates(self):
+        expected = self.reference()
+        for node_id, score in expected.items():
+            self.assertAlmostEqual(self.ranker.score(node_id), score, places=6)
+
+        self.builder.add_node('note', {'type': 'note', 'content': "extra"})
+        self.builder.add_edge(f"{self.doc_id}_table_0", 'note', 'has_note')
+        self.assertTrue(self.ranker._stale)
+        expected = self.reference()
+        self.assertAlmostEqual(self.ranker.score('note'), expected['note'], places=6)
+        self.assertAlmostEqual(float(self.ranker.scores().sum()), 1.0)
+
+    def test_incremental_updates_match_networkx(self):
+        for i in range(200):
+            self.builder.add_edge(f"hub{i % 7}", f"leaf{i}", 'links')
+        self.ranker.scores()
+        self.builder.add_edge('leaf3', 'leaf4', 'links')
+        self.builder.remove_node('hub2')
+        self.builder.add_edge('hub2', 'late', 'links')
+        expected = self.reference()
+        for node_id in ('hub0', 'hub2', 'leaf3', 'leaf4', 'late', self.doc_id):
+            self.assertAlmostEqual(self.ranker.score(node_id), expected[node_id], places=6)
+        self.assertAlmostEqual(float(self.ranker.scores().sum()), 1.0)
+
+    def test_expand_ranks_neighbours(self):
+        chunk_id = f"{self.doc_id}_chunk_0"
+        expanded = self.ranker.expand([chunk_id, f"{self.doc_id}_chunk_1"], hops=2, limit=2)
+        neighbours = expanded[chunk_id]
+        self.assertEqual(neighbours[0]['node_id'], self.doc_id)
+        self.assertEqual(neighbours[0]['distance'], 1)
+        self.assertEqual(len(neighbours), 2)
+        self.assertGreaterEqual(neighbours[0]['centrality'], neighbours[1]['centrality'])
+        self.assertNotIn(f"{self.doc_id}_chunk_1", [n['node_id'] for n in neighbours])
+        self.assertEqual(self.ranker.expand([chunk_id], hops=0), {chunk_id: []})
+
+    def test_neighbour_info_is_a_small_summary(self):
+        table_id = f"{self.doc_id}_table_0"
+        info = {n['node_id']: n['info'] for n in self.ranker.expand([table_id], hops=2, limit=10)[table_id]}
+        self.assertEqual(info[self.doc_id], {'type': 'document', 'document_id': self.doc_id, 'file_type': 'docx'})
+        chunk = info[f"{self.doc_id}_chunk_0"]
+        self.assertEqual((chunk['type'], chunk['chunk_index']), ('chunk', 0))
+        self.assertEqual(self.ranker.summary(f"{self.doc_id}_chunk_0", excerpt_chars=3)['excerpt'], "one")
+
+class TestGraphStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.document = {'content': {'text': "alpha beta", 'tables': [[['h1', 'h2']]]},
+                         'metadata': {'file_type': 'docx'}}
+
+    def open_builder(self, **kwargs):
+        builder = GraphBuilder()
+        lexical_index = BM25Index()
+        builder.add_listener(lexical_index)
+        kwargs.setdefault('fsync', 'always')
+        store = GraphStore(self.tmp_dir.name, **kwargs)
+        self.assertTrue(store.attach(builder))
+        self.addCleanup(store.close)
+        return builder, store, lexical_index
+
+    def test_restart_replays_log(self):
+        builder, store, _ = self.open_builder()
+        doc_id = builder.add_document(self.document)
+        store.close()
+
+        recovered, _, lexical_index = self.open_builder()
+        self.assertEqual(recovered.get_graph()['nodes'], builder.get_graph()['nodes'])
+        self.assertEqual(recovered.get_graph()['edges'], builder.get_graph()['edges'])
+        self.assertEqual(recovered.get_neighbors(doc_id, edge_type='has_table'), [f"{doc_id}_table_0"])
+        self.assertEqual(lexical_index.search("alpha")[0][0], doc_id)
+
+    def test_content_hashes_are_recovered(self):
+        builder, store, _ = self.open_builder()
+        self.document['metadata']['content_hash'] = 'abc123'
+        doc_id = builder.add_document(self.document)
+        unregistered_id = builder.add_document({'content': "beta", 'metadata': {'content_hash': 'def456'}})
+        # Documents are only findable by hash once registered, i.e. after they were embedded
+        self.assertIsNone(builder.find_document('abc123'))
+        builder.register_document(doc_id)
+        self.assertEqual(builder.find_document('abc123'), doc_id)
+        self.assertIsNone(builder.find_document('other'))
+        store.close()
+
+        recovered, store, _ = self.open_builder()
+        self.assertEqual(recovered.find_document('abc123'), doc_id)
+        self.assertIsNone(recovered.find_document('def456'))
+        self.assertTrue(recovered.is_document(unregistered_id))
+        self.assertTrue(store.snapshot())
+        store.close()
+
+        recovered, _, _ = self.open_builder()
+        self.assertEqual(recovered.find_document('abc123'), doc_id)
+        recovered.clear_graph()
+        self.assertIsNone(recovered.find_document('abc123'))
+
+    def test_removals_are_replayed(self):
+        builder, store, _ = self.open_builder()
+        doc_id = builder.add_document(self.document)
+        kept_id = builder.add_document({'content': {'text': "gamma", 'tables': [[['g1']]]}, 'metadata': {}})
+        self.assertTrue(builder.remove_document(doc_id))
+        store.close()
+
+        recovered, _, lexical_index = self.open_builder()
+        self.assertEqual(list(recovered.get_graph()['nodes']), list(builder.get_graph()['nodes']))
+        self.assertEqual(len(recovered.get_graph()['edges']), 1)
+        self.assertEqual(recovered.get_document_nodes(kept_id), [kept_id, f"{kept_id}_table_0"])
+        self.assertEqual(lexical_index.search("alpha"), [])
+
+    def test_columnar_content_is_spilled(self):
+        builder, store, _ = self.open_builder()
+        payload = TabularPayload.from_dataframe(pd.DataFrame({'sku': ['A-1', 'B-2'], 'qty': [1, 2]}), spill_rows=0)
+        doc_id = builder.add_document({'content': {'sheets': {'Stock': payload}}, 'metadata': {}})
+        store.snapshot()
+        store.close()
+
+        recovered, _, _ = self.open_builder()
+        sheet = recovered.get_graph()['nodes'][f"{doc_id}_sheet_Stock"]['content']
+        self.assertEqual(sheet.to_records(), [{'sku': 'A-1', 'qty': 1}, {'sku': 'B-2', 'qty': 2}])
+        self.assertTrue(sheet.path.startswith(os.path.join(self.tmp_dir.name, 'tabular')))
+
+    def test_snapshot_removes_unused_spills(self):
+        spill_path = os.path.join(self.tmp_dir.name, 'spills')
+        builder, store, _ = self.open_builder(spill_path=spill_path)
+        frame = pd.DataFrame({'sku': ['A-1', 'B-2'], 'qty': [1, 2]})
+        kept = TabularPayload.from_dataframe(frame, spill_rows=0)
+        kept.spill(spill_path)
+        kept_id = builder.add_document({'content': {'sheets': {'Stock': kept}}, 'metadata': {}})
+        dropped = TabularPayload.from_dataframe(frame, spill_rows=0)
+        dropped_id = builder.add_document({'content': {'sheets': {'Stock': dropped}}, 'metadata': {}})
+        dropped_path = dropped.path  # Spilled next to the log when it was written
+        self.assertTrue(dropped_path.startswith(os.path.join(self.tmp_dir.name, 'tabular')))
+
+        builder.remove_document(dropped_id)
+        del dropped
+        self.assertTrue(os.path.exists(dropped_path))
+        self.assertTrue(store.snapshot())
+        self.assertFalse(os.path.exists(dropped_path))
+        self.assertTrue(os.path.exists(kept.path))
+        store.close()
+
+        del kept
+        recovered, _, _ = self.open_builder(spill_path=spill_path)
+        sheet = recovered.get_graph()['nodes'][f"{kept_id}_sheet_Stock"]['content']
+        self.assertEqual(sheet.to_records(), frame.to_dict('records'))
+
+    def test_snapshot_truncates_log(self):
+        builder, store, _ = self.open_builder(snapshot_records=3)
+        builder.add_document(self.document)
+        builder.add_node('extra', {'type': 'note', 'content': "gamma"})
+        store.close()
+
+        files = sorted(os.listdir(self.tmp_dir.name))
+        self.assertEqual(len([name for name in files if name.startswith('snapshot.')]), 1)
+        self.assertEqual(len([name for name in files if name.startswith('wal.')]), 1)
+        recovered, _, _ = self.open_builder()
+        self.assertEqual(recovered.get_graph()['nodes'], builder.get_graph()['nodes'])
+        self.assertEqual(len(recovered.get_graph()['edges']), len(builder.get_graph()['edges']))
+
+    def test_snapshot_is_written_off_the_commit_path(self):
+        release = threading.Event()
+        write_snapshot = GraphStore._write_snapshot
+
+        def blocked(store, base, generation):
+            release.wait(5)
+            return write_snapshot(store, base, generation)
+
+        with mock.patch.object(GraphStore, '_write_snapshot', blocked):
+            builder, store, _ = self.open_builder(snapshot_records=2)
+            for i in range(4):
+                builder.add_node(f"n{i}", {'type': 'note', 'content': f"note {i}"})
+            # Commits returned while the snapshot is still being written
+            self.assertTrue(store._snapshotter.is_alive())
+            self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ['wal.0.log', 'wal.1.log'])
+
+            # A crash now recovers from every log generation
+            recovered, crashed, _ = self.open_builder()
+            self.assertEqual(list(recovered.get_graph()['nodes']), ['n0', 'n1', 'n2', 'n3'])
+            crashed.close()
+
+            release.set()
+            store.close()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ['snapshot.1.jsonl', 'wal.1.log'])
+        recovered, _, _ = self.open_builder()
+        self.assertEqual(recovered.get_graph()['nodes'], builder.get_graph()['nodes'])
+
+    def test_interval_fsync_does_not_wait_for_another_record(self):
+        with mock.patch('src.knowledge_graph.graph_store.os.fsync') as fsync:
+            builder, store, _ = self.open_builder(fsync='interval', fsync_interval=0.01)
+            builder.add_node('a', {'type': 'note', 'content': "first"})
+            for _ in range(500):
+                if fsync.called:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(fsync.called)
+            store.close()
+
+    def test_torn_tail_is_discarded(self):
+        builder, store, _ = self.open_builder()
+        builder.add_node('a', {'type': 'note', 'content': "first"})
+        store.close()
+        with open(os.path.join(self.tmp_dir.name, 'wal.0.log'), 'ab') as f:
+            f.write(b'["node","b",{"type":')
+
+        recovered, store, _ = self.open_builder()
+        self.assertEqual(list(recovered.get_graph()['nodes']), ['a'])
+        recovered.add_node('c', {'type': 'note', 'content': "third"})
+        store.close()
+        recovered, _, _ = self.open_builder()
+        self.assertEqual(list(recovered.get_graph()['nodes']), ['a', 'c'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,7 +1,27 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import zlib
 import numpy as np
+from unittest.mock import patch
 from src.vector_db.vectorizer import Vectorizer
 from src.vector_db.retriever import Retriever
+from src.vector_db.index import VectorIndex
+from src.vector_db.store import VectorStore
+from src.vector_db.ann import IVFIndex, benchmark_recall
+from src.vector_db.quantization import CompressedIndex
+from src.vector_db.embedding_cache import EmbeddingCache, ENTRY_OVERHEAD_BYTES
+from src.vector_db.filters import parse_filters, parse_count
+from src.vector_db.sharding import ShardedSearcher
+from src.vector_db.model_registry import ModelRegistry, model_registry
+from src.vector_db.embedding_backends import load_model, parity_check
+from src.vector_db.bm25 import BM25Index, tokenize
+from src.knowledge_graph.graph_builder import GraphBuilder
 
 class TestVectorDB(unittest.TestCase):
     def setUp(self):
@@ -34,5 +54,690 @@ class TestVectorDB(unittest.TestCase):
         self.assertIn(self.test_node_id, self.vectorizer.vectors)
         self.assertIn(self.test_node_id, self.vectorizer.metadata)
 
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VectorIndex(dimension=3, initial_capacity=2)
+
+    def test_search_returns_top_k_by_cosine(self):
+        self.index.add("a", np.array([1.0, 0.0, 0.0]))
+        self.index.add("b", np.array([0.0, 2.0, 0.0]))
+        self.index.add("c", np.array([1.0, 1.0, 0.0]))
+        results = self.index.search(np.array([1.0, 0.1, 0.0]), top_k=2)
+        self.assertEqual([node_id for node_id, _ in results], ["a", "c"])
+        self.assertAlmostEqual(results[0][1], 0.995, places=3)
+
+    def test_growth_keeps_existing_rows(self):
+        vectors = np.random.default_rng(0).normal(size=(50, 3))
+        for i, vector in enumerate(vectors):
+            self.index.add(f"n{i}", vector)
+        self.assertEqual(len(self.index), 50)
+        self.assertTrue(np.allclose(self.index["n7"], VectorIndex.normalize(vectors[7])))
+
+    def test_mapping_interface_and_upsert(self):
+        self.index.add("a", np.array([1.0, 0.0, 0.0]))
+        self.index.add("a", np.array([0.0, 1.0, 0.0]))
+        self.assertEqual(len(self.index), 1)
+        self.assertIn("a", self.index)
+        self.assertEqual(list(self.index.keys()), ["a"])
+        self.assertTrue(np.allclose(self.index.get("a"), [0.0, 1.0, 0.0]))
+        self.assertIsNone(self.index.get("missing"))
+
+    def test_remove_and_replace_tombstone_rows(self):
+        for node_id, vector in [("a", [1.0, 0.0, 0.0]), ("b", [0.0, 1.0, 0.0]), ("c", [0.0, 0.0, 1.0])]:
+            self.index.add(node_id, np.array(vector))
+        self.assertTrue(self.index.remove("a"))
+        self.assertFalse(self.index.remove("a"))
+        self.index.add("b", np.array([1.0, 0.0, 0.0]))
+        self.assertEqual(sorted(self.index), ["b", "c"])
+        self.assertEqual(self.index.tombstone_count, 2)
+        self.assertEqual(self.index.search(np.array([1.0, 0.0, 0.0]), top_k=3),
+                         [("b", 1.0), ("c", 0.0)])
+
+    def test_compact_drops_tombstones(self):
+        vectors = np.random.default_rng(1).normal(size=(6, 3))
+        self.index.add_batch([f"n{i}" for i in range(6)], vectors,
+                             [{'document_id': f"doc{i % 2}"} for i in range(6)])
+        for node_id in ("n0", "n3", "n4"):
+            self.index.remove(node_id)
+        expected = [node_id for node_id, _ in self.index.search(vectors[5], top_k=3)]
+
+        self.assertEqual(self.index.compact().tolist(), [1, 2, 5])
+        self.assertEqual(self.index.epoch, 2)
+        self.assertEqual((self.index.row_count, self.index.tombstone_count), (3, 0))
+        self.assertEqual(self.index.get_ids(), ["n1", "n2", "n5"])
+        self.assertEqual([node_id for node_id, _ in self.index.search(vectors[5], top_k=3)], expected)
+        self.assertEqual(self.index.filter_rows({'document_id': ['doc1']}).tolist(), [0, 2])
+
+    def test_searches_during_appends_see_a_consistent_snapshot(self):
+        vectors = np.random.default_rng(2).normal(size=(2000, 3))
+        errors = []
+
+        def append():
+            for i, vector in enumerate(vectors):
+                self.index.add(f"n{i}", vector)
+                if i % 3 == 0:
+                    self.index.remove(f"n{i}")
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        writer = threading.Thread(target=append)
+        writer.start()
+        while writer.is_alive():
+            try:
+                for node_id, _ in self.index.search(vectors[0], top_k=3):
+                    self.assertIsNotNone(node_id)
+                for results in self.index.search_batch(vectors[:2], top_k=3):
+                    self.assertNotIn(None, [node_id for node_id, _ in results])
+            except (IndexError, ValueError) as e:
+                errors.append(e)
+                break
+        writer.join()
+        self.assertEqual(errors, [])
+
+class TestVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'store')
+
+    def _populate(self, store):
+        index, metadata, hashes = store.open()
+        for i in range(5):
+            vector = np.zeros(4)
+            vector[i % 4] = 1.0
+            index.add(f"n{i}", vector)
+            metadata[f"n{i}"] = {'type': 'document', 'content': f"text {i}"}
+            hashes[f"n{i}"] = f"h{i}"
+        return index, metadata, hashes
+
+    def test_flush_and_reopen(self):
+        store = VectorStore(self.path)
+        index, metadata, hashes = self._populate(store)
+        index.remove("n1")
+        self.assertTrue(store.flush(index, metadata, hashes))
+
+        reopened, reopened_metadata, reopened_hashes = VectorStore(self.path).open()
+        self.assertIsInstance(reopened.get_matrix(), np.memmap)
+        self.assertEqual(sorted(reopened), ["n0", "n2", "n3", "n4"])
+        self.assertEqual(reopened_metadata["n3"]['content'], "text 3")
+        self.assertNotIn("n1", reopened_metadata)
+        self.assertEqual(reopened_hashes["n4"], "h4")
+        self.assertEqual(reopened.search(np.array([0.0, 0.0, 1.0, 0.0]), top_k=1)[0][0], "n2")
+
+    def test_uncommitted_writes_are_discarded(self):
+        store = VectorStore(self.path)
+        index, metadata, hashes = self._populate(store)
+        store.flush(index, metadata, hashes)
+
+        # Simulate a crash after new rows and log bytes hit disk but before the manifest commit
+        index.add("n9", np.ones(4))
+        with open(store._file('ids'), 'a') as f:
+            f.write('["add", 5, "n9", "h9"]\n["add", 6')
+
+        reopened, _, _ = VectorStore(self.path).open()
+        self.assertEqual(len(reopened), 5)
+        self.assertNotIn("n9", reopened)
+        reopened.add("n9", np.ones(4))
+        self.assertIn("n9", reopened)
+
+    def test_compact_writes_next_generation(self):
+        store = VectorStore(self.path)
+        index, metadata, hashes = self._populate(store)
+        self.assertTrue(store.flush(index, metadata, hashes))
+        for node_id in ("n0", "n2"):
+            index.remove(node_id)
+            del metadata[node_id]
+        self.assertTrue(store.compact(index, metadata, hashes))
+
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['ids.1.log', 'manifest.json', 'metadata.1.jsonl', 'vectors.1.f32'])
+        self.assertEqual((index.row_count, index.tombstone_count), (3, 0))
+        self.assertEqual(metadata["n3"]['content'], "text 3")
+        index.add("n5", np.ones(4))
+        metadata["n5"] = {'type': 'document', 'content': "text 5"}
+        self.assertTrue(store.flush(index, metadata, hashes))
+
+        reopened, reopened_metadata, reopened_hashes = VectorStore(self.path).open()
+        self.assertEqual(reopened.epoch, 2)
+        self.assertEqual(reopened.get_ids(), ["n1", "n3", "n4", "n5"])
+        self.assertEqual(reopened_metadata["n5"]['content'], "text 5")
+        self.assertEqual(reopened_hashes["n4"], "h4")
+        self.assertEqual(reopened.search(np.array([0.0, 0.0, 0.0, 1.0]), top_k=1)[0][0], "n3")
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        centers = rng.normal(size=(8, 16))
+        self.data = centers[rng.integers(0, 8, size=2000)] + rng.normal(scale=0.1, size=(2000, 16))
+        self.vectors = VectorIndex(dimension=16)
+        self.vectors.add_batch([f"n{i}" for i in range(2000)], self.data)
+        self.ivf = IVFIndex(self.vectors, nlist=8, nprobe=2)
+        self.ivf.rebuild()
+
+    def test_recall_against_exact_search(self):
+        report = benchmark_recall(self.ivf, self.data[:20], top_k=5, nprobe_values=(2, 8))
+        self.assertGreaterEqual(report[0]['recall_at_k'], 0.9)
+        self.assertEqual(report[1]['recall_at_k'], 1.0)
+
+    def test_incremental_insert_and_rebuild(self):
+        self.vectors.add("new", self.data[3])
+        self.assertIn("new", [node_id for node_id, _ in self.ivf.search(self.data[3], top_k=2)])
+        self.vectors.remove("new")
+        self.assertNotIn("new", [node_id for node_id, _ in self.ivf.search(self.data[3], top_k=2)])
+        self.assertTrue(self.ivf.rebuild())
+        self.assertEqual(sum(len(cell) for cell in self.ivf._lists), 2000)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'ivf.npz')
+            self.assertTrue(self.ivf.save(path))
+            loaded = IVFIndex(self.vectors, nlist=8, nprobe=2)
+            self.assertTrue(loaded.load(path))
+            self.assertEqual(loaded.search(self.data[0], top_k=3), self.ivf.search(self.data[0], top_k=3))
+
+    def test_compaction_reassigns_rows(self):
+        for i in range(0, 2000, 2):
+            self.vectors.remove(f"n{i}")
+        self.vectors.compact()
+        self.assertEqual(self.ivf.search(self.data[3], top_k=1)[0][0], "n3")
+        self.assertEqual(sum(len(cell) for cell in self.ivf._lists), 1000)
+
+class TestCompressedIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.data = rng.normal(size=(3000, 32))
+        self.queries = self.data[:25] + rng.normal(scale=0.3, size=(25, 32))
+        self.vectors = VectorIndex(dimension=32)
+        self.vectors.add_batch([f"n{i}" for i in range(3000)], self.data)
+
+    def _top5_recall(self, compressed):
+        hits = 0
+        for query in self.queries:
+            exact = {node_id for node_id, _ in self.vectors.search(query, top_k=5)}
+            hits += len(exact & {node_id for node_id, _ in compressed.search(query, top_k=5)})
+        return hits / (5 * len(self.queries))
+
+    def test_modes_keep_top5_quality_and_shrink_memory(self):
+        full_bytes = self.vectors.get_matrix().nbytes
+        for mode, min_ratio in (('float16', 2), ('int8', 4), ('pq', 16)):
+            compressed = CompressedIndex(self.vectors, mode=mode, rerank_factor=10, pq_subspaces=8)
+            self.assertTrue(compressed.train())
+            self.assertGreaterEqual(full_bytes / compressed.memory_bytes(), min_ratio)
+            self.assertGreaterEqual(self._top5_recall(compressed), 0.95, mode)
+
+    def test_scores_are_exact_after_rerank_and_skip_tombstones(self):
+        compressed = CompressedIndex(self.vectors, mode='int8')
+        results = compressed.search(self.data[10], top_k=3)
+        self.assertEqual(results, self.vectors.search(self.data[10], top_k=3))
+        self.vectors.remove("n10")
+        self.vectors.add("extra", self.data[10])
+        self.assertEqual(compressed.search(self.data[10], top_k=1)[0][0], "extra")
+
+    def test_save_and_load(self):
+        compressed = CompressedIndex(self.vectors, mode='pq')
+        compressed.train()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'compressed.npz')
+            self.assertTrue(compressed.save(path))
+            loaded = CompressedIndex(self.vectors, mode='pq')
+            self.assertTrue(loaded.load(path))
+            self.assertFalse(CompressedIndex(self.vectors, mode='int8').load(path))
+        self.assertEqual(loaded.search(self.queries[0], top_k=5), compressed.search(self.queries[0], top_k=5))
+
+class TestFilteredSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.data = rng.normal(size=(600, 16))
+        self.types = ['table' if i % 3 == 0 else 'chunk' for i in range(600)]
+        self.vectors = VectorIndex(dimension=16, initial_capacity=8)
+        self.vectors.add_batch(
+            [f"n{i}" for i in range(600)], self.data,
+            [{'type': self.types[i], 'document_id': f"doc{i // 100}", 'file_type': None} for i in range(600)]
+        )
+
+    def test_filter_rows_match_attributes(self):
+        rows = self.vectors.filter_rows({'type': 'table', 'document_id': ['doc1', 'doc4']})
+        expected = [i for i in range(600) if self.types[i] == 'table' and i // 100 in (1, 4)]
+        self.assertEqual(rows.tolist(), expected)
+        self.assertEqual(len(self.vectors.filter_rows({'type': 'sheet'})), 0)
+        self.vectors.remove("n3")
+        self.assertNotIn(3, self.vectors.filter_rows({'type': 'table'}))
+
+    def test_filtered_search_matches_post_filtered_exact_search(self):
+        filters = {'document_id': 'doc2', 'type': 'chunk'}
+        expected = [(node_id, score) for node_id, score in self.vectors.search(self.data[250], top_k=600)
+                    if self.types[int(node_id[1:])] == 'chunk' and 200 <= int(node_id[1:]) < 300][:5]
+        ivf = IVFIndex(self.vectors, nlist=4, nprobe=4)
+        ivf.rebuild()
+        compressed = CompressedIndex(self.vectors, mode='int8')
+        for results in (self.vectors.search(self.data[250], top_k=5, filters=filters),
+                        ivf.search(self.data[250], top_k=5, mask=self.vectors.filter_mask(filters)),
+                        compressed.search(self.data[250], top_k=5, rows=self.vectors.filter_rows(filters))):
+            self.assertEqual([node_id for node_id, _ in results], [node_id for node_id, _ in expected])
+            self.assertTrue(np.allclose([score for _, score in results], [score for _, score in expected]))
+
+    def test_search_batch_matches_single_queries(self):
+        self.vectors.remove("n5")
+        queries = self.data[:7] + 0.1
+        for rows in (None, self.vectors.filter_rows({'type': 'chunk'})):
+            batch = list(self.vectors.search_batch(queries, top_k=4, rows=rows, score_bytes=4 * 600 * 3))
+            self.assertEqual(len(batch), 7)
+            for query, results in zip(queries, batch):
+                expected = self.vectors.search_rows(VectorIndex.normalize(query), rows, 4) if rows is not None \
+                    else self.vectors.search(query, top_k=4)
+                self.assertEqual([node_id for node_id, _ in results], [node_id for node_id, _ in expected])
+                self.assertNotIn("n5", [node_id for node_id, _ in results])
+
+    def test_attributes_survive_store_reopen(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = VectorStore(tmp_dir)
+            index, metadata, hashes = store.open()
+            index.add_batch(["a", "b"], np.eye(4)[:2], [{'type': 'table'}, {'type': 'chunk'}])
+            store.flush(index, metadata, hashes)
+            index.add("c", np.eye(4)[2], {'type': 'table'})
+            store.flush(index, metadata, hashes)
+            reopened, _, _ = VectorStore(tmp_dir).open()
+            self.assertEqual(reopened.ids_at(reopened.filter_rows({'type': 'table'})), ["a", "c"])
+
+    def test_parse_count(self):
+        self.assertEqual(parse_count(None, 'top_k', 5), 5)
+        self.assertEqual(parse_count('7', 'top_k', 5), 7)
+        self.assertEqual(parse_count(3.0, 'top_k', 5), 3)
+        for raw in ('ten', 2.5, True, [1]):
+            with self.assertRaisesRegex(ValueError, 'top_k must be an integer'):
+                parse_count(raw, 'top_k', 5)
+        with self.assertRaisesRegex(ValueError, 'at least 1'):
+            parse_count(0, 'top_k', 5, minimum=1)
+
+    def test_parse_filters(self):
+        self.assertEqual(parse_filters({'type': 'table'}), {'type': ['table']})
+        self.assertIsNone(parse_filters(None))
+        with self.assertRaises(ValueError):
+            parse_filters({'colour': 'red'})
+
+class TestShardedSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.data = rng.normal(size=(1500, 16))
+        self.queries = self.data[:5] + rng.normal(scale=0.2, size=(5, 16))
+
+    def _assert_matches_local(self, vectors, sharded):
+        for query in self.queries:
+            expected = vectors.search(query, top_k=5)
+            results = sharded.search(query, top_k=5)
+            self.assertEqual([node_id for node_id, _ in results], [node_id for node_id, _ in expected])
+
+    def test_in_memory_index_is_mirrored_to_shared_memory(self):
+        vectors = VectorIndex(dimension=16)
+        vectors.add_batch([f"n{i}" for i in range(1500)], self.data)
+        sharded = ShardedSearcher(vectors, shards=3, min_rows=0)
+        self.addCleanup(sharded.close)
+        self._assert_matches_local(vectors, sharded)
+
+        # Appends and tombstones are published before the next search
+        vectors.remove("n0")
+        vectors.add("extra", self.queries[0])
+        self.assertEqual(sharded.search(self.queries[0], top_k=1)[0][0], "extra")
+        self.assertNotIn("n0", [node_id for node_id, _ in sharded.search(self.data[0], top_k=3)])
+
+    def test_store_backed_index_is_read_from_the_mapped_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = VectorStore(tmp_dir)
+            vectors, _, _ = store.open()
+            vectors.add_batch([f"n{i}" for i in range(1500)], self.data)
+            sharded = ShardedSearcher(vectors, shards=2, min_rows=0)
+            self.addCleanup(sharded.close)
+            self._assert_matches_local(vectors, sharded)
+            self.assertEqual(sharded._descriptors['matrix'][1], 'file')
+
+    def test_workers_do_not_build_the_app(self):
+        # Spawned workers re-run main.py's module-level code as __mp_main__; it must not build components
+        main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'main.py')
+        with open(main_path, encoding='utf-8') as f:
+            module = ast.parse(f.read())
+        guarded = lambda node: isinstance(node, ast.If) and '__main__' in ast.unparse(node.test)
+        called = {ast.unparse(call.func)
+                  for statement in module.body
+                  if not isinstance(statement, (ast.FunctionDef, ast.ClassDef)) and not guarded(statement)
+                  for call in ast.walk(statement) if isinstance(call, ast.Call)}
+        components = {'DocumentParser', 'GraphBuilder', 'GraphStore', 'Vectorizer', 'Retriever',
+                      'BM25Index', 'PageRankCache', 'MistralClient', 'model_registry.warm_up'}
+        self.assertFalse(called & components, f"main.py builds {called & components} at import")
+        self.assertIn('create_app', [node.name for node in module.body if isinstance(node, ast.FunctionDef)])
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add('a', "part A-100 bracket steel")
+        self.index.add('b', "part B-200 bracket aluminium bracket")
+        self.index.add('c', "quarterly revenue report")
+
+    def test_tokenizer_keeps_codes_and_their_parts(self):
+        self.assertEqual(tokenize("SKU A-100, qty 4"), ['sku', 'a-100', 'a', '100', 'qty', '4'])
+
+    def test_ranking_and_incremental_updates(self):
+        self.assertEqual(self.index.search("A-100")[0][0], 'a')
+        self.assertEqual([node_id for node_id, _ in self.index.search("bracket")], ['b', 'a'])
+        self.assertEqual(self.index.search("missing"), [])
+
+        self.index.add('a', "revenue")
+        self.assertEqual(self.index.search("A-100"), [])
+        self.assertTrue(self.index.remove('c'))
+        self.assertEqual(self.index.search("revenue")[0][0], 'a')
+        self.assertEqual(len(self.index), 2)
+
+    def test_compaction_drops_retired_documents(self):
+        self.index.add('a', "part A-100 bracket steel")
+        self.index.remove('c')
+        before = self.index.search("bracket steel")
+        self.assertFalse(self.index.maybe_compact(ratio=0.3, min_docs=10))
+        self.assertTrue(self.index.maybe_compact(ratio=0.3, min_docs=1))
+        self.index._compactor.join()
+        self.assertEqual(len(self.index._doc_ids), 2)
+        self.assertNotIn('quarterly', self.index._postings)
+        self.assertEqual(self.index.search("bracket steel"), before)
+        self.index.add('d', "steel bracket")
+        self.assertEqual(self.index.search("steel")[0][0], 'd')
+
+    def test_graph_builder_listener_indexes_chunks(self):
+        index = BM25Index()
+        builder = GraphBuilder()
+        builder.add_listener(index)
+        doc_id = builder.add_document({'content': {'text': "serial XJ-9 pump " * 50}, 'metadata': {'file_type': 'docx'}})
+        self.assertEqual(index.search("XJ-9")[0][0], f"{doc_id}_chunk_0")
+        self.assertNotIn(doc_id, index)
+        # A node within one chunk is indexed itself
+        small_id = builder.add_document({'content': "valve KL-2", 'metadata': {'file_type': 'txt'}})
+        self.assertEqual(index.search("KL-2")[0][0], small_id)
+        builder.clear_graph()
+        self.assertEqual(len(index), 0)
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        entry_bytes = 4 * 4 + ENTRY_OVERHEAD_BYTES
+        self.cache = EmbeddingCache('model-a', max_bytes=2 * entry_bytes)
+
+    def test_lru_eviction_and_counters(self):
+        self.cache.put("one", np.ones(4))
+        self.cache.put("two", np.ones(4) * 2)
+        self.assertIsNotNone(self.cache.get("one"))
+        self.cache.put("three", np.ones(4) * 3)
+        self.assertIsNone(self.cache.get("two"))
+        self.assertTrue(np.allclose(self.cache.get("  one\n"), np.ones(4)))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+
+    def test_keys_include_model_and_persist(self):
+        self.assertNotEqual(self.cache.key("text"), EmbeddingCache('model-b').key("text"))
+        self.assertNotEqual(EmbeddingCache('model-a', backend='torch').key("text"),
+                            EmbeddingCache('model-a', backend='onnx').key("text"))
+        self.cache.put("text", np.arange(4))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.npz')
+            self.assertTrue(self.cache.save(path))
+            self.assertTrue(np.allclose(EmbeddingCache('model-a', persist_path=path).get("text"), np.arange(4)))
+            self.assertIsNone(EmbeddingCache('model-b', persist_path=path).get("text"))
+            other_backend = 'onnx' if self.cache.backend != 'onnx' else 'torch'
+            self.assertEqual(EmbeddingCache('model-a', persist_path=path, backend=other_backend).stats()['entries'], 0)
+
+    def test_saves_are_throttled(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.npz')
+            cache = EmbeddingCache('model-a', persist_path=path)
+            self.assertFalse(cache.maybe_save(interval=0))  # Nothing to save yet
+            cache.put("text", np.arange(4))
+            self.assertFalse(cache.maybe_save(interval=3600))
+            self.assertTrue(cache.maybe_save(interval=0))
+            cache.put("more", np.ones(4))
+            self.assertTrue(cache.close())
+            self.assertFalse(cache.maybe_save(interval=0))
+            reloaded = EmbeddingCache('model-a', persist_path=path)
+            self.assertTrue(np.allclose(reloaded.get("more"), np.ones(4)))
+
+class FakeSentenceTransformer:
+    """Deterministic stand-in for SentenceTransformer that counts encoded texts."""
+
+    def __init__(self, *args, **kwargs):
+        self.encoded = []
+        self.batches = []
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        self.encoded.extend(batch)
+        self.batches.append(batch)
+        vectors = np.stack([
+            np.random.default_rng(zlib.crc32(text.encode())).normal(size=8).astype(np.float32)
+            for text in batch
+        ]) if batch else np.zeros((0, 8), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+class TestIncrementalVectorization(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('src.vector_db.embedding_backends.SentenceTransformer', FakeSentenceTransformer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        model_registry.clear()
+        self.addCleanup(model_registry.clear)
+        self.vectorizer = Vectorizer()
+        self.graph = {'nodes': {
+            'doc': {'type': 'document', 'content': 'alpha'},
+            'doc_table_0': {'type': 'table', 'content': [['a', 'b']]}
+        }, 'edges': []}
+
+    def test_unchanged_nodes_are_not_reembedded(self):
+        self.vectorizer.convert_to_vector(self.graph)
+        self.assertEqual(len(self.vectorizer.model.encoded), 2)
+        self.vectorizer.convert_to_vector(self.graph)
+        self.assertEqual(len(self.vectorizer.model.encoded), 2)
+
+        self.graph['nodes']['doc']['content'] = 'beta'
+        self.vectorizer.convert_to_vector(self.graph)
+        self.assertEqual(len(self.vectorizer.model.encoded), 3)
+
+    def test_removed_nodes_are_dropped(self):
+        self.vectorizer.convert_to_vector(self.graph)
+        del self.graph['nodes']['doc_table_0']
+        self.vectorizer.convert_to_vector(self.graph)
+        self.assertNotIn('doc_table_0', self.vectorizer.vectors)
+        self.assertNotIn('doc_table_0', self.vectorizer.metadata)
+
+    def test_repeated_texts_hit_the_cache(self):
+        self.vectorizer.texts_to_vectors(['same table', 'same table', 'other'])
+        self.assertEqual(sorted(self.vectorizer.model.encoded), ['other', 'same table'])
+        self.vectorizer.text_to_vector('same  table')
+        self.assertEqual(len(self.vectorizer.model.encoded), 2)
+        self.assertEqual(self.vectorizer.embedding_cache.stats()['hits'], 1)
+
+    def test_store_survives_restart_without_reembedding(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vectorizer = Vectorizer(store_path=tmp_dir)
+            vectorizer.convert_to_vector(self.graph)
+            self.assertTrue(vectorizer.flush())
+            model_registry.clear()
+            restarted = Vectorizer(store_path=tmp_dir)
+            restarted.convert_to_vector(self.graph)
+            self.assertEqual(restarted.model.encoded, [])
+            self.assertEqual(restarted.metadata['doc']['content'], 'alpha')
+
+    def test_background_compaction_after_deletes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vectorizer = Vectorizer(store_path=tmp_dir)
+            graph = {'nodes': {f"n{i}": {'type': 'chunk', 'content': f"text {i}"} for i in range(20)}}
+            vectorizer.convert_to_vector(graph)
+            self.assertEqual(vectorizer.remove_nodes([f"n{i}" for i in range(10)] + ['missing']), 10)
+            self.assertTrue(vectorizer.flush())
+            self.assertFalse(vectorizer.maybe_compact(ratio=0.6, min_rows=0))
+            self.assertTrue(vectorizer.maybe_compact(ratio=0.3, min_rows=0))
+            vectorizer._compactor.join()
+
+            self.assertEqual((vectorizer.vectors.row_count, vectorizer.vectors.tombstone_count), (10, 0))
+            results = Retriever(vectorizer).get_similar_nodes('type: chunk content: text 15', top_k=1)
+            self.assertEqual(results[0][0], 'n15')
+            model_registry.clear()
+            restarted = Vectorizer(store_path=tmp_dir)
+            self.assertEqual(sorted(restarted.vectors), sorted(f"n{i}" for i in range(10, 20)))
+            self.assertEqual(restarted.metadata['n12']['content'], 'text 12')
+
+    def test_chunked_parents_are_not_embedded(self):
+        self.graph['nodes']['doc']['chunked'] = True
+        self.graph['nodes']['doc_chunk_0'] = {'type': 'chunk', 'content': 'alpha', 'parent': 'doc'}
+        self.vectorizer.convert_to_vector(self.graph)
+        self.assertNotIn('doc', self.vectorizer.vectors)
+        self.assertIn('doc_chunk_0', self.vectorizer.vectors)
+
+    def test_retriever_filters_by_inherited_file_type(self):
+        self.graph['nodes']['doc'].update({'file_type': 'docx', 'document_id': 'doc'})
+        self.graph['nodes']['doc_table_0']['document_id'] = 'doc'
+        self.graph['nodes']['other'] = {'type': 'table', 'content': 'alpha', 'file_type': 'csv',
+                                        'document_id': 'other'}
+        self.vectorizer.convert_to_vector(self.graph)
+        retriever = Retriever(self.vectorizer, compression='none')
+        results = retriever.get_similar_nodes('alpha', top_k=5, filters={'file_type': ['docx'], 'type': ['table']})
+        self.assertEqual([node_id for node_id, _ in results], ['doc_table_0'])
+
+    def test_parent_file_type_is_read_without_materializing_the_document(self):
+        builder = GraphBuilder()
+        doc_id = builder.add_document({'content': {'text': "alpha beta gamma " * 400},
+                                       'metadata': {'file_type': 'pdf'}})
+        graph = builder.get_graph()
+        chunk_ids = [node_id for node_id in graph['nodes'] if node_id != doc_id]
+        self.assertGreater(len(chunk_ids), 1)
+        with patch.object(builder.graph, 'node_data', wraps=builder.graph.node_data) as node_data:
+            self.assertTrue(self.vectorizer.vectorize_nodes(graph, chunk_ids))
+        self.assertEqual(node_data.call_count, len(chunk_ids))
+        self.assertEqual(len(self.vectorizer.vectors.filter_rows({'file_type': ['pdf']})), len(chunk_ids))
+
+    def test_concurrent_uploads_and_queries(self):
+        retriever = Retriever(self.vectorizer, compression='none')
+        graph = {'nodes': {f"n{i}": {'type': 'chunk', 'content': f"text {i}"} for i in range(400)}}
+        done = threading.Event()
+        errors = []
+
+        def upload(ids):
+            try:
+                for start in range(0, len(ids), 10):
+                    self.assertTrue(self.vectorizer.vectorize_nodes(graph, ids[start:start + 10], batch_size=2))
+            except Exception as e:
+                errors.append(e)
+
+        def query():
+            try:
+                while not done.is_set():
+                    for node_id, _ in retriever.get_similar_nodes('text 1', top_k=3):
+                        self.assertIn(node_id, graph['nodes'])
+            except Exception as e:
+                errors.append(e)
+
+        ids = list(graph['nodes'])
+        readers = [threading.Thread(target=query) for _ in range(2)]
+        writers = [threading.Thread(target=upload, args=(ids[i::4],)) for i in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.vectorizer.vectors), 400)
+        vector = self.vectorizer.text_to_vector(self.vectorizer.node_to_text(graph['nodes']['n7']))
+        self.assertEqual(retriever.search_vector(vector, top_k=1)[0][0], 'n7')
+
+    def test_batch_queries_are_encoded_together(self):
+        self.vectorizer.convert_to_vector(self.graph)
+        self.vectorizer.model.batches.clear()
+        retriever = Retriever(self.vectorizer, compression='none')
+        results = list(retriever.get_similar_nodes_batch(['alpha', 'table', 'alpha'], top_k=1))
+        self.assertEqual(self.vectorizer.model.batches, [['alpha', 'table']])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1], retriever.get_similar_nodes('table', top_k=1))
+
+    def test_failed_batch_search_is_reported_in_the_stream(self):
+        retriever = Retriever(self.vectorizer, compression='none')
+        with patch.object(retriever, 'search_batch', side_effect=RuntimeError("index unavailable")):
+            with self.assertRaises(RuntimeError):
+                list(retriever.get_similar_nodes_batch(['alpha']))
+
+        # The API routes open their stores at import, so the endpoint runs in a scratch directory
+        script = (
+            "import numpy as np\n"
+            "from src.api import create_app, routes\n"
+            "def failing(query_vectors, top_k, filters):\n"
+            "    yield [('n0', 1.0)]\n"
+            "    raise RuntimeError('index unavailable')\n"
+            "routes.vectorizer.texts_to_vectors = lambda texts, batch_size=None: np.ones((len(texts), 4))\n"
+            "routes.retriever.search_batch = failing\n"
+            "client = create_app({'PRELOAD_MODELS': False}).test_client()\n"
+            "print(client.post('/api/query/batch', json={'queries': ['a', 'b']}).get_data(as_text=True))\n"
+            "print(client.post('/api/query/batch', json={'queries': ['a'], 'top_k': 'ten'}).status_code)\n"
+            "print(client.post('/api/query', json={'query': 'a', 'context_hops': 'two'}).status_code)\n"
+            "routes.graph_builder.add_node('x', {'type': 'chunk'})\n"
+            "print(client.get('/api/graph/nodes/x/neighbors?hops=0').status_code)\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result = subprocess.run([sys.executable, '-c', script], cwd=tmp_dir, capture_output=True, text=True,
+                                    env=dict(os.environ, PYTHONPATH=root, HF_HUB_OFFLINE='1'), timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+        self.assertEqual(lines, [{'index': 0, 'results': [{'node_id': 'n0', 'similarity': 1.0}]},
+                                 {'index': 1, 'error': 'index unavailable'}])
+        # Non-numeric parameters are rejected as bad requests
+        self.assertEqual(result.stdout.split()[-3:], ['400', '400', '400'])
+
+    def test_model_is_shared_and_loaded_lazily(self):
+        registry = ModelRegistry()
+        self.assertFalse(registry.is_loaded('m'))
+        self.assertIs(registry.get('m'), registry.get('m'))
+        self.assertTrue(registry.warm_up(['other']))
+        self.assertTrue(registry.is_loaded('other'))
+        self.assertIs(Vectorizer().model, self.vectorizer.model)
+
+    def test_parity_check_reports_cosine_agreement(self):
+        class NoisyModel(FakeSentenceTransformer):
+            def encode(self, texts, convert_to_numpy=True, **kwargs):
+                return super().encode(texts, convert_to_numpy, **kwargs) * 2.0 + 0.01
+
+        report = parity_check(self.vectorizer.model, NoisyModel())
+        self.assertGreater(report['min_cosine'], 0.99)
+        self.assertLess(report['min_cosine'], 1.0)
+        self.assertEqual(report['texts'], 8)
+        with self.assertRaises(ValueError):
+            load_model('m', backend='tpu')
+        with patch('src.vector_db.embedding_backends.sentence_transformers.__version__', '2.7.0'):
+            with self.assertRaisesRegex(ImportError, 'sentence-transformers>=3.2'):
+                load_model('m', backend='onnx')
+
+    def test_hybrid_and_shortlist_modes_use_lexical_matches(self):
+        self.graph['nodes']['part'] = {'type': 'table', 'content': 'bolt ZX-42'}
+        self.vectorizer.convert_to_vector(self.graph)
+        lexical_index = BM25Index()
+        for node_id, node_data in self.graph['nodes'].items():
+            lexical_index.node_added(node_id, node_data)
+        retriever = Retriever(self.vectorizer, compression='none', lexical_index=lexical_index)
+
+        hybrid = retriever.get_similar_nodes('ZX-42', top_k=3, mode='hybrid')
+        self.assertEqual(hybrid[0][0], 'part')
+        self.assertEqual(len(hybrid), 3)
+        self.assertEqual(retriever.get_similar_nodes('ZX-42', top_k=3, mode='shortlist')[0][0], 'part')
+        self.assertEqual(len(retriever.get_similar_nodes('ZX-42', top_k=3, mode='shortlist')), 1)
+        self.assertEqual(retriever.get_similar_nodes('ZX-42', top_k=3, mode='hybrid',
+                                                     filters={'type': 'document'}), [('doc', 1 / 61)])
+
+    def test_vectorize_nodes_only_touches_given_ids(self):
+        self.vectorizer.vectorize_nodes(self.graph, ['doc'])
+        self.assertEqual(list(self.vectorizer.vectors), ['doc'])
+
+    def test_batches_are_length_bucketed(self):
+        texts = ['x' * n for n in (9, 1, 5, 3, 7)]
+        vectors = self.vectorizer.texts_to_vectors(texts, batch_size=2)
+        self.assertEqual([len(batch) for batch in self.vectorizer.model.batches], [2, 2, 1])
+        self.assertEqual(self.vectorizer.model.batches[0], ['x', 'xxx'])
+        self.assertTrue(np.allclose(vectors[0], FakeSentenceTransformer().encode(texts[0])))
+        self.assertEqual(self.vectorizer.last_batch_stats['nodes'], 5)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file